@@ -10,7 +10,7 @@ from typing import Optional
 
 from loguru import logger
 
-from ..libs.metric import Metric
+from ..libs.metric import Metric, MetricBatch
 from ..libs.plugin import BasePlugin
 
 
@@ -19,30 +19,63 @@ class AggsPlugin(BasePlugin):
 
     module = 'aggs'
 
+    # 报警逻辑只在配置了 alarm 时工作, 未配置时为直通插件
+    # 不依赖 alarm 配置的插件需设为 False
+    passthrough_without_alarm = True
+
     async def run(self) -> None:
         """数据汇聚/报警"""
         logger.debug(f'{self.module}.{self.name}({self.alias}) is working')
         is_closed = False
         while not is_closed:
-            # 取队列数据
-            metric = await self.in_queue.get()
-            is_closed = metric.is_closed
-
-            # 分发前(报警前)数据处理
-            metric = await self.use_common_plugin(metric, 'befor')
-
-            # 数据分发(报警)
-            metric = await self.alarm(metric)
+            # 取队列数据(单个指标或批次)
+            item = await self.in_queue.get()
+            is_closed = item.is_closed
+            if item.is_stopped:
+                # 处理链已重建, 传递停止信号后退出
+                self.last_stage or await self.out_queue.put(item)
+                self.in_queue.task_done()
+                break
 
-            # 分发后(报警后)数据处理
-            metric = await self.use_common_plugin(metric, 'after')
+            # 数据汇聚/报警, 关闭信号直接传递
+            if not is_closed:
+                item = await self.alarm_batch(item) if isinstance(item, MetricBatch) else await self.handle(item)
 
             # 传递数据
-            self.out_queue.put_nowait(metric)
+            await self.out_queue.put(item)
             self.in_queue.task_done()
 
         logger.debug(f'{self.module}.{self.name}({self.alias}) is closed')
 
+    def is_passthrough(self) -> bool:
+        """未配置报警前后的公共插件, 且没有报警逻辑或未配置报警时为直通插件"""
+        if self.has_common_plugin('befor') or self.has_common_plugin('after'):
+            return False
+
+        cls = type(self)
+        if cls.handle is not AggsPlugin.handle or cls.alarm_batch is not AggsPlugin.alarm_batch:
+            return False
+
+        if cls.alarm is AggsPlugin.alarm:
+            return True
+
+        return self.passthrough_without_alarm and not self.get_plugin_conf_value('alarm')
+
+    async def handle(self, metric: Metric) -> Metric:
+        """单个指标数据汇聚/报警"""
+        # 分发前(报警前)数据处理
+        metric = await self.use_common_plugin(metric, 'befor')
+
+        # 数据分发(报警)
+        metric = await self.alarm(metric)
+
+        # 分发后(报警后)数据处理
+        return await self.use_common_plugin(metric, 'after')
+
+    async def alarm_batch(self, batch: MetricBatch) -> MetricBatch:
+        """批量数据汇聚/报警, 默认逐个处理"""
+        return MetricBatch([await self.handle(x) for x in batch])
+
     async def alarm(self, metric: Metric) -> Metric:
         """报警器"""
         return metric
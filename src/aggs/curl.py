@@ -9,7 +9,7 @@
 from typing import List, Tuple
 
 from . import AggsPlugin
-from ..libs.helper import get_dict_value, get_json_loads
+from ..libs.helper import get_dict_value, get_json_loads, get_round
 from ..libs.metric import Metric
 
 
@@ -100,8 +100,11 @@ class Curl(AggsPlugin):
 
     @staticmethod
     def chk_contains(metric: Metric, conf: str) -> Tuple[bool, str]:
-        """检查返回值是否包含指定字符串"""
-        if str(conf) in metric.get('response', ''):
+        """检查返回值是否包含指定字符串(优先使用读取响应时逐块检查的结果)"""
+        found = metric.get('response_contains')
+        if not isinstance(found, list):
+            found = metric.get('response', '')
+        if str(conf) in found:
             return True, ''
 
         return False, f'返回值不包含: {conf}'
@@ -146,3 +149,17 @@ class Curl(AggsPlugin):
                     return False, f'数据项: {k} != {v}'
 
         return True, ''
+
+    @staticmethod
+    def chk_timing(metric: Metric, conf: dict) -> Tuple[bool, str]:
+        """检查请求各阶段耗时(毫秒)是否超过阈值: queue, dns, connect, ttfb, transfer, total"""
+        if conf and isinstance(conf, dict):
+            for phase, limit in conf.items():
+                value = metric.get(f'time_{phase}', fix_type=False)
+                limit = get_round(limit)
+                if value is None or limit is None:
+                    continue
+                if value > limit:
+                    return False, f'请求耗时过长(ms): {phase} {value}>{limit}'
+
+        return True, ''
@@ -5,76 +5,261 @@
 
     :author: Fufu, 2021/6/7
 """
-from asyncio import Queue, create_task, sleep
-from typing import Callable, Optional
+import os
+import signal
+from asyncio import Event, TimeoutError, create_task, gather, get_running_loop, sleep, wait, wait_for
+from typing import Callable, Iterable, Optional
 
 from loguru import logger
 
 from .conf.settings import CONF
+from .libs.net import close_sessions
+from .libs.queue import QueueFanout, get_queue_pending, get_queue_stats, log_queue_stats, new_queue
+from .output import OutputPlugin, get_output_stats
 
 
 class Worker:
     """插件工作单元"""
 
+    # 工作中的插件工作单元
+    workers = {}
+
     def __init__(self, name: str) -> None:
         # 插件名称
         self.name = name
 
-        # 数据通道
-        self.q_input = Queue()
-        self.q_processor = Queue()
-        self.q_aggs = Queue()
+        # 数据采集插件实例
+        self.input_obj = None
+
+        # 数据通道, q_input 为处理链入口, 处理(processor)和汇聚(aggs)均为直通时与 q_aggs 相同
+        # q_aggs 将数据分发到共享的公共输出插件和插件本身的输出插件
+        self.q_input = None
+        self.q_aggs = QueueFanout()
+
+        # 当前处理链中实际工作的插件标识
+        self.chain_key = None
+
+        # 数据采集任务, 处理链和输出插件任务
+        self.input_task = None
+        self.tasks = set()
 
     async def run(self, cls_input: Callable) -> None:
         """启动插件"""
+        Worker.workers[self.name] = self
+
         # 数据收集
-        create_task(cls_input(CONF, None, self.q_input).run())
+        self.input_obj = cls_input(CONF, None, None)
+        self.input_obj.alias = self.name
 
-        # 数据处理
-        self.create_tasks('processor', self.q_input, self.q_processor)
+        # 数据发布
+        self.create_outputs()
 
-        # 汇聚/报警
-        self.create_tasks('aggs', self.q_processor, self.q_aggs)
+        # 数据处理 -> 汇聚/报警
+        self.build_chain()
 
-        # 数据发布
-        self.create_tasks('output', self.q_aggs, None)
+        self.input_task = create_task(self.input_obj.run())
 
-    def create_tasks(self, module: str, in_queue: Queue, out_queue: Optional[Queue]) -> None:
-        """启动插件"""
-        # 启动系统配置的公共插件, 比如多个公共输出插件
-        for cls_name in CONF.get_conf_value(f'main|common_{module}', []):
+    async def close(self, timeout: float) -> None:
+        """停止数据采集, 等待进行中的采集结束后发送关闭信号"""
+        if self.input_task is None or self.input_task.done():
+            return
+
+        self.input_task.cancel()
+        tasks = [x for x in self.input_obj.get_pending_tasks() if not x.done()]
+        tasks and await wait(tasks, timeout=max(timeout, 0))
+        self.input_obj.send_close_signal()
+
+    def start(self, cls_obj: OutputPlugin) -> None:
+        """启动处理链或输出插件任务"""
+        task = create_task(cls_obj.run())
+        task.add_done_callback(self.tasks.discard)
+        self.tasks.add(task)
+
+    def refresh(self) -> None:
+        """配置重新加载后, 按需重建处理链"""
+        if self.name not in CONF.plugins_working:
+            Worker.workers.pop(self.name, None)
+            return
+
+        self.build_chain()
+
+    def build_chain(self) -> None:
+        """
+        构建处理链: 数据处理(processor) -> 汇聚/报警(aggs)
+        直通(无任何处理)的插件不启动任务, 全部直通时采集数据直接写入 q_aggs
+        处理链变化时启动新链, 旧链处理完已有数据后退出
+        """
+        plugins = [x for m in ('processor', 'aggs') for x in self.new_plugins(m) if not x.is_passthrough()]
+        chain_key = tuple(f'{x.module}.{x.name}' for x in plugins)
+        if chain_key == self.chain_key:
+            return
+
+        q_head = self.q_aggs
+        if plugins:
+            q_head = new_queue(CONF, 'input', f'{self.name}.input')
+            in_queue = q_head
+            for i, cls_obj in enumerate(plugins):
+                is_last = i == len(plugins) - 1
+                out_queue = self.q_aggs if is_last \
+                    else new_queue(CONF, cls_obj.module, f'{self.name}.{cls_obj.module}.{cls_obj.name}')
+                cls_obj.in_queue, cls_obj.out_queue, cls_obj.last_stage = in_queue, out_queue, is_last
+                self.start(cls_obj)
+                in_queue = out_queue
+
+        # 切换采集数据入口, 通知旧链退出
+        q_old, self.q_input = self.q_input, q_head
+        self.input_obj.out_queue = q_head
+        if q_old is not None and q_old is not self.q_aggs:
+            q_old.put_nowait(self.input_obj.metric(None, tag='__STOP_SIGNAL__'))
+
+        self.chain_key = chain_key
+        logger.info('Plugin {} pipeline: {}', self.name, ' -> '.join(chain_key) or 'passthrough')
+
+    def create_outputs(self) -> None:
+        """数据发布: 共享的公共输出插件 + 插件本身的输出插件(非直通时)"""
+        for cls_name in CONF.get_conf_value('main|common_output', []):
+            hub = OutputHub.get(cls_name)
+            hub and self.q_aggs.queues.append(hub.in_queue)
+
+        cls_obj = self.new_plugins('output', with_common=False)[0]
+        if not cls_obj.is_passthrough():
+            cls_obj.in_queue = new_queue(CONF, 'output', f'{self.name}.output')
+            self.start(cls_obj)
+            self.q_aggs.queues.append(cls_obj.in_queue)
+
+    def new_plugins(self, module: str, *, with_common: bool = True) -> list:
+        """生成插件实例(系统配置的公共插件 + 插件本身), 未设置数据通道"""
+        plugins = []
+        # 系统配置的公共插件, 比如多个公共数据处理插件
+        for cls_name in CONF.get_conf_value(f'main|common_{module}', []) if with_common else []:
             cls = CONF.get_plugin_obj(module, cls_name)
-            if cls:
-                out_queue_next = Queue()
-                cls_obj = cls(CONF, in_queue, out_queue_next)
-                cls_obj.alias = self.name
-                create_task(cls_obj.run())
-                in_queue = out_queue_next
-
-        # 启动插件本身
-        cls = CONF.get_plugin_obj(module, self.name)
-        if cls:
-            cls_obj = cls(CONF, in_queue, out_queue)
-            cls_obj.alias = self.name
-            coro = cls_obj.run()
-        else:
-            # 克隆 default 插件
-            cls_obj = CONF.get_plugin_obj(module, 'default')(CONF, in_queue, out_queue)
+            cls and plugins.append(cls(CONF, None, None))
+
+        # 插件本身, 不存在时克隆 default 插件
+        cls = CONF.get_plugin_obj(module, self.name) or CONF.get_plugin_obj(module, 'default')
+        plugins.append(cls(CONF, None, None))
+
+        for cls_obj in plugins:
             cls_obj.alias = self.name
-            coro = cls_obj.run()
 
-        create_task(coro)
+        return plugins
+
+
+class OutputHub:
+    """共享的公共输出插件, 每个公共输出插件在进程内只有一个实例, 所有插件的数据汇入该实例"""
+
+    # 工作中的公共输出插件, 及其任务
+    hubs = {}
+    tasks = {}
+
+    @classmethod
+    def get(cls, name: str) -> Optional[OutputPlugin]:
+        """获取公共输出插件实例, 首次使用时启动"""
+        if name in cls.hubs:
+            return cls.hubs[name]
+
+        plugin_cls = CONF.get_plugin_obj('output', name)
+        if not plugin_cls:
+            logger.error(f'Output plugin {name} does not exist')
+            return None
+
+        cls_obj = plugin_cls(CONF, new_queue(CONF, 'output', f'hub.output.{name}'), None)
+        cls_obj.alias = 'hub'
+        cls_obj.shared = True
+        cls.tasks[name] = create_task(cls_obj.run())
+        cls.hubs[name] = cls_obj
+
+        return cls_obj
+
+    @classmethod
+    def close(cls) -> None:
+        """发送停止信号, 公共输出插件处理完已有数据后退出"""
+        for cls_obj in cls.hubs.values():
+            cls_obj.in_queue.put_nowait(cls_obj.metric(None, tag='__STOP_SIGNAL__'))
 
 
 async def main() -> None:
     """程序入口"""
     logger.info('PyAgent(v0.2.8.22081111) start working')
 
-    while True:
-        await CONF.update()
-        CONF.reload()
-        await start_plugins()
-        await sleep(CONF.reload_sec)
+    stopping = Event()
+    set_signal_handlers(stopping)
+    try:
+        while not stopping.is_set():
+            await CONF.update()
+            CONF.reload()
+            for worker in list(Worker.workers.values()):
+                worker.refresh()
+            await start_plugins()
+            try:
+                await wait_for(stopping.wait(), CONF.reload_sec)
+            except TimeoutError:
+                pass
+            log_queue_stats()
+
+        await shutdown()
+    finally:
+        await close_sessions()
+
+
+def set_signal_handlers(stopping: Event) -> None:
+    """收到退出信号(SIGTERM/SIGINT)时优雅退出, 再次收到时立即退出"""
+    loop = get_running_loop()
+
+    def on_signal() -> None:
+        if stopping.is_set():
+            logger.warning('PyAgent force exit')
+            os._exit(1)
+        logger.info('PyAgent is shutting down')
+        stopping.set()
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, on_signal)
+        except (NotImplementedError, RuntimeError):
+            # Windows
+            signal.signal(sig, lambda *_: loop.call_soon_threadsafe(on_signal))
+
+
+async def shutdown() -> None:
+    """
+    优雅退出
+    停止数据采集, 在限定时间内处理完各阶段数据, 输出插件最后一次提交(或写入磁盘缓存), 记录数据统计
+    """
+    loop = get_running_loop()
+    timeout = CONF.get_conf_value('main|shutdown_timeout', 10.0)
+    deadline = loop.time() + timeout
+
+    # 停止数据采集, 各插件处理链收到关闭信号后依次退出
+    workers = list(Worker.workers.values())
+    await gather(*(x.close(timeout) for x in workers))
+    await wait_tasks([t for x in workers for t in x.tasks], deadline - loop.time())
+
+    # 公共输出插件最后退出
+    OutputHub.close()
+    await wait_tasks(OutputHub.tasks.values(), deadline - loop.time())
+
+    # 各输出插件分别统计, 如: es(delivered: 100, spooled: 10, dropped: 0)
+    output_stats = ', '.join(
+        f'{name}({", ".join(f"{k}: {v}" for k, v in stats.items())})'
+        for name, stats in sorted(get_output_stats().items())
+    )
+    logger.info(
+        'PyAgent stopped, output: {}, queue dropped: {}, undelivered: {}',
+        output_stats or '-', sum(get_queue_stats().values()), get_queue_pending(),
+    )
+
+
+async def wait_tasks(tasks: Iterable, timeout: float) -> None:
+    """等待任务结束, 超时后取消"""
+    tasks = [x for x in tasks if not x.done()]
+    if not tasks:
+        return
+
+    _, pending = await wait(tasks, timeout=max(timeout, 0))
+    for task in pending:
+        task.cancel()
+    pending and await wait(pending, timeout=1)
 
 
 async def start_plugins():
@@ -0,0 +1,51 @@
+# -*- coding:utf-8 -*-
+"""
+    rate.py
+    ~~~~~~~~
+    计数器速率计算公共插件, 由计数器字段生成每秒速率字段
+
+    :author: Fufu, 2022/8/26
+"""
+from typing import Dict
+
+from . import Common
+from ..libs.delta import DeltaStore
+from ..libs.helper import get_dict_value, get_round
+from ..libs.metric import Metric
+
+# 各插件的计数器状态: {模块.插件名: 速率计算}
+DELTA_STORES: Dict[str, DeltaStore] = {}
+
+
+class Rate(Common):
+    """计数器速率计算"""
+
+    async def run(self) -> Metric:
+        """按配置的计数器字段生成速率字段, 首次出现或计数器重置时不生成"""
+        fields = get_dict_value(self.plugin_conf, 'fields', [])
+        if not fields or not isinstance(fields, list):
+            return self.metric
+
+        # 实体标识字段(如: nic, device), 多个字段时组合
+        entity_fields = get_dict_value(self.plugin_conf, 'entity', [], fix_type=False)
+        entity_fields = [entity_fields] if isinstance(entity_fields, str) else entity_fields
+        entity = '|'.join(str(self.metric.get(x, '', fix_type=False)) for x in entity_fields)
+        entity = f'{self.metric.name}|{entity}'
+
+        bits = self.plugin_conf.get('bits') or None
+        name_prefix = get_dict_value(self.plugin_conf, 'name_prefix', '')
+        name_suffix = get_dict_value(self.plugin_conf, 'name_suffix', '_rate')
+        scale = self.plugin_conf.get('scale', 1)
+
+        key = f'{self.module}.{self.name}'
+        store = DELTA_STORES.get(key)
+        if store is None:
+            store = DELTA_STORES[key] = DeltaStore()
+
+        # 以指标数据生成时间计算间隔, 不受队列等待时间影响
+        res = store.update(entity, self.metric.data, fields, self.metric.epoch, bits=bits)
+        if res:
+            rates, _ = res
+            self.metric.set(**{f'{name_prefix}{k}{name_suffix}': get_round(v * scale) for k, v in rates.items()})
+
+        return self.metric
@@ -10,6 +10,7 @@ import os.path
 import sys
 import time
 from hashlib import md5
+from types import MappingProxyType
 from typing import Any, Callable
 
 from envcrypto import get_environ
@@ -17,9 +18,11 @@ from loguru import logger
 from yaml import safe_dump, safe_load
 
 from .plugins import PLUGINS
+from .snapshot import ConfigSnapshot
 from ..env import COMMON_KEY
 from ..libs.helper import get_dict_value, get_hash, merge_dicts
-from ..libs.net import request
+from ..libs.net import request, set_http_options
+from ..libs.procfs import set_procfs
 
 
 class Config:
@@ -34,8 +37,8 @@ class Config:
     # 主配置
     main = {}
 
-    # 服务器信息
-    info = {}
+    # 服务器信息(只读, 指标数据共享)
+    info = MappingProxyType({})
 
     # 插件配置
     input = {}
@@ -54,6 +57,10 @@ class Config:
     # 模块
     modules = ['input', 'processor', 'aggs', 'output', 'common']
 
+    # 配置快照, 缓存的配置项
+    snapshot = None
+    snapshot_sections = ['main', 'info'] + modules
+
     # 日志配置签名
     _logger_conf_md5 = ''
 
@@ -133,13 +140,20 @@ class Config:
 
         # 扩展合并主配置: host.yaml 优先于 main.yaml
         self.main = merge_dicts(main, host)
+        self.snapshot = None
 
         self.debug = self.get_conf_value('main|debug', False)
-        self.info = self.get_conf_value('main|info', {})
+        self.info = MappingProxyType(self.get_conf_value('main|info', {}))
         self.delay_sec = min(self.get_conf_value('main|delay_sec', 1), 30)
         self.reload_sec = max(self.get_conf_value('main|reload_sec', 300), 10)
         self.plugins_open = get_dict_value(self.main, 'open', set())
 
+        # 共享 HTTP 会话池配置
+        set_http_options(**self.get_conf_value('main|http', {}))
+
+        # Linux /proc 快速采集开关
+        set_procfs(self.get_conf_value('main|procfs', True))
+
         for module in self.modules:
             conf = {'default': {}}
             # 主配置中的公共插件
@@ -158,9 +172,16 @@ class Config:
                 plugin_conf and conf[name].update(plugin_conf)
             setattr(self, module, conf)
 
+        # 生成配置快照, 整体替换旧快照
+        self.snapshot = self.new_snapshot()
+
         # 初始化日志
         self.init_logger()
 
+    def new_snapshot(self) -> ConfigSnapshot:
+        """生成配置快照"""
+        return ConfigSnapshot({x: getattr(self, x, None) for x in self.snapshot_sections}, self.get_same_type)
+
     def get_conf_value(
             self,
             key_path: str,
@@ -177,6 +198,17 @@ class Config:
         :param fix_type: 是否强制修正为 default 相同类型
         :return:
         """
+        snapshot = self.snapshot
+        if snapshot is not None:
+            section = key_path.partition('|')[0]
+            dt = getattr(self, section, None)
+            if snapshot.has_section(section, dt):
+                return snapshot.get(key_path, default, fix_type)
+            if section in snapshot.sections:
+                # 配置项已被替换, 重新生成快照
+                self.snapshot = self.new_snapshot()
+                return self.snapshot.get(key_path, default, fix_type)
+
         keys = key_path.split('|')
         if not hasattr(self, keys[0]):
             return default
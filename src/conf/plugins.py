@@ -6,7 +6,7 @@
 
     :author: Fufu, 2021/6/13
 """
-from ..common import converter, discard
+from ..common import converter, discard, rate
 from ..input import (demo as input_demo, cpu as input_cpu, mem as input_mem, disk as input_disk,
                      network as input_network, curl as input_curl, telnet as input_telnet,
                      process as input_process, ping as input_ping)
@@ -20,6 +20,7 @@ PLUGINS = {
     'common': {
         'converter': converter.Converter,
         'discard': discard.Discard,
+        'rate': rate.Rate,
     },
     'input': {
         'demo': input_demo.Demo,
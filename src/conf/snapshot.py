@@ -0,0 +1,81 @@
+# -*- coding:utf-8 -*-
+"""
+    snapshot.py
+    ~~~~~~~~
+    配置快照, 配置重新加载时生成, 缓存按路径获取的配置项值
+
+    :author: Fufu, 2022/8/17
+"""
+from typing import Any, Callable, Dict
+
+# 配置项不存在
+MISSING = object()
+
+
+class ConfigSnapshot:
+    """
+    配置快照
+
+    配置项按路径(如: aggs|ping|alarm|loss)只解析一次, 结果缓存在快照中,
+    配置重新加载时整体替换快照, 旧快照的缓存随之失效.
+    注: 配置字典只应在重新加载时整体替换, 原地修改配置内容不会使缓存失效.
+    """
+
+    def __init__(self, sections: Dict[str, Any], get_same_type: Callable[[Any, Any], Any]) -> None:
+        # 配置项: main, input, processor...
+        self.sections = sections
+        # 类型转换函数
+        self.get_same_type = get_same_type
+        # 路径: 原始值
+        self.values = {}
+        # (路径, 默认值类型, 默认值, 是否转换类型): 结果值
+        self.typed = {}
+
+    def has_section(self, section: str, dt: Any) -> bool:
+        """快照中是否包含该配置项, 且与当前配置为同一对象"""
+        return section in self.sections and self.sections[section] is dt
+
+    def get(self, key_path: str, default: Any = None, fix_type: bool = True) -> Any:
+        """按路径获取配置项值, 与 Config.get_conf_value 结果一致"""
+        try:
+            key = (key_path, default.__class__, default, fix_type)
+            return self.typed[key]
+        except KeyError:
+            value = self.typed[key] = self.get_value(key_path, default, fix_type)
+            return value
+        except TypeError:
+            # 默认值不可哈希(如: 字典, 列表), 类型转换结果为新对象, 不缓存
+            return self.get_value(key_path, default, fix_type)
+
+    def get_value(self, key_path: str, default: Any = None, fix_type: bool = True) -> Any:
+        """按路径获取配置项值(不缓存类型转换结果)"""
+        value = self.get_raw(key_path)
+        if value is MISSING:
+            return default
+
+        if fix_type and '|' in key_path:
+            return self.get_same_type(default, value)
+
+        return value
+
+    def get_raw(self, key_path: str) -> Any:
+        """按路径获取原始配置项值, 不存在时返回 MISSING"""
+        try:
+            return self.values[key_path]
+        except KeyError:
+            pass
+
+        keys = key_path.split('|')
+        value = self.sections.get(keys[0], MISSING)
+        for key in keys[1:]:
+            try:
+                value = value.get(key, None)
+                if value is None:
+                    value = MISSING
+                    break
+            except Exception:
+                value = MISSING
+                break
+
+        self.values[key_path] = value
+        return value
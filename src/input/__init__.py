@@ -7,11 +7,14 @@
     :author: Fufu, 2021/6/7
 """
 import time
-from asyncio import as_completed, create_task, sleep
+from asyncio import Event, Task, create_task, gather
+from typing import Any, List, Optional, Set
 
 from loguru import logger
 
+from ..libs.metric import Metric, MetricBatch
 from ..libs.plugin import BasePlugin
+from ..libs.scheduler import SCHEDULER
 
 
 class InputPlugin(BasePlugin):
@@ -19,15 +22,43 @@ class InputPlugin(BasePlugin):
 
     module = 'input'
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # 未结束的采集任务(允许堆叠的插件可能有多个, 不允许堆叠时仅一个持有锁)
+        self.gather_tasks: Set[Task] = set()
+
     async def run(self):
-        """定时执行收集"""
+        """定时执行收集, 由调度器按周期触发"""
         logger.debug(f'{self.module}.{self.name} is working')
-        while not self.is_closed():
-            create_task(self.gather())
-            await sleep(self.get_interval(60))
+        closed = Event()
+        job = SCHEDULER.add(
+            f'{self.module}.{self.name}',
+            lambda: self.tick(closed),
+            lambda: self.get_interval(60),
+            **self.get_schedule_conf(),
+        )
+        try:
+            await closed.wait()
+        finally:
+            job.cancel()
 
         logger.debug(f'{self.module}.{self.name} is closed')
 
+    def tick(self, closed: Event) -> bool:
+        """周期触发采集, 插件关闭时返回 False, 不再调度"""
+        if self.is_closed():
+            closed.set()
+            return False
+
+        task = create_task(self.gather())
+        task.add_done_callback(self.gather_tasks.discard)
+        self.gather_tasks.add(task)
+        return True
+
+    def get_pending_tasks(self) -> list:
+        """进行中的采集任务, 插件关闭时等待其结束"""
+        return list(self.gather_tasks)
+
     async def gather(self) -> None:
         """获取数据(默认需要上一次采集结束后才启动新的采集, 不允许堆叠)"""
         async with self.only_one() as ok:
@@ -46,19 +77,26 @@ class InputPlugin(BasePlugin):
         pass
 
     async def run_tasks(self, tasks: list) -> None:
-        """接收请求结果并推送"""
-        for task in as_completed(tasks):
-            metric = await task
-            self.out_queue.put_nowait(metric)
+        """接收请求结果并批量推送"""
+        await self.put_metrics(list(await gather(*tasks)))
+
+    async def put_metrics(self, metrics: Optional[List[Metric]]) -> None:
+        """推送一次采集的指标数据, 多个指标数据作为一个批次传递"""
+        if not metrics:
+            return
+
+        await self.out_queue.put(metrics[0] if len(metrics) == 1 else MetricBatch(metrics))
 
     def is_closed(self):
         """检查当前插件是否该关闭 (名称不在开启的插件中)"""
         if self.name in self.conf.plugins_open:
             return False
 
-        # 发送插件关闭信号 (特殊 Metric)
+        self.send_close_signal()
+        return True
+
+    def send_close_signal(self) -> None:
+        """发送插件关闭信号 (特殊 Metric), 处理链各插件处理完已有数据后依次退出"""
         self.out_queue.put_nowait(self.metric(None, tag='__CLOSE_SIGNAL__'))
         self.conf.plugins_working.discard(self.name)
         logger.info(f'Plugin {self.name} is closed')
-
-        return True
@@ -6,15 +6,19 @@
 
     :author: Fufu, 2021/6/15
 """
-from asyncio import ensure_future, sleep
-from typing import Any
+from asyncio import AbstractEventLoop, Semaphore, Task, create_task, get_running_loop, sleep
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientSession
 from loguru import logger
 
 from . import InputPlugin
 from ..libs.helper import get_dict_value, get_int, get_json_loads
 from ..libs.metric import Metric
+from ..libs.net import BodyReader, RequestTimer, new_fresh_session, new_session, new_trace_config
+from ..libs.scheduler import Job, SCHEDULER
 
 
 class Curl(InputPlugin):
@@ -23,22 +27,86 @@ class Curl(InputPlugin):
     # 模块名称
     name = 'curl'
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # 插件生命周期内复用的会话: (事件循环, 会话配置, 会话)
+        self.session: Optional[Tuple[AbstractEventLoop, dict, ClientSession]] = None
+        # 使用中的会话: 使用数
+        self.session_users: Dict[ClientSession, int] = {}
+        # 各目标的周期任务: {标记: (目标配置, 周期, 调度配置, 周期任务)}
+        self.target_jobs: Dict[str, Tuple[dict, int, dict, Job]] = {}
+        # 各目标进行中的请求任务: {标记: 任务}
+        self.target_tasks: Dict[str, Task] = {}
+        # 插件并发请求数限制: (上限, 信号量)
+        self.inflight: Optional[Tuple[int, Semaphore]] = None
+        # 请求各阶段耗时跟踪
+        self.trace_configs = [new_trace_config()]
+
+    async def run(self):
+        """插件关闭时取消各目标的周期任务, 关闭会话"""
+        try:
+            await super().run()
+        finally:
+            for *_, job in self.target_jobs.values():
+                job.cancel()
+            self.target_jobs.clear()
+            session, self.session = self.session, None
+            session and not self.session_users.get(session[2]) and await session[2].close()
+
     async def gather(self) -> None:
-        """获取数据(允许堆叠)"""
+        """同步目标配置(允许堆叠)"""
         await self.perf_gather()
 
     async def run_gather(self) -> None:
-        """按配置发起请求任务"""
-        # 并发限制(到同主机)
-        limit = self.get_plugin_conf_value('worker_limit', 30)
-        # 创建请求任务
-        async with ClientSession(connector=TCPConnector(ssl=False, limit_per_host=limit)) as sess:
-            tasks = []
-            for tag, conf in self.get_plugin_conf_value('target', {}).items():
-                url = get_dict_value(conf, 'url')
-                if not url:
-                    continue
+        """
+        按配置同步各目标的周期任务, 每个周期执行一次(配置热加载后生效)
+
+        每个目标按自身周期(interval, 默认为插件周期)单独调度, 默认按目标标记固定偏移分散在整个周期内,
+        避免所有目标同时请求.
+        """
+        targets = {}
+        for tag, conf in self.get_plugin_conf_value('target', {}).items():
+            if conf and isinstance(conf, dict) and get_dict_value(conf, 'url'):
+                targets[tag] = conf
+
+        for tag in set(self.target_jobs) - set(targets):
+            self.target_jobs.pop(tag)[-1].cancel()
+
+        schedule = self.get_schedule_conf()
+        spread = self.get_plugin_conf_value('spread', True)
+        for tag, conf in targets.items():
+            interval = get_int(conf.get('interval'), 0)
+            interval = interval if interval > 0 else self.get_interval(60)
+            schedule_conf = {'align': schedule['align'], 'splay': interval if spread else schedule['splay']}
+            item = self.target_jobs.get(tag)
+            if item and item[:3] == (conf, interval, schedule_conf):
+                continue
+
+            item and item[-1].cancel()
+            job = SCHEDULER.add(
+                f'{self.module}.{self.name}.{tag}',
+                partial(self.tick_target, tag),
+                interval,
+                immediate=False,
+                **schedule_conf,
+            )
+            self.target_jobs[tag] = (conf, interval, schedule_conf, job)
+
+    def tick_target(self, tag: str) -> None:
+        """周期触发目标请求, 上次请求未结束时跳过"""
+        task = self.target_tasks.get(tag)
+        if task and not task.done():
+            logger.warning(f'{self.module}.{self.name} target {tag} is still running, skipped')
+            return
 
+        task = create_task(self.gather_target(tag, self.target_jobs[tag][0]))
+        task.add_done_callback(lambda x: self.target_tasks.get(tag) is x and self.target_tasks.pop(tag))
+        self.target_tasks[tag] = task
+
+    async def gather_target(self, tag: str, conf: dict) -> None:
+        """请求单个目标, 插件内同时进行的请求数不超过 max_inflight"""
+        async with self.get_inflight():
+            async with self.use_session() as sess:
                 # 是否重试, 及重试状态码
                 retry = self.get_retry_conf(conf)
 
@@ -46,14 +114,90 @@ class Curl(InputPlugin):
                 as_merge_resp = get_dict_value(conf, 'merge_response', False)
 
                 # 请求参数集
-                req = self.get_request_conf(conf, url)
+                req = self.get_request_conf(conf, conf['url'])
+
+                # 响应内容读取配置
+                body = self.get_body_conf(tag, conf, as_merge_resp)
+
+                # 是否每次使用新连接(测量含 DNS 解析, TCP/TLS 握手的冷连接耗时)
+                if get_dict_value(conf, 'fresh_connection', False):
+                    metric = await self.get_fresh_request(tag, req, as_merge_resp, retry, body)
+                else:
+                    metric = await self.get_request(sess, tag, req, as_merge_resp, retry, body)
+
+        await self.put_metrics([metric])
+
+    def get_inflight(self) -> Semaphore:
+        """插件并发请求数限制, 配置变化时使用新的信号量"""
+        limit = max(self.get_plugin_conf_value('max_inflight', 100), 1)
+        if not self.inflight or self.inflight[0] != limit:
+            self.inflight = (limit, Semaphore(limit))
 
-                tasks.append(ensure_future(self.get_request(sess, tag, req, as_merge_resp, retry)))
+        return self.inflight[1]
 
-            # 等待任务执行
-            tasks and await self.run_tasks(tasks)
+    def get_pending_tasks(self) -> list:
+        """进行中的采集任务(含各目标的请求)"""
+        return super().get_pending_tasks() + list(self.target_tasks.values())
 
-    async def get_request(self, sess: Any, tag: str, req: dict, as_merge_resp: bool, retry: dict) -> Metric:
+    def get_session_options(self) -> dict:
+        """会话配置: 连接总数, 同主机并发数, DNS 缓存秒数, 空闲连接保持秒数, 请求总超时秒数"""
+        return {
+            'limit': self.get_plugin_conf_value('limit', 100),
+            'limit_per_host': self.get_plugin_conf_value('worker_limit', 30),
+            'ttl_dns_cache': self.get_plugin_conf_value('ttl_dns_cache', 300),
+            'keepalive_timeout': self.get_plugin_conf_value('keepalive_timeout', 30),
+            'timeout': self.get_plugin_conf_value('timeout', 300),
+        }
+
+    @asynccontextmanager
+    async def use_session(self) -> AsyncIterator[ClientSession]:
+        """
+        使用插件会话, 配置变化时新建会话
+
+        旧会话在最后一个使用者结束后关闭, 不影响进行中(堆叠)的采集.
+        """
+        loop = get_running_loop()
+        options = self.get_session_options()
+        item = self.session
+        if not item or item[0] is not loop or item[1] != options or item[2].closed:
+            self.session = (loop, options, new_session(trace_configs=self.trace_configs, **options))
+            logger.debug(f'{self.module}.{self.name} http session created: {options}')
+            if item and item[0] is loop and not self.session_users.get(item[2]):
+                await item[2].close()
+
+        sess = self.session[2]
+        self.session_users[sess] = self.session_users.get(sess, 0) + 1
+        try:
+            yield sess
+        finally:
+            users = self.session_users.pop(sess) - 1
+            if users > 0:
+                self.session_users[sess] = users
+            elif not self.session or self.session[2] is not sess:
+                await sess.close()
+
+    async def get_fresh_request(
+            self,
+            tag: str,
+            req: dict,
+            as_merge_resp: bool,
+            retry: dict,
+            body: Optional[dict] = None,
+    ) -> Metric:
+        """使用新连接获取请求结果(不复用连接和 DNS 缓存)"""
+        timeout = self.get_plugin_conf_value('timeout', 300)
+        async with new_fresh_session(timeout, trace_configs=self.trace_configs) as sess:
+            return await self.get_request(sess, tag, req, as_merge_resp, retry, body)
+
+    async def get_request(
+            self,
+            sess: Any,
+            tag: str,
+            req: dict,
+            as_merge_resp: bool,
+            retry: dict,
+            body: Optional[dict] = None,
+    ) -> Metric:
         """获取请求结果"""
         exception = ''
         url = req['url']
@@ -69,17 +213,22 @@ class Curl(InputPlugin):
         })
 
         for i in range(-1, retry['attempts']):
+            # 各阶段耗时(最后一次请求)
+            timer = RequestTimer()
             try:
-                async with sess.request(**req) as resp:
-                    metric = await self.get_response(resp, metric, as_merge_resp)
+                async with sess.request(**req, trace_request_ctx=timer) as resp:
+                    metric = await self.get_response(resp, metric, as_merge_resp, timer, body)
                     status = resp.status
                     if self.conf.debug and not resp.ok:
                         logger.warning(f'curl {status}, req_info={resp.request_info}, metric={metric.as_text}')
                     if status not in retry['statuses']:
                         break
             except Exception as e:
+                timer.finish()
                 exception = str(e)
                 self.conf.debug and logger.error(f'curl exception, req={req} err={e}')
+            finally:
+                metric.set(**timer.as_dict())
             # 1 秒后重试
             await sleep(1)
             i >= 0 and logger.warning(f'retry({i + 1}) curl {status}, url={url}')
@@ -129,16 +278,68 @@ class Curl(InputPlugin):
 
         return req
 
+    def get_body_conf(self, tag: str, conf: dict, as_merge_resp: bool) -> dict:
+        """
+        响应内容读取配置
+
+        - max_bytes: 最多读取的字节数, 超过时截断
+        - keep_bytes: 保留到指标数据的字节数, 合并响应或需要检查 JSON 时保留全部(不超过 max_bytes)
+        - needles: 报警配置中需要检查的包含字符串, 读取时逐块检查
+        """
+        max_bytes = get_int(conf.get('max_body_bytes'), 0)
+        if max_bytes <= 0:
+            max_bytes = self.get_plugin_conf_value('max_body_bytes', 1048576)
+
+        keep_bytes = get_int(conf.get('body_prefix_bytes'), -1)
+        if keep_bytes < 0:
+            keep_bytes = self.get_plugin_conf_value('body_prefix_bytes', 4096)
+
+        # 报警规则: 公共配置, 标记对应的配置
+        alarm_conf = self.conf.get_conf_value('aggs|curl|alarm', {})
+        rules = [get_dict_value(alarm_conf, 'all', {}), get_dict_value(alarm_conf, 'target', {}).get(tag)]
+        rules = [x for x in rules if x and isinstance(x, dict)]
+        if as_merge_resp or any('json' in x for x in rules):
+            keep_bytes = max_bytes
+
+        return {
+            'max_bytes': max_bytes,
+            'keep_bytes': keep_bytes,
+            'needles': [str(x['contains']) for x in rules if x.get('contains') is not None],
+        }
+
     @staticmethod
-    async def get_response(resp: Any, metric: Metric, as_merge_resp: bool) -> Metric:
-        """整理响应到指标数据"""
-        res = await resp.text()
+    async def get_response(
+            resp: Any,
+            metric: Metric,
+            as_merge_resp: bool,
+            timer: Optional[RequestTimer] = None,
+            body: Optional[dict] = None,
+    ) -> Metric:
+        """流式读取响应(超过上限时截断), 整理到指标数据"""
+        body = body or {}
+        reader = BodyReader(
+            body.get('max_bytes', 1048576),
+            body.get('keep_bytes', 4096),
+            body.get('needles', []),
+            resp.charset or 'utf-8',
+        )
+        timer and timer.mark('transfer')
+        await reader.read(resp.content)
+        if timer:
+            timer.done('transfer')
+            timer.finish()
+        res = reader.text
         data = {
             'response': res,
+            'response_size': reader.size,
+            'response_truncated': reader.truncated,
+            'response_hash': reader.hexdigest,
             'status': resp.status,
             'host': resp.request_info.headers.get('Host', metric.get('host')),
             'headers': dict(resp.headers),
         }
-        as_merge_resp and data.update(get_json_loads(res))
+        if reader.pending or reader.found:
+            data['response_contains'] = reader.found
+        as_merge_resp and not reader.truncated and data.update(get_json_loads(res))
         metric.set(**data)
         return metric
@@ -6,12 +6,19 @@
 
     :author: kerrygao, Fufu, 2021/6/10
 """
-import psutil
+import time
+from typing import Dict, List, Optional
 
 from . import InputPlugin
-from ..libs.helper import try_logger
+from ..libs.delta import DeltaStore
+from ..libs.diskusage import DISK_USAGE_PROBE
+from ..libs.helper import get_round, try_logger
 from ..libs.humanize import human_bytes
-from ..libs.psutil import to_dict
+from ..libs.metric import Metric
+from ..libs.sysinfo import SYSTEM_SNAPSHOT
+
+# 计算速率的磁盘 IO 计数器字段(busy_time 仅 Linux)
+DISK_IO_FIELDS = ('read_count', 'write_count', 'read_bytes', 'write_bytes', 'read_time', 'write_time', 'busy_time')
 
 
 class Disk(InputPlugin):
@@ -20,22 +27,83 @@ class Disk(InputPlugin):
     # 模块名称
     name = 'disk'
 
+    # 磁盘 IO 计数器速率计算(按设备)
+    io_deltas = None
+
     async def run_gather(self):
-        """磁盘占用情况"""
-        await self.to_thread(self.get_disk_info)
+        """磁盘占用情况, 磁盘 IO"""
+        io = self.get_plugin_conf_value('io', True)
+        names = ('disk', 'disk_io') if io else ('disk',)
+        snapshot = await SYSTEM_SNAPSHOT.get(*names, max_age=self.get_interval(60) / 2)
+        disks = snapshot['disk'] or []
+        usage = await DISK_USAGE_PROBE.probe(
+            [x['mountpoint'] for x in disks],
+            timeout=self.get_plugin_conf_value('usage_timeout', 5.0),
+            failures=self.get_plugin_conf_value('usage_failures', 3),
+            quarantine=self.get_plugin_conf_value('usage_quarantine', 600.0),
+        )
+        metrics = self.get_disk_info(disks, usage) or []
+        io and metrics.extend(self.get_disk_io_info(snapshot['disk_io']) or [])
+        await self.put_metrics(metrics)
 
     @try_logger()
-    def get_disk_info(self):
-        """磁盘占用情况"""
-        for disk in psutil.disk_partitions():
-            if not str(disk.opts).startswith('rw,'):
+    def get_disk_info(self, disks: list, usage: Dict[str, dict]) -> List[Metric]:
+        """磁盘占用情况(系统状态快照), 使用情况探测超时的分区不输出"""
+        metrics = []
+        for disk in disks:
+            disk_usage = usage.get(disk['mountpoint'])
+            if not disk_usage:
                 continue
-            data = to_dict(disk)
-            disk_usage = psutil.disk_usage(disk.mountpoint)
-            data.update(to_dict(disk_usage))
+            data = dict(disk)
+            data.update(disk_usage)
             data.update({
-                'human_total': human_bytes(disk_usage.total),
-                'human_used': human_bytes(disk_usage.used),
-                'human_free': human_bytes(disk_usage.free),
+                'human_total': human_bytes(disk_usage['total']),
+                'human_used': human_bytes(disk_usage['used']),
+                'human_free': human_bytes(disk_usage['free']),
             })
-            self.out_queue.put_nowait(self.metric(data))
+            metrics.append(self.metric(data))
+
+        return metrics
+
+    @try_logger()
+    def get_disk_io_info(self, disk_io: Dict[str, dict], now: Optional[float] = None) -> List[Metric]:
+        """磁盘 IO(距上次采集): IOPS, 吞吐量(字节/秒), 平均等待时间(毫秒), 繁忙比例"""
+        if not disk_io:
+            return []
+
+        if self.io_deltas is None:
+            self.io_deltas = DeltaStore()
+
+        now = time.monotonic() if now is None else now
+        ignore_prefix = tuple(self.get_plugin_conf_value('io_ignore_prefix', ['loop', 'ram']))
+        metrics = []
+        for device, io in disk_io.items():
+            if ignore_prefix and device.startswith(ignore_prefix):
+                continue
+
+            res = self.io_deltas.update(device, io, DISK_IO_FIELDS, now, bits=64)
+            if not res:
+                # 新设备或计数器重置
+                continue
+
+            # 每秒次数, 字节数, 耗时(毫秒), 平均等待时间 = 耗时 / 次数
+            rates, interval = res
+            reads, writes = rates['read_count'], rates['write_count']
+            metrics.append(self.metric({
+                'type': 'io',
+                'device': device,
+                'interval': get_round(interval),
+                'read_iops': get_round(reads),
+                'write_iops': get_round(writes),
+                'read_bps': get_round(rates['read_bytes']),
+                'write_bps': get_round(rates['write_bytes']),
+                'human_read_bps': f'{human_bytes(rates["read_bytes"])}/s',
+                'human_write_bps': f'{human_bytes(rates["write_bytes"])}/s',
+                'read_await': get_round(rates['read_time'] / reads) if reads else 0,
+                'write_await': get_round(rates['write_time'] / writes) if writes else 0,
+                'await': get_round((rates['read_time'] + rates['write_time']) / (reads + writes))
+                if reads + writes else 0,
+                'util': min(get_round(rates['busy_time'] / 10), 100) if 'busy_time' in rates else 0,
+            }))
+
+        return metrics
@@ -6,12 +6,13 @@
 
     :author: kerrygao, Fufu, 2021/6/10
 """
-import psutil
+from typing import List
 
 from . import InputPlugin
 from ..libs.helper import get_fn_fields, try_logger
 from ..libs.humanize import human_bytes
-from ..libs.psutil import to_dict
+from ..libs.metric import Metric
+from ..libs.sysinfo import SYSTEM_SNAPSHOT
 
 
 class Mem(InputPlugin):
@@ -22,11 +23,14 @@ class Mem(InputPlugin):
 
     async def run_gather(self):
         """获取数据"""
-        await self.to_thread(self.get_mem_info)
+        snapshot = await SYSTEM_SNAPSHOT.get('mem', max_age=self.get_interval(60) / 2)
+        await self.put_metrics(self.get_mem_info(snapshot['mem']))
 
     @try_logger()
-    def get_mem_info(self):
-        """内存占用情况"""
-        info = to_dict(psutil.virtual_memory())
-        info = get_fn_fields(info, human_bytes, name_prefix='human_', ban_keys=['percent'])
-        self.out_queue.put_nowait(self.metric(info))
+    def get_mem_info(self, mem: dict) -> List[Metric]:
+        """内存占用情况(系统状态快照)"""
+        if not mem:
+            return []
+
+        info = get_fn_fields(mem, human_bytes, name_prefix='human_', ban_keys=['percent'])
+        return [self.metric(info)]
@@ -6,15 +6,33 @@
 
     :author: Fufu, 2021/11/8 代码重构, 支持网卡前缀配置和多 IP
 """
+import socket
+import struct
 import time
+from typing import Dict, Iterable, List
 
 import psutil
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from . import InputPlugin
+from ..libs.delta import DeltaStore
 from ..libs.helper import get_round, get_comma, get_int, try_logger
 from ..libs.humanize import human_bps
+from ..libs.metric import Metric
+from ..libs.procfs import LINUX, PROCFS
 from ..libs.psutil import to_dict
 
+# 计算速率的流量计数器字段
+NET_RATE_FIELDS = ('bytes_recv', 'bytes_sent', 'packets_recv', 'packets_sent')
+
+# 读取网卡标志的 ioctl 请求号, 网卡运行中标志(同 psutil isup)
+SIOCGIFFLAGS = 0x8913
+IFF_RUNNING = 0x40
+
 
 class Network(InputPlugin):
     """网络收集插件"""
@@ -22,61 +40,107 @@ class Network(InputPlugin):
     # 模块名称
     name = 'network'
 
-    # 存储上一时间的网卡数据
-    last_data = {}
+    # 网卡流量计数器速率计算(按网卡)
+    deltas = None
+
+    # 网卡状态缓存(isup, duplex, speed, mtu): {网卡: 状态}, 缓存时的网卡集合, 缓存时间
+    nic_meta = {}
+    nic_meta_set = frozenset()
+    nic_meta_time = 0.0
+
+    # 网卡地址缓存(mac, ipv4, ipv6): {网卡: 地址}, 缓存时间
+    nic_addrs = {}
+    nic_addrs_time = 0.0
+
+    # 网卡过滤索引: (配置的网卡列表, 配置的前缀元组, 缓存时的网卡集合, 待采集的网卡列表)
+    nic_index = None
 
     async def run_gather(self):
         """获取数据"""
-        await self.to_thread(self.get_network_info)
+        await self.put_metrics(await self.to_thread(self.get_network_info))
 
     @try_logger()
-    def get_network_info(self):
+    def get_network_info(self) -> List[Metric]:
         """获取网络信息"""
         # 获取网口的流量
-        net_io_counters = psutil.net_io_counters(pernic=True)
-        if not self.last_data:
-            self.last_data = {nic: to_dict(data) for nic, data in net_io_counters.items()}
-            self.last_data['last_time'] = time.time()
-            return
+        net_io_counters = self.get_io_counters()
+        now = time.monotonic()
 
         # 获取待采集的网卡列表
         nic_list = self.get_nic_list(net_io_counters.keys())
 
-        # 时间间隔
-        now = time.time()
-        interval = now - self.last_data['last_time']
-        self.last_data['last_time'] = time.time()
-        if interval < 0:
-            return
+        # 获取网卡的状态和地址(缓存), 运行状态每次获取
+        nic_meta = self.get_nic_meta(net_io_counters.keys(), nic_list)
 
-        # 获取网卡的信息
-        net_if_addrs = psutil.net_if_addrs()
-        # 获取网络接口的状态
-        net_if_stats = psutil.net_if_stats()
+        if self.deltas is None:
+            self.deltas = DeltaStore()
 
+        metrics = []
         for nic in nic_list:
-            now_nic_data = to_dict(net_io_counters[nic])
-            last_nic_data = self.last_data.get(nic, {})
-            self.last_data[nic] = now_nic_data
-            if not last_nic_data:
-                # 新网卡
+            now_nic_data = net_io_counters[nic]
+            res = self.deltas.update(nic, now_nic_data, NET_RATE_FIELDS, now, bits=64)
+            if not res:
+                # 新网卡或计数器重置
                 continue
-            self.gen_metric(interval, nic, now_nic_data, last_nic_data, net_if_addrs, net_if_stats)
-
-    def get_nic_list(self, all_nic: list) -> set:
-        """获取待采集的网卡列表"""
-        nic_list = set()
-
-        # 配置中指定的要采集的网卡
-        conf_nic_list = self.get_plugin_conf_value('network_card', [])
-        if conf_nic_list:
-            nic_list = set(conf_nic_list).intersection(set(all_nic))
-
-        # 配置中指定的要采集的网卡前缀
-        nic_prefix_list = self.get_plugin_conf_value('network_card_prefix', [])
-        for prefix in nic_prefix_list:
-            nic_list.update([x for x in all_nic if str(x).startswith(prefix)])
-
+            rates, interval = res
+            metrics.append(self.gen_metric(interval, nic, now_nic_data, rates, nic_meta.get(nic, {})))
+
+        return metrics
+
+    @staticmethod
+    def get_io_counters() -> Dict[str, dict]:
+        """网口流量计数, Linux 优先读取 /proc/net/dev"""
+        return PROCFS.read_net_dev() or {nic: to_dict(data) for nic, data in psutil.net_io_counters(pernic=True).items()}
+
+    def get_nic_meta(self, all_nic: Iterable[str], nic_list: List[str]) -> Dict[str, dict]:
+        """
+        待采集网卡的元数据(状态, MAC, IP 等)
+
+        状态和地址缓存, 网卡增减, 待采集网卡缺少元数据或超过刷新周期时重新获取,
+        地址可单独配置更短的刷新周期(浮动 IP 漂移时 vip 报警及时发现).
+        Linux 每次逐个读取待采集网卡的运行状态(isup), 网卡断开时及时发现.
+
+        :param all_nic: 当前所有网卡
+        :param nic_list: 待采集的网卡
+        :return:
+        """
+        nic_set = frozenset(all_nic)
+        now = time.monotonic()
+        meta_refresh = self.get_plugin_conf_value('meta_refresh', 300)
+        addr_refresh = self.get_plugin_conf_value('addr_refresh', meta_refresh)
+        changed = nic_set != self.nic_meta_set or not all(x in self.nic_meta for x in nic_list)
+        if changed or now - self.nic_meta_time >= meta_refresh:
+            self.nic_meta = get_nic_stats()
+            self.nic_meta_set = nic_set
+            self.nic_meta_time = now
+        if changed or now - self.nic_addrs_time >= addr_refresh:
+            self.nic_addrs = get_nic_addrs()
+            self.nic_addrs_time = now
+
+        isup = get_nic_isup(nic_list)
+        nic_meta = {}
+        for nic in nic_list:
+            meta = nic_meta[nic] = {**self.nic_meta.get(nic, {}), **self.nic_addrs.get(nic, {})}
+            if nic in isup:
+                meta['isup'] = isup[nic]
+
+        return nic_meta
+
+    def get_nic_list(self, all_nic: Iterable[str]) -> List[str]:
+        """获取待采集的网卡列表, 网卡集合和配置不变时复用上次的结果"""
+        conf_nic_list = tuple(self.get_plugin_conf_value('network_card', []))
+        nic_prefix_list = tuple(str(x) for x in self.get_plugin_conf_value('network_card_prefix', []) if x)
+        nic_set = frozenset(all_nic)
+        index = self.nic_index
+        if index and index[0] == conf_nic_list and index[1] == nic_prefix_list and index[2] == nic_set:
+            return index[3]
+
+        nic_list = [
+            x for x in sorted(nic_set)
+            # 配置中指定的要采集的网卡, 网卡前缀
+            if x in conf_nic_list or (nic_prefix_list and x.startswith(nic_prefix_list))
+        ]
+        self.nic_index = (conf_nic_list, nic_prefix_list, nic_set, nic_list)
         return nic_list
 
     def gen_metric(
@@ -84,29 +148,20 @@ class Network(InputPlugin):
             interval,
             nic: str,
             now_nic_data: dict,
-            last_nic_data: dict,
-            net_if_addrs: dict,
-            net_if_stats: dict
-    ) -> None:
+            rates: dict,
+            nic_meta: dict,
+    ) -> Metric:
         """生成指标数据"""
         metric = {
             'nic': nic,
             'interval': get_round(interval),
         }
-        metric.update(to_dict(net_if_stats[nic]))
-        for snic in net_if_addrs[nic]:
-            if snic.family.name in ('AF_LINK', 'AF_PACKET'):
-                metric['mac'] = snic.address
-            elif snic.family.name == 'AF_INET':
-                metric['ipv4'] = f'{metric["ipv4"]},{snic.address}' if 'ipv4' in metric else snic.address
-            elif snic.family.name == 'AF_INET6':
-                metric['ipv6'] = f'{metric["ipv6"]},{snic.address}' if 'ipv6' in metric else snic.address
-
+        metric.update(nic_meta)
         metric.update(now_nic_data)
-        metric['bps_in'] = get_round((now_nic_data['bytes_recv'] - last_nic_data['bytes_recv']) * 8 / interval)
-        metric['bps_out'] = get_round((now_nic_data['bytes_sent'] - last_nic_data['bytes_sent']) * 8 / interval)
-        metric['pps_in'] = get_int((now_nic_data['packets_recv'] - last_nic_data['packets_recv']) / interval)
-        metric['pps_out'] = get_int((now_nic_data['packets_sent'] - last_nic_data['packets_sent']) / interval)
+        metric['bps_in'] = get_round(rates['bytes_recv'] * 8)
+        metric['bps_out'] = get_round(rates['bytes_sent'] * 8)
+        metric['pps_in'] = get_int(rates['packets_recv'])
+        metric['pps_out'] = get_int(rates['packets_sent'])
 
         metric['kbps_in'] = get_round(metric['bps_in'] / 1000)
         metric['kbps_out'] = get_round(metric['bps_out'] / 1000)
@@ -115,4 +170,46 @@ class Network(InputPlugin):
         metric['comma_pps_in'] = get_comma(metric['pps_in'])
         metric['comma_pps_out'] = get_comma(metric['pps_out'])
 
-        self.out_queue.put_nowait(self.metric(metric))
+        return self.metric(metric)
+
+
+def get_nic_stats() -> Dict[str, dict]:
+    """获取所有网卡的状态: {网卡: {isup, duplex, speed, mtu}}"""
+    return {nic: to_dict(stats) for nic, stats in psutil.net_if_stats().items()}
+
+
+def get_nic_addrs() -> Dict[str, dict]:
+    """获取所有网卡的地址: {网卡: {mac, ipv4, ipv6}}"""
+    nic_addrs = {}
+    for nic, addrs in psutil.net_if_addrs().items():
+        meta = nic_addrs.setdefault(nic, {})
+        ipv4 = []
+        ipv6 = []
+        for snic in addrs:
+            if snic.family.name in ('AF_LINK', 'AF_PACKET'):
+                meta['mac'] = snic.address
+            elif snic.family.name == 'AF_INET':
+                ipv4.append(snic.address)
+            elif snic.family.name == 'AF_INET6':
+                ipv6.append(snic.address)
+        ipv4 and meta.update(ipv4=','.join(ipv4))
+        ipv6 and meta.update(ipv6=','.join(ipv6))
+
+    return nic_addrs
+
+
+def get_nic_isup(nic_list: Iterable[str]) -> Dict[str, bool]:
+    """指定网卡是否运行中(同 psutil isup), Linux 逐个网卡读取标志, 其他系统或读取失败的网卡不在结果中"""
+    isup = {}
+    if not LINUX or fcntl is None:
+        return isup
+
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for nic in nic_list:
+            try:
+                ifreq = fcntl.ioctl(s.fileno(), SIOCGIFFLAGS, struct.pack('256s', nic.encode('utf-8')[:15]))
+            except OSError:
+                continue
+            isup[nic] = bool(struct.unpack('H', ifreq[16:18])[0] & IFF_RUNNING)
+
+    return isup
@@ -7,10 +7,14 @@
     :author: kerrygao, Fufu, 2021/6/21
 """
 from asyncio import ensure_future
+from typing import Any, List, Optional
+
+from loguru import logger
 
 from . import InputPlugin
 from ..libs.helper import get_dict_value
 from ..libs.metric import Metric
+from ..libs.multiping import MultiPing
 from ..libs.net import pyping
 
 
@@ -20,6 +24,18 @@ class Ping(InputPlugin):
     # 模块名称
     name = 'ping'
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # 多目标 PING(共用 ICMP 套接字), 不可用时(如: 无 ICMP 套接字权限)为 None, 逐个目标 PING
+        self.multiping: Optional[MultiPing] = MultiPing()
+
+    async def run(self):
+        """插件关闭时关闭 ICMP 套接字"""
+        try:
+            await super().run()
+        finally:
+            self.multiping and self.multiping.close()
+
     async def gather(self) -> None:
         """获取数据(允许堆叠)"""
         await self.perf_gather()
@@ -34,13 +50,34 @@ class Ping(InputPlugin):
         # 每次 PING 时间间隔 (秒)
         interval_ping = self.get_plugin_conf_value('interval_ping', 0.1)
 
-        tasks = []
+        targets = {}
         for tag, conf in self.get_plugin_conf_value('target', {}).items():
-            address = get_dict_value(conf, 'address', '').strip()
-            tasks.append(ensure_future(self.run_ping(address, tag, count, timeout, interval_ping)))
+            targets[tag] = get_dict_value(conf, 'address', '').strip()
+
+        if not targets:
+            return
+
+        if self.multiping and self.get_plugin_conf_value('multiping', True):
+            results = await self.run_multiping(list(targets.values()), count, timeout, interval_ping)
+            if results:
+                items = zip(targets.items(), results)
+                await self.put_metrics([self.metric({**x, 'tag': tag, 'address': address}) for (tag, address), x in items])
+                return
+
+        tasks = [ensure_future(self.run_ping(v, k, count, timeout, interval_ping)) for k, v in targets.items()]
 
         # 等待任务执行
-        tasks and await self.run_tasks(tasks)
+        await self.run_tasks(tasks)
+
+    async def run_multiping(self, addresses: List[str], count: int, timeout: float, interval: float) -> List[dict]:
+        """多目标 PING, 不可用时停用, 返回空列表"""
+        try:
+            return await self.multiping.ping(addresses, count, timeout, interval)
+        except Exception as e:
+            logger.warning(f'multiping unavailable, fallback to ping each target: {e}')
+            self.multiping.close()
+            self.multiping = None
+            return []
 
     async def run_ping(
             self,
@@ -6,9 +6,13 @@
 
     :author: Fufu, 2012/12/18
 """
+from typing import List
+
 from . import InputPlugin
 from ..libs.helper import try_logger
-from ..libs.psutil import get_process_info
+from ..libs.metric import Metric
+from ..libs.psutil import select_process_info
+from ..libs.sysinfo import SYSTEM_SNAPSHOT
 
 
 class Process(InputPlugin):
@@ -18,15 +22,18 @@ class Process(InputPlugin):
     name = 'process'
 
     async def run_gather(self):
-        await self.to_thread(self.get_process_info)
+        snapshot = await SYSTEM_SNAPSHOT.get('process', max_age=self.get_interval(60) / 2)
+        await self.put_metrics(self.get_process_info(snapshot['process']))
 
     @try_logger()
-    def get_process_info(self):
-        """采集进程概况"""
-        pinfo_list = get_process_info(
+    def get_process_info(self, process: list) -> List[Metric]:
+        """采集进程概况(系统状态快照)"""
+        if not process:
+            return []
+
+        pinfo_list = select_process_info(
+            process,
             target=self.get_plugin_conf_value('target'),
             orderby=['cpu_percent', 'memory_percent'],
         )
-        pinfo_list and self.out_queue.put_nowait(self.metric({
-            "pinfo_list": pinfo_list,
-        }))
+        return [self.metric({"pinfo_list": pinfo_list})] if pinfo_list else []
@@ -7,12 +7,13 @@
     :author: Fufu, 2021/6/16
 """
 from asyncio import ensure_future
-from typing import Union
+from socket import AF_INET, AF_INET6, AF_UNSPEC
+from typing import Any, Optional, Tuple, Union
 
 from . import InputPlugin
 from ..libs.helper import get_dict_value
 from ..libs.metric import Metric
-from ..libs.net import chk_port
+from ..libs.net import PortProber, get_host_port
 
 
 class Telnet(InputPlugin):
@@ -21,6 +22,11 @@ class Telnet(InputPlugin):
     # 模块名称
     name = 'telnet'
 
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        # 端口检测器(并发数限制, 域名解析缓存), 配置变化时重建: (配置, 检测器)
+        self.prober: Optional[Tuple[tuple, PortProber]] = None
+
     async def gather(self) -> None:
         """获取数据(允许堆叠)"""
         await self.perf_gather()
@@ -28,12 +34,15 @@ class Telnet(InputPlugin):
     async def run_gather(self) -> None:
         """获取数据"""
         tasks = []
+        default_timeout = self.get_plugin_conf_value('timeout', 5)
+        default_dual_stack = self.get_plugin_conf_value('dual_stack', False)
         for tag, conf in self.get_plugin_conf_value('target', {}).items():
             address = get_dict_value(conf, 'address', '').strip()
             if address:
                 as_ipv6 = get_dict_value(conf, 'ipv6', False)
-                timeout = get_dict_value(conf, 'timeout', 5)
-                tasks.append(ensure_future(self.run_telnet(tag, address, as_ipv6, timeout)))
+                timeout = get_dict_value(conf, 'timeout', default_timeout)
+                dual_stack = get_dict_value(conf, 'dual_stack', default_dual_stack, as_true=False)
+                tasks.append(ensure_future(self.run_telnet(tag, address, as_ipv6, timeout, dual_stack)))
 
         # 等待任务执行
         tasks and await self.run_tasks(tasks)
@@ -44,9 +53,12 @@ class Telnet(InputPlugin):
             address: Union[str, tuple, list],
             as_ipv6: bool = False,
             timeout: int = 5,
+            dual_stack: bool = False,
     ) -> Metric:
         """执行检测并发送结果"""
-        yes, errcode = await self.to_thread(chk_port, address, None, as_ipv6, timeout)
+        host, port = get_host_port(address)
+        family = AF_INET6 if as_ipv6 else AF_UNSPEC if dual_stack else AF_INET
+        yes, errcode, time_connect = await self.get_prober().probe(host, port, family=family, timeout=timeout)
         metric = self.metric({
             'tag': tag,
             'address': address,
@@ -54,5 +66,20 @@ class Telnet(InputPlugin):
             'timeout': timeout,
             'yes': yes,
             'errcode': errcode,
+            'time_connect': time_connect,
         })
         return metric
+
+    def get_prober(self) -> PortProber:
+        """端口检测器, 配置变化时重建"""
+        options = (
+            self.get_plugin_conf_value('max_inflight', 1000),
+            self.get_plugin_conf_value('ttl_dns_cache', 60),
+            self.get_plugin_conf_value('happy_eyeballs_delay', 0.25),
+        )
+        if not self.prober or self.prober[0] != options:
+            limit, ttl_dns_cache, happy_eyeballs_delay = options
+            prober = PortProber(limit, ttl_dns_cache=ttl_dns_cache, happy_eyeballs_delay=happy_eyeballs_delay)
+            self.prober = (options, prober)
+
+        return self.prober[1]
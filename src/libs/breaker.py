@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+"""
+    breaker.py
+    ~~~~~~~~
+    熔断器, 连续失败后暂停请求, 冷却后仅放行一个探测请求
+
+    :author: Fufu, 2022/8/22
+"""
+import time
+
+# 熔断器状态: 关闭(正常), 打开(熔断), 半开(探测中)
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    - closed: 正常放行, 连续失败次数达到阈值时打开
+    - open: 拒绝请求, 冷却时间后转为半开
+    - half_open: 仅放行一个探测请求, 成功则关闭, 失败则重新打开;
+      探测请求超过冷却时间仍未记录结果时(调用方异常未记录), 放行新的探测请求
+    """
+
+    def __init__(self, failures: int = 5, timeout: float = 30) -> None:
+        # 连续失败次数阈值, 冷却时间(秒)
+        self.max_failures = max(failures, 1)
+        self.timeout = timeout
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_at = 0.0
+
+    def allow(self) -> bool:
+        """是否放行请求, 冷却时间后放行的第一个请求为探测请求"""
+        if self.state == STATE_CLOSED:
+            return True
+
+        now = time.monotonic()
+        if (
+                self.state == STATE_OPEN and now - self.opened_at >= self.timeout
+                or self.state == STATE_HALF_OPEN and now - self.probe_at >= self.timeout
+        ):
+            self.state = STATE_HALF_OPEN
+            self.probe_at = now
+            return True
+
+        return False
+
+    def record(self, ok: bool) -> None:
+        """记录请求结果"""
+        if ok:
+            self.state = STATE_CLOSED
+            self.failures = 0
+            return
+
+        self.failures += 1
+        if self.state == STATE_HALF_OPEN or self.failures >= self.max_failures:
+            self.state = STATE_OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def is_closed(self) -> bool:
+        return self.state == STATE_CLOSED
@@ -0,0 +1,168 @@
+# -*- coding:utf-8 -*-
+"""
+    delta.py
+    ~~~~~~~~
+    计数器差值/速率计算, 支持计数器回绕和重置检测
+
+    :author: Fufu, 2022/8/26
+"""
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# 计数器最大值: 位数: 上限
+COUNTER_LIMITS = {32: 1 << 32, 64: 1 << 64}
+
+
+class DeltaStore:
+    """
+    计数器差值/速率计算
+
+    每个 (实体, 字段) 对应一个槽位, 上次的值和时间分别存放在两个 array('d') 中,
+    实体为区分同类数据的标识, 如: 网卡名, 磁盘设备名.
+
+    - 首次出现的 (实体, 字段) 仅记录, 无结果
+    - 当前值小于上次值时视为重置(本次无结果), 指定了计数器位数时,
+      按回绕处理后差值不超过计数器范围的一半时视为回绕
+    - 计数器位数未指定时不做回绕检测: 64 位计数器重置后的值很小, 按 32 位回绕处理会得到虚假的高速率
+    - 超过 max_age 秒未更新的槽位被回收(实体消失, 如: 容器网卡)
+
+    时间默认为单调时间, 也可传入其他时间(如指标数据生成时间), 同一实例中应保持一致.
+    值以双精度浮点数保存, 2^53 以内的计数器差值精确.
+    """
+
+    def __init__(self, *, max_age: float = 3600) -> None:
+        self.max_age = max_age
+        # (实体, 字段): 槽位
+        self.slots: Dict[Tuple[str, str], int] = {}
+        # 槽位: 上次的值, 上次的时间
+        self.values = array('d')
+        self.times = array('d')
+        # 回收的槽位
+        self.free: List[int] = []
+        self.expired_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def delta(
+            self,
+            entity: str,
+            field: str,
+            value: float,
+            now: Optional[float] = None,
+            *,
+            bits: Optional[int] = None,
+    ) -> Optional[Tuple[float, float]]:
+        """
+        记录当前值, 返回距上次的差值和时间间隔
+
+        :param entity: 实体标识
+        :param field: 字段名
+        :param value: 计数器当前值
+        :param now: 当前时间, 默认为单调时间
+        :param bits: 计数器位数(32, 64), 默认不检测回绕
+        :return: (差值, 时间间隔秒数), 首次出现, 计数器重置或时间未前进时为 None
+        """
+        now = time.monotonic() if now is None else now
+        key = (entity, field)
+        slot = self.slots.get(key)
+        if slot is None:
+            self.slots[key] = self.new_slot(value, now)
+            return None
+
+        last_value = self.values[slot]
+        interval = now - self.times[slot]
+        self.values[slot] = value
+        self.times[slot] = now
+        if interval <= 0:
+            return None
+
+        diff = value - last_value
+        if diff < 0:
+            diff = get_wrapped_delta(last_value, value, bits)
+            if diff is None:
+                return None
+
+        return diff, interval
+
+    def rate(
+            self,
+            entity: str,
+            field: str,
+            value: float,
+            now: Optional[float] = None,
+            *,
+            bits: Optional[int] = None,
+    ) -> Optional[float]:
+        """记录当前值, 返回距上次的每秒速率"""
+        res = self.delta(entity, field, value, now, bits=bits)
+        return res[0] / res[1] if res else None
+
+    def update(
+            self,
+            entity: str,
+            data: dict,
+            fields: Iterable[str],
+            now: Optional[float] = None,
+            *,
+            bits: Optional[int] = None,
+    ) -> Optional[Tuple[Dict[str, float], float]]:
+        """
+        记录实体的多个计数器字段, 返回各字段的每秒速率和时间间隔
+
+        :param entity: 实体标识
+        :param data: 数据
+        :param fields: 计数器字段, 数据中不存在或非数值的字段忽略
+        :param now: 当前时间, 默认为单调时间
+        :param bits: 计数器位数(32, 64), 默认不检测回绕
+        :return: ({字段: 速率}, 时间间隔), 任一字段无结果(首次出现, 重置)时为 None
+        """
+        now = time.monotonic() if now is None else now
+        rates = {}
+        interval = 0.0
+        ok = True
+        for field in fields:
+            value = data.get(field)
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            res = self.delta(entity, field, value, now, bits=bits)
+            if res is None:
+                ok = False
+                continue
+            rates[field] = res[0] / res[1]
+            interval = res[1]
+
+        now - self.expired_at > self.max_age and self.expire(now)
+        return (rates, interval) if ok and rates else None
+
+    def new_slot(self, value: float, now: float) -> int:
+        if self.free:
+            slot = self.free.pop()
+            self.values[slot] = value
+            self.times[slot] = now
+            return slot
+
+        self.values.append(value)
+        self.times.append(now)
+        return len(self.values) - 1
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """回收超过 max_age 秒未更新的槽位, 返回回收数量"""
+        now = time.monotonic() if now is None else now
+        self.expired_at = now
+        expired = [k for k, v in self.slots.items() if now - self.times[v] > self.max_age]
+        for key in expired:
+            self.free.append(self.slots.pop(key))
+
+        return len(expired)
+
+
+def get_wrapped_delta(last_value: float, value: float, bits: Optional[int] = None) -> Optional[float]:
+    """计数器回绕后的差值, 未指定位数或不像回绕(差值超过计数器范围的一半)时视为重置, 返回 None"""
+    limit = COUNTER_LIMITS.get(bits)
+    if not limit or last_value >= limit:
+        return None
+
+    diff = value + limit - last_value
+    return diff if diff <= limit / 2 else None
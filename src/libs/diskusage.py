@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+"""
+    diskusage.py
+    ~~~~~~~~
+    分区使用情况并发探测, 单个挂载点超时不阻塞其他分区, 连续超时的挂载点暂停探测(隔离)
+
+    :author: Fufu, 2022/8/26
+"""
+import threading
+import time
+from asyncio import AbstractEventLoop, Future, get_running_loop, wait
+from typing import Any, Callable, Dict, Iterable, Optional
+
+import psutil
+from loguru import logger
+
+from .psutil import to_dict
+
+
+class MountState:
+    """挂载点探测状态"""
+
+    __slots__ = ('future', 'failures', 'quarantined_until')
+
+    def __init__(self) -> None:
+        # 最近一次探测任务, 连续超时次数, 隔离截止时间
+        self.future: Optional[Future] = None
+        self.failures = 0
+        self.quarantined_until = 0.0
+
+
+class DiskUsageProbe:
+    """
+    分区使用情况探测
+
+    每次探测在独立的线程中执行 disk_usage, 不经过共享线程池排队, 挂起的挂载点不影响其他挂载点的探测,
+    整体等待不超过超时时间. 超时的探测线程无法中止(如: NFS 服务端无响应), 该挂载点在上次探测返回前不再提交新的探测,
+    即每个挂载点最多占用一个线程, 连续超时达到次数后隔离一段时间.
+    """
+
+    def __init__(self) -> None:
+        # 挂载点: 探测状态
+        self.mounts: Dict[str, MountState] = {}
+
+    async def probe(
+            self,
+            mountpoints: Iterable[str],
+            *,
+            timeout: float = 5.0,
+            failures: int = 3,
+            quarantine: float = 600,
+    ) -> Dict[str, dict]:
+        """
+        并发获取分区使用情况
+
+        :param mountpoints: 挂载点列表
+        :param timeout: 超时时间(秒), 所有挂载点共用
+        :param failures: 连续超时次数达到该值时隔离挂载点
+        :param quarantine: 隔离时间(秒)
+        :return: {挂载点: 使用情况}, 超时, 隔离中, 出错的挂载点不在结果中
+        """
+        loop = get_running_loop()
+        now = time.monotonic()
+        futures = {}
+        for mountpoint in mountpoints:
+            state = self.mounts.setdefault(mountpoint, MountState())
+            if state.quarantined_until > now:
+                continue
+            if state.future and not state.future.done():
+                # 上次探测仍未返回
+                self.fail(mountpoint, state, failures, quarantine)
+                continue
+
+            state.future = run_in_thread(loop, psutil.disk_usage, mountpoint)
+            futures[mountpoint] = state.future
+
+        if futures:
+            await wait(futures.values(), timeout=timeout)
+
+        result = {}
+        for mountpoint, future in futures.items():
+            state = self.mounts[mountpoint]
+            if not future.done():
+                self.fail(mountpoint, state, failures, quarantine)
+                continue
+
+            state.failures = 0
+            if future.exception():
+                logger.error(f'disk usage {mountpoint} error: {future.exception()}')
+                continue
+            result[mountpoint] = to_dict(future.result())
+
+        return result
+
+    @staticmethod
+    def fail(mountpoint: str, state: MountState, failures: int, quarantine: float) -> None:
+        """记录超时, 连续超时达到次数时隔离"""
+        state.failures += 1
+        if state.failures < failures:
+            logger.warning(f'disk usage {mountpoint} timeout, failures: {state.failures}')
+            return
+
+        # 不重置超时次数, 隔离结束后再次超时(或仍未返回)时立即重新隔离
+        state.quarantined_until = time.monotonic() + quarantine
+        logger.error(f'disk usage {mountpoint} keeps hanging, quarantined for {quarantine}s')
+
+    def get_quarantined(self) -> list:
+        """隔离中的挂载点"""
+        now = time.monotonic()
+        return [k for k, v in self.mounts.items() if v.quarantined_until > now]
+
+
+def run_in_thread(loop: AbstractEventLoop, func: Callable, *args: Any) -> Future:
+    """
+    在新的守护线程中执行函数, 结果通过事件循环设置到 Future
+
+    守护线程在函数挂起时不阻塞进程退出(线程池的工作线程会在退出时被等待).
+    """
+    future = loop.create_future()
+    future.add_done_callback(retrieve_exception)
+
+    def set_future(result: Any, exc: Optional[Exception]) -> None:
+        if future.done():
+            return
+        if exc is None:
+            future.set_result(result)
+        else:
+            future.set_exception(exc)
+
+    def run() -> None:
+        result, exc = None, None
+        try:
+            result = func(*args)
+        except Exception as e:
+            exc = e
+        try:
+            loop.call_soon_threadsafe(set_future, result, exc)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    threading.Thread(target=run, name=getattr(func, '__name__', 'probe'), daemon=True).start()
+    return future
+
+
+def retrieve_exception(future: Future) -> None:
+    """超时后才结束的探测任务, 读取异常避免未处理异常告警"""
+    future.cancelled() or future.exception()
+
+
+# 进程内共享的分区使用情况探测器
+DISK_USAGE_PROBE = DiskUsageProbe()
@@ -0,0 +1,178 @@
+# -*- coding:utf-8 -*-
+"""
+    encoder.py
+    ~~~~~~~~
+    JSON 编码器, 优先使用 orjson / ujson (若已安装), 否则使用标准库 json
+
+    :author: Fufu, 2022/8/19
+"""
+import json
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+# 可用的编码器
+BACKENDS = [x for x, m in (('orjson', orjson), ('ujson', ujson)) if m] + ['json']
+
+# 指标数据的基础数据项, 同 metric.BASE_KEYS
+BASE_KEYS = ('name', 'time', 'timestamp')
+
+# 基础数据项和服务器标识信息编码缓存的最大数量
+MAX_CACHED_PARTS = 256
+
+
+def _default(obj: Any) -> Any:
+    """orjson 不支持的类型, 按标准库 json 的方式转换"""
+    if isinstance(obj, (tuple, set, frozenset)):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f'Object of type {obj.__class__.__name__} is not JSON serializable')
+
+
+class Encoder:
+    """JSON 编码器"""
+
+    def __init__(self, backend: str = '') -> None:
+        # 编码器名称, 未指定或不可用时自动选择
+        self.backend = backend if backend in BACKENDS else BACKENDS[0]
+        # 已编码的基础数据项: {(name, timestamp): b'{"name":..,"time":..,"timestamp":..'}
+        self.heads: Dict[Tuple[str, int], bytes] = {}
+        # 已编码的服务器标识信息(只读, 多个指标数据共享): {id: (信息, b',"k":v,..' 或与基础数据项重复时为 None)}
+        self.infos: Dict[int, Tuple[Any, Optional[bytes]]] = {}
+
+    def dumpb(self, obj: Any) -> bytes:
+        """编码为 UTF-8 字节串"""
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        if self.backend == 'ujson':
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj: Any) -> str:
+        """编码为字符串"""
+        if self.backend == 'orjson':
+            return self.dumpb(obj).decode('utf-8')
+        if self.backend == 'ujson':
+            return ujson.dumps(obj, ensure_ascii=False)
+        return json.dumps(obj, ensure_ascii=False)
+
+    def loads(self, s: Any) -> Any:
+        """解码 JSON 字符串或字节串"""
+        if self.backend == 'orjson':
+            return orjson.loads(s)
+        if self.backend == 'ujson':
+            return ujson.loads(s)
+        return json.loads(s)
+
+    def encode_bulk(
+            self,
+            metrics: Iterable[Any],
+            *,
+            ndjson: bool = False,
+            action: Optional[dict] = None,
+    ) -> bytes:
+        """
+        批量编码指标数据
+
+        :param metrics: 指标数据(Metric)或字典
+        :param ndjson: True 时每行一个 JSON 对象(NDJSON), 否则为 JSON 数组
+        :param action: NDJSON 时每个数据前的动作行, 如 ES bulk 接口: {'index': {}}
+        :return:
+        """
+        return self.join_bulk([self.encode_doc(x) for x in metrics], ndjson=ndjson, action=action)
+
+    def encode_doc(self, metric: Any) -> bytes:
+        """
+        编码单个指标数据(Metric)或字典
+
+        指标数据不生成 as_dict 合并字典, 基础数据项(同一秒内), 服务器标识信息(共享)的编码结果缓存,
+        与指标数据的编码结果直接拼接. 存在重复数据项或已删除的数据项时, 按 as_dict 合并后编码.
+        """
+        # as_dict 为属性, 在类上检查, 避免生成合并字典
+        if not hasattr(type(metric), 'as_dict'):
+            return self.dumpb(metric)
+
+        data = metric.data
+        info = self.encode_info(metric.info)
+        if (
+                info is None
+                or metric.hidden
+                or 'name' in data or 'time' in data or 'timestamp' in data
+                or not metric.info.keys().isdisjoint(data.keys())
+        ):
+            return self.dumpb(metric.as_dict)
+
+        head = self.encode_head(metric)
+        if not data:
+            return b''.join((head, info, b'}'))
+
+        return b''.join((head, info, b',', memoryview(self.dumpb(data))[1:]))
+
+    def encode_head(self, metric: Any) -> bytes:
+        """基础数据项的编码结果(不含结尾的 `}`)"""
+        timestamp = int(metric.epoch)
+        key = (metric.name, timestamp)
+        head = self.heads.get(key)
+        if head is None:
+            len(self.heads) >= MAX_CACHED_PARTS and self.heads.clear()
+            base = {'name': metric.name, 'time': metric.lookup('time'), 'timestamp': timestamp}
+            head = self.heads[key] = self.dumpb(base)[:-1]
+
+        return head
+
+    def encode_info(self, info: Any) -> Optional[bytes]:
+        """服务器标识信息的编码结果(以 `,` 开头, 无 `{}`), 与基础数据项重复时为 None"""
+        if not info:
+            return b''
+
+        item = self.infos.get(id(info))
+        if item is None or item[0] is not info:
+            len(self.infos) >= MAX_CACHED_PARTS and self.infos.clear()
+            encoded = None if any(x in info for x in BASE_KEYS) else b',' + self.dumpb(dict(info))[1:-1]
+            item = self.infos[id(info)] = (info, encoded)
+
+        return item[1]
+
+    def join_bulk(
+            self,
+            docs: List[bytes],
+            *,
+            ndjson: bool = False,
+            action: Optional[dict] = None,
+    ) -> bytes:
+        """
+        拼接已编码的数据, 一次性生成请求体
+
+        :param docs: 已编码的数据列表
+        :param ndjson: True 时每行一个 JSON 对象(NDJSON), 否则为 JSON 数组
+        :param action: NDJSON 时每个数据前的动作行
+        :return:
+        """
+        if not ndjson:
+            return b'[' + b','.join(docs) + b']'
+
+        if not docs:
+            return b''
+
+        sep = b'\n' + self.dumpb(action) + b'\n' if action else b'\n'
+        return (sep[1:] if action else b'') + sep.join(docs) + b'\n'
+
+
+# 默认编码器
+ENCODER = Encoder()
+dumpb = ENCODER.dumpb
+dumps = ENCODER.dumps
+loads = ENCODER.loads
+encode_bulk = ENCODER.encode_bulk
+encode_doc = ENCODER.encode_doc
+join_bulk = ENCODER.join_bulk
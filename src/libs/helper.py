@@ -7,7 +7,6 @@
 """
 import calendar
 import hashlib
-import json
 import re
 import socket
 import time
@@ -21,6 +20,8 @@ from typing import Any, Callable, Optional, Union
 
 from loguru import logger
 
+from .encoder import loads
+
 
 def try_logger(depth=1, *, as_logger=True, log_tag=''):
     """
@@ -469,10 +470,10 @@ def get_json_loads(s: Any, default: bool = False, *, as_file=False) -> dict:
         return s
     try:
         if as_file:
-            with open(s, 'r') as f:
-                return json.load(f)
+            with open(s, 'rb') as f:
+                return loads(f.read())
         else:
-            return json.loads(s)
+            return loads(s)
     except Exception:
         return {} if default is False else default
 
@@ -6,38 +6,87 @@
 
     :author: Fufu, 2021/6/7
 """
-import json
 import time
-from typing import Any, Optional, Union, List, Tuple
+from types import MappingProxyType
+from typing import Any, Callable, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
 
+from .encoder import dumps
 from .helper import get_iso_date, get_same_type
 
+# 空的服务器标识信息
+EMPTY_INFO = MappingProxyType({})
+
+# 基础数据项
+BASE_KEYS = ('name', 'time', 'timestamp')
+
+# 数据项不存在
+MISSING = object()
+
+# 每秒缓存一次 ISO 时间字符串: (时间戳, ISO 时间)
+_iso_date_cache = (0, '')
+
+
+def get_metric_time(timestamp: int) -> str:
+    """指标数据时间(ISO 格式), 同一秒内复用"""
+    global _iso_date_cache
+    ts, iso_date = _iso_date_cache
+    if ts != timestamp:
+        iso_date = get_iso_date(timestamp)
+        _iso_date_cache = (timestamp, iso_date)
+
+    return iso_date
+
 
 class Metric:
-    """指标数据"""
+    """
+    指标数据
+
+    基础数据项(name, time, timestamp)在序列化时生成, 服务器标识信息为共享的只读字典,
+    数据项优先级: 指标数据 > 服务器标识信息 > 基础数据项
+    """
+
+    __slots__ = ('tag', 'name', 'epoch', 'info', 'data', 'hidden')
 
     def __init__(
             self,
             name: str,
             data: Optional[dict] = None,
             *,
-            info: Optional[dict] = None,
+            info: Optional[Mapping] = None,
             tag: str = 'metric',
     ) -> None:
         # 数据标识: `metric` 采集的指标数据; `alarm` 报警数据
         self.tag = str(tag)
         # 数据名称: `cpu` 采集的 CPU 指标数据, 一般是插件名称
         self.name = str(name)
-        # 基础数据项
-        self.metric = {
-            'name': self.name,
-            'time': get_iso_date(),
-            'timestamp': int(time.time())
-        }
-        # 服务器标识信息
-        isinstance(info, dict) and self.metric.update(info)
+        # 数据生成时间戳(秒, 浮点数)
+        self.epoch = time.time()
+        # 服务器标识信息(只读, 多个指标数据共享)
+        if isinstance(info, MappingProxyType):
+            self.info = info
+        else:
+            self.info = MappingProxyType(dict(info)) if isinstance(info, dict) and info else EMPTY_INFO
         # 指标数据
-        isinstance(data, dict) and self.metric.update(data)
+        self.data = dict(data) if isinstance(data, dict) else {}
+        # 已删除的基础数据项和服务器标识信息项
+        self.hidden = None
+
+    def lookup(self, key: str, default: Any = None) -> Any:
+        """获取数据(不转换类型)"""
+        if key in self.data:
+            return self.data[key]
+        if self.hidden and key in self.hidden:
+            return default
+        if key in self.info:
+            return self.info[key]
+        if key == 'name':
+            return self.name
+        if key == 'timestamp':
+            return int(self.epoch)
+        if key == 'time':
+            return get_metric_time(int(self.epoch))
+
+        return default
 
     def get(
             self,
@@ -47,25 +96,30 @@ class Metric:
             fix_type: bool = True
     ) -> Any:
         """获取数据"""
-        value = self.metric.get(str(key), default)
+        value = self.lookup(str(key), default)
         return get_same_type(default, value) if fix_type else value
 
     def set(self, **data: Any) -> None:
         """添加数据"""
-        self.metric.update(data)
+        self.data.update(data)
+        self.hidden and self.hidden.difference_update(data)
 
     def add(self, key: str, value: Any) -> None:
         """添加数据"""
-        self.metric[key] = value
+        self.data[key] = value
+        self.hidden and self.hidden.discard(key)
 
     def delete(self, key: Union[str, List[str], Tuple[str]]) -> None:
         """删除数据项"""
         for x in (key if isinstance(key, (list, tuple)) else [key]):
-            self.metric.pop(x, None)
+            self.data.pop(x, None)
+            if x in self.info or x in BASE_KEYS:
+                self.hidden = self.hidden or set()
+                self.hidden.add(x)
 
     def has_key(self, key: str):
         """是否存在相应的键"""
-        return key in self.metric
+        return self.lookup(key, MISSING) is not MISSING
 
     def get_name(self) -> str:
         """获取数据项名称"""
@@ -74,7 +128,9 @@ class Metric:
     def set_name(self, name: str) -> None:
         """设置数据项名称"""
         self.name = name
-        self.metric['name'] = name
+        self.data.pop('name', None)
+        'name' in self.info and self.add('name', name)
+        self.hidden and self.hidden.discard('name')
 
     def get_tag(self) -> str:
         """获取数据项标识"""
@@ -86,14 +142,20 @@ class Metric:
 
     def clone(self) -> Any:
         """克隆数据"""
-        return Metric(self.name, self.as_dict, tag=self.tag)
+        metric = Metric.__new__(Metric)
+        metric.tag = self.tag
+        metric.name = self.name
+        metric.epoch = self.epoch
+        metric.info = self.info
+        metric.data = self.data.copy()
+        metric.hidden = set(self.hidden) if self.hidden else None
+        return metric
 
     def keys(self, scope: Optional[Union[list, tuple, set]] = None) -> list:
         """获取数据键名列表"""
         if isinstance(scope, (list, tuple, set)):
-            ks = self.metric.keys()
-            return [k for k in scope if k in ks]
-        return list(self.metric.keys())
+            return [k for k in scope if self.has_key(k)]
+        return list(self.as_dict.keys())
 
     def msg(self, fields: Optional[List[str]] = None, sep: str = ', ') -> str:
         """提取指标字段生成文本消息"""
@@ -101,23 +163,88 @@ class Metric:
 
     @property
     def as_dict(self) -> dict:
-        """转换为字典(浅拷贝)"""
-        return self.metric.copy()
+        """转换为字典(新字典, 数据项浅拷贝)"""
+        timestamp = int(self.epoch)
+        metric = {
+            'name': self.name,
+            'time': get_metric_time(timestamp),
+            'timestamp': timestamp,
+        }
+        self.info and metric.update(self.info)
+        metric.update(self.data)
+        if self.hidden:
+            for x in self.hidden:
+                metric.pop(x, None)
+
+        return metric
 
     @property
     def as_json(self) -> str:
         """转换为 JSON 字符串"""
-        return json.dumps(self.metric, ensure_ascii=False)
+        return dumps(self.as_dict)
 
     @property
     def as_text(self) -> str:
         """转换为字符串"""
-        return '{}, {}'.format(self.tag.upper(), ' '.join([f'{k}={v}' for k, v in self.metric.items()]))
+        return '{}, {}'.format(self.tag.upper(), ' '.join([f'{k}={v}' for k, v in self.as_dict.items()]))
 
     @property
     def is_closed(self) -> bool:
         """检查是否为关闭信号(退出插件)"""
         return self.tag == '__CLOSE_SIGNAL__'
 
+    @property
+    def is_stopped(self) -> bool:
+        """检查是否为处理链停止信号(处理链重建, 旧链退出)"""
+        return self.tag == '__STOP_SIGNAL__'
+
     def __contains__(self, key: str):
-        return key in self.metric
+        return self.has_key(key)
+
+
+class MetricBatch:
+    """指标数据批次, 一次采集的多个指标数据作为一个队列数据传递"""
+
+    __slots__ = ('metrics',)
+
+    def __init__(self, metrics: Optional[Iterable[Metric]] = None) -> None:
+        self.metrics = list(metrics) if metrics else []
+
+    def append(self, metric: Metric) -> None:
+        """添加指标数据"""
+        self.metrics.append(metric)
+
+    def extend(self, metrics: Iterable[Metric]) -> None:
+        """批量添加指标数据"""
+        self.metrics.extend(metrics)
+
+    def filter(self, fn: Callable[[Metric], bool]) -> 'MetricBatch':
+        """按条件筛选指标数据, 返回新批次"""
+        return MetricBatch(x for x in self.metrics if fn(x))
+
+    @property
+    def is_closed(self) -> bool:
+        """是否包含关闭信号"""
+        return any(x.is_closed for x in self.metrics)
+
+    @property
+    def is_stopped(self) -> bool:
+        """批次不会包含处理链停止信号"""
+        return False
+
+    def __iter__(self) -> Iterator[Metric]:
+        return iter(self.metrics)
+
+    def __len__(self) -> int:
+        return len(self.metrics)
+
+    def __bool__(self) -> bool:
+        return bool(self.metrics)
+
+
+def iter_metrics(item: Union[Metric, MetricBatch, None]) -> Iterator[Metric]:
+    """遍历队列数据中的指标数据(单个指标或批次)"""
+    if isinstance(item, MetricBatch):
+        yield from item
+    elif item is not None:
+        yield item
@@ -0,0 +1,313 @@
+# -*- coding:utf-8 -*-
+"""
+    multiping.py
+    ~~~~~~~~
+    多目标 PING, 每个协议族共用一个 ICMP 套接字, 所有目标的探测按同一时间表交错发送
+
+    :author: Fufu, 2022/8/27
+"""
+import heapq
+import time
+from asyncio import AbstractEventLoop, Event, TimeoutError, gather, get_running_loop, sleep, wait_for
+from ipaddress import ip_address
+from itertools import count
+from socket import AF_INET, AF_INET6, SOCK_DGRAM, SOL_SOCKET, SO_RCVBUF
+from typing import Any, Dict, List, Optional, Tuple
+
+from icmplib import ICMPRequest, ICMPv4Socket, ICMPv6Socket, SocketPermissionError, __version__ as icmplib_version
+from icmplib.utils import unique_identifier
+from loguru import logger
+
+from .helper import get_round
+
+# 目标不通时的延迟值(毫秒), 同 net.pyping
+ERR_RTT = 5000
+
+# 回显应答类型: ICMPv4 0, ICMPv6 129
+ECHO_REPLY = {AF_INET: 0, AF_INET6: 129}
+
+# ICMP 套接字类
+SOCKET_CLASSES = {AF_INET: ICMPv4Socket, AF_INET6: ICMPv6Socket}
+
+# 应答解析使用 icmplib 的内部方法 _parse_reply, 仅支持已验证的版本(同 requirements.txt), 其他版本不启用
+PARSE_REPLY_SUPPORTED = (
+        icmplib_version.split('.')[:2] == ['3', '0']
+        and all(hasattr(x, '_parse_reply') for x in SOCKET_CLASSES.values())
+)
+
+# 待应答探测的键: (目标 IP, 标识符, 序号), 非特权套接字的标识符由内核分配, 为 None
+PendingKey = Tuple[str, Optional[int], int]
+
+
+class PingStats:
+    """单个目标的探测结果"""
+
+    __slots__ = ('address', 'ip', 'family', 'rtts')
+
+    def __init__(self, address: str) -> None:
+        self.address = address
+        # 解析后的 IP 和协议族, 解析失败时为空
+        self.ip = ''
+        self.family = 0
+        # 每次探测的延迟(毫秒), 未收到应答(或超时)为 None
+        self.rtts: List[Optional[float]] = []
+
+    def as_dict(self) -> dict:
+        """丢包率, 最小/平均/最大延迟, 抖动(相邻两次延迟差的平均值, 同 icmplib)"""
+        rtts = [x for x in self.rtts if x is not None]
+        if not rtts:
+            return {'loss': 100, 'minimum': ERR_RTT, 'maximum': ERR_RTT, 'average': ERR_RTT, 'jitter': ERR_RTT}
+
+        deltas = [abs(x - y) for x, y in zip(rtts, rtts[1:])]
+        return {
+            'loss': get_round((len(self.rtts) - len(rtts)) / len(self.rtts) * 100),
+            'minimum': get_round(min(rtts), precision=3),
+            'maximum': get_round(max(rtts), precision=3),
+            'average': get_round(sum(rtts) / len(rtts), precision=3),
+            'jitter': get_round(sum(deltas) / len(deltas), precision=3) if deltas else 0.0,
+        }
+
+
+class PingRound:
+    """一次多目标 PING, 所有探测发送完毕且均已应答(或超时)时结束"""
+
+    __slots__ = ('timeout', 'outstanding', 'sent_all', 'done')
+
+    def __init__(self, timeout: float) -> None:
+        self.timeout = timeout
+        # 待应答的探测数
+        self.outstanding = 0
+        self.sent_all = False
+        self.done = Event()
+
+    def settle(self) -> None:
+        """一个探测收到应答"""
+        self.outstanding -= 1
+        self.sent_all and self.outstanding <= 0 and self.done.set()
+
+
+class MultiPing:
+    """
+    多目标 PING
+
+    - 每个协议族一个 ICMP 套接字(优先原始套接字, 无权限时使用非特权的 SOCK_DGRAM 套接字), 多次 PING 共用
+    - 各目标的第 N 次探测在同一轮中按间隔均匀交错发送, 每轮 interval 秒, 共 count 轮
+    - 应答按来源地址, 标识符和序号匹配, 同一目标的序号在 65536 次探测内不重复
+    - 探测超过 timeout 未应答时移除并计为丢包, 之后的应答被忽略
+    - 应答由事件循环在套接字可读时读取, 不为每个探测创建定时器或任务
+    """
+
+    def __init__(self, privileged: Optional[bool] = None) -> None:
+        # 是否使用原始套接字, None 为自动
+        self.privileged = privileged
+        self.loop: Optional[AbstractEventLoop] = None
+        # 协议族: ICMP 套接字, 标识符(非特权套接字由内核分配和过滤, 为 None)
+        self.sockets: Dict[int, Any] = {}
+        self.idents: Dict[int, Optional[int]] = {}
+        self.seq = count()
+        # 待应答的探测: (所属 PING, 目标, 探测次序, 发送时间, 超时时间)
+        self.pending: Dict[PendingKey, Tuple[PingRound, PingStats, int, float, float]] = {}
+        # 按超时时间排序的堆: (超时时间, 待应答探测的键)
+        self.deadlines: List[Tuple[float, PendingKey]] = []
+        # 进行中的 PING 数, 为 0 时停止读取套接字
+        self.runs = 0
+
+    async def ping(
+            self,
+            addresses: List[str],
+            count: int = 3,
+            timeout: float = 0.7,
+            interval: float = 0.1,
+    ) -> List[dict]:
+        """
+        PING 多个目标
+
+        :param addresses: 目标地址(IP 或域名)列表
+        :param count: 每个目标的探测次数
+        :param timeout: 探测超时时间(秒)
+        :param interval: 同一目标两次探测的间隔(秒)
+        :return: 与目标地址顺序一致的结果列表, 字段同 net.pyping, 另有抖动 jitter
+        """
+        loop = get_running_loop()
+        if loop is not self.loop:
+            # 新的事件循环, 旧套接字失效
+            self.close()
+            self.loop = loop
+
+        targets = list(await gather(*[resolve(x) for x in addresses]))
+        alive = [x for x in targets if x.ip]
+        for family in {x.family for x in alive}:
+            self.get_socket(family)
+
+        self.runs += 1
+        self.runs == 1 and self.start_reading()
+        ping_round = PingRound(timeout)
+        try:
+            await self.send_all(ping_round, alive, max(count, 1), interval)
+            if ping_round.outstanding > 0:
+                try:
+                    await wait_for(ping_round.done.wait(), timeout)
+                except TimeoutError:
+                    pass
+        finally:
+            for key in [k for k, v in self.pending.items() if v[0] is ping_round]:
+                self.pending.pop(key)
+            self.runs -= 1
+            self.runs or self.deadlines.clear()
+            self.runs or self.stop_reading()
+
+        return [x.as_dict() for x in targets]
+
+    async def send_all(self, ping_round: PingRound, targets: List[PingStats], count: int, interval: float) -> None:
+        """按时间表交错发送探测"""
+        if targets:
+            step = interval / len(targets)
+            start = self.loop.time()
+            for i in range(count * len(targets)):
+                delay = start + i * step - self.loop.time()
+                # 小于 1 毫秒的间隔不等待, 连续发送
+                delay >= 0.001 and await sleep(delay)
+                self.expire(time.perf_counter())
+                self.send(ping_round, targets[i % len(targets)])
+
+        ping_round.sent_all = True
+        ping_round.outstanding <= 0 and ping_round.done.set()
+
+    def send(self, ping_round: PingRound, target: PingStats) -> None:
+        """发送一个探测, 发送失败计为丢包"""
+        index = len(target.rtts)
+        target.rtts.append(None)
+        family = target.family
+        ident = self.idents[family]
+        seq = next(self.seq) & 0xffff
+        key = (target.ip, ident, seq)
+        # 同一目标的序号回绕时, 旧探测早已超时
+        self.drop(key)
+        request = ICMPRequest(target.ip, ident or 0, seq)
+        try:
+            self.sockets[family].send(request)
+        except Exception as e:
+            logger.debug(f'multiping send to {target.address} error: {e}')
+            return
+
+        ping_round.outstanding += 1
+        sent_time = time.perf_counter()
+        deadline = sent_time + ping_round.timeout
+        self.pending[key] = (ping_round, target, index, sent_time, deadline)
+        heapq.heappush(self.deadlines, (deadline, key))
+
+    def expire(self, now: float) -> None:
+        """移除已超时的探测, 计为丢包"""
+        while self.deadlines and self.deadlines[0][0] <= now:
+            deadline, key = heapq.heappop(self.deadlines)
+            item = self.pending.get(key)
+            # 已应答, 所属 PING 已结束, 或键已被新的探测使用
+            if item and item[4] == deadline:
+                self.drop(key)
+
+    def drop(self, key: PendingKey) -> None:
+        """移除未应答的探测, 计为丢包"""
+        item = self.pending.pop(key, None)
+        item and item[0].settle()
+
+    def on_readable(self, family: int) -> None:
+        """读取套接字中的所有应答"""
+        icmp_sock = self.sockets.get(family)
+        while icmp_sock and icmp_sock.sock:
+            try:
+                packet, source = icmp_sock.sock.recvfrom(1024)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.debug(f'multiping receive error: {e}')
+                return
+
+            now = time.perf_counter()
+            self.expire(now)
+            # icmplib 按套接字类型和平台处理 IP 头偏移
+            reply = icmp_sock._parse_reply(packet, source[0], now)
+            if not reply or reply.type != ECHO_REPLY[family]:
+                continue
+
+            ident = self.idents[family]
+            if ident is not None and reply.id != ident:
+                continue
+
+            item = self.pending.pop((source[0], ident, reply.sequence), None)
+            if not item:
+                continue
+
+            ping_round, target, index, sent_time, _ = item
+            target.rtts[index] = (now - sent_time) * 1000
+            ping_round.settle()
+
+    def get_socket(self, family: int) -> Any:
+        """协议族对应的 ICMP 套接字, 不存在时创建"""
+        icmp_sock = self.sockets.get(family)
+        if icmp_sock:
+            return icmp_sock
+
+        if not PARSE_REPLY_SUPPORTED:
+            raise RuntimeError(f'icmplib {icmplib_version} is not supported')
+
+        cls = SOCKET_CLASSES[family]
+        if self.privileged is None:
+            try:
+                icmp_sock = cls(privileged=True)
+            except SocketPermissionError:
+                logger.info('multiping raw socket is not permitted, use unprivileged socket')
+                icmp_sock = cls(privileged=False)
+        else:
+            icmp_sock = cls(privileged=self.privileged)
+
+        icmp_sock.blocking = False
+        try:
+            # 大量目标的应答可能同时到达
+            icmp_sock.sock.setsockopt(SOL_SOCKET, SO_RCVBUF, 1 << 20)
+        except OSError:
+            pass
+
+        self.sockets[family] = icmp_sock
+        self.idents[family] = unique_identifier() if icmp_sock.is_privileged else None
+        self.runs and self.loop.add_reader(icmp_sock.sock.fileno(), self.on_readable, family)
+        return icmp_sock
+
+    def start_reading(self) -> None:
+        for family, icmp_sock in self.sockets.items():
+            self.loop.add_reader(icmp_sock.sock.fileno(), self.on_readable, family)
+
+    def stop_reading(self) -> None:
+        for icmp_sock in self.sockets.values():
+            icmp_sock.sock and self.loop.remove_reader(icmp_sock.sock.fileno())
+
+    def close(self) -> None:
+        """关闭所有套接字"""
+        self.loop and not self.loop.is_closed() and self.stop_reading()
+        for icmp_sock in self.sockets.values():
+            icmp_sock.close()
+        self.sockets.clear()
+        self.idents.clear()
+        self.pending.clear()
+        self.deadlines.clear()
+        self.runs = 0
+
+
+async def resolve(address: str) -> PingStats:
+    """解析目标地址, 域名取第一个解析结果"""
+    target = PingStats(address)
+    try:
+        ip = ip_address(address)
+        target.ip, target.family = str(ip), AF_INET6 if ip.version == 6 else AF_INET
+        return target
+    except ValueError:
+        pass
+
+    try:
+        infos = await get_running_loop().getaddrinfo(address, None, type=SOCK_DGRAM)
+        family, sockaddr = infos[0][0], infos[0][4]
+        if family in SOCKET_CLASSES:
+            target.ip, target.family = sockaddr[0], family
+    except Exception as e:
+        logger.debug(f'multiping resolve {address} error: {e}')
+
+    return target
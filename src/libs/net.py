@@ -6,19 +6,323 @@
 
     :author: Fufu, 2021/6/9
 """
+import codecs
+import errno
+import hashlib
 import math
 import os
 import re
-from asyncio import create_subprocess_shell, subprocess
-from socket import AF_INET, AF_INET6, SOCK_STREAM, socket
-from typing import Any, Optional, Tuple, Union
+import time
+from asyncio import (
+    AbstractEventLoop, Future, Semaphore, TimeoutError, create_subprocess_shell, ensure_future, get_running_loop,
+    shield, subprocess, wait_for,
+)
+from asyncio.staggered import staggered_race
+from functools import partial
+from ipaddress import ip_address
+from itertools import zip_longest
+from socket import AF_INET, AF_INET6, AF_UNSPEC, SOCK_STREAM, socket
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
 
-from aiohttp import ClientSession, TCPConnector
+from aiohttp import ClientSession, ClientTimeout, StreamReader, TCPConnector, TraceConfig
 from icmplib import async_ping
 from loguru import logger
+from yarl import URL
 
 from .helper import get_int, get_json_loads, get_round
 
+# HTTP 会话池默认配置
+# limit: 连接总数上限, limit_per_host: 单主机连接数上限, ttl_dns_cache: DNS 缓存秒数
+# keepalive_timeout: 空闲连接保持秒数, timeout: 请求总超时秒数
+HTTP_OPTIONS = {
+    'limit': 100,
+    'limit_per_host': 10,
+    'ttl_dns_cache': 300,
+    'keepalive_timeout': 30,
+    'timeout': 60,
+}
+
+
+class SessionPool:
+    """
+    HTTP 会话池, 按基础地址(协议+主机+端口)复用会话和连接
+
+    会话与创建时的事件循环绑定, 事件循环变化或配置变化时重建会话.
+    """
+
+    def __init__(self, **options: Any) -> None:
+        self.options = {**HTTP_OPTIONS, **options}
+        # 基础地址: (事件循环, 会话)
+        self.sessions: Dict[str, Tuple[AbstractEventLoop, ClientSession]] = {}
+
+    def set_options(self, **options: Any) -> None:
+        """更新会话池配置, 有变化时旧会话在下次使用时关闭重建"""
+        options = {**HTTP_OPTIONS, **{k: v for k, v in options.items() if k in HTTP_OPTIONS}}
+        if options == self.options:
+            return
+
+        self.options = options
+        loop = get_running_loop_or_none()
+        for session_loop, session in self.sessions.values():
+            session_loop is loop and not session.closed and loop.create_task(session.close())
+        self.sessions.clear()
+
+    def get(self, url: str) -> ClientSession:
+        """获取 URL 对应的会话, 不存在时创建"""
+        key = get_base_url(url)
+        loop = get_running_loop()
+        item = self.sessions.get(key)
+        if item and item[0] is loop and not item[1].closed:
+            return item[1]
+
+        session = self.new_session()
+        self.sessions[key] = (loop, session)
+        logger.debug('http session created: {}', key)
+        return session
+
+    def new_session(self) -> ClientSession:
+        """按配置生成会话"""
+        return new_session(**self.options)
+
+    async def close(self) -> None:
+        """关闭所有会话(当前事件循环中的)"""
+        sessions, self.sessions = list(self.sessions.values()), {}
+        loop = get_running_loop()
+        for session_loop, session in sessions:
+            if session_loop is loop and not session.closed:
+                await session.close()
+
+
+# 进程内共享的 HTTP 会话池
+SESSION_POOL = SessionPool()
+
+
+def new_session(*, trace_configs: Optional[List[TraceConfig]] = None, **options: Any) -> ClientSession:
+    """
+    按配置生成会话(保持连接, DNS 缓存), 未指定的配置项使用 HTTP_OPTIONS 默认值
+
+    :param trace_configs: 请求跟踪配置, 如: [new_trace_config()]
+    :param options: limit, limit_per_host, ttl_dns_cache, keepalive_timeout, timeout
+    :return:
+    """
+    options = {**HTTP_OPTIONS, **options}
+    connector = TCPConnector(
+        ssl=False,
+        limit=get_int(options['limit'], 100),
+        limit_per_host=get_int(options['limit_per_host'], 10),
+        ttl_dns_cache=get_int(options['ttl_dns_cache'], 300) or None,
+        keepalive_timeout=get_int(options['keepalive_timeout'], 30),
+    )
+    timeout = ClientTimeout(total=get_int(options['timeout'], 60) or None)
+    return ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs)
+
+
+def new_fresh_session(timeout: int = 60, *, trace_configs: Optional[List[TraceConfig]] = None) -> ClientSession:
+    """生成不复用连接, 不缓存 DNS 的会话(每次请求都重新解析和建立连接)"""
+    connector = TCPConnector(ssl=False, force_close=True, use_dns_cache=False)
+    timeout = ClientTimeout(total=get_int(timeout, 60) or None)
+    return ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs)
+
+
+class RequestTimer:
+    """
+    HTTP 请求各阶段耗时, 作为 trace_request_ctx 传入请求, 由 new_trace_config() 的回调记录
+
+    - queue: 等待连接池空闲连接
+    - dns: 域名解析(DNS 缓存命中或复用连接时为 0)
+    - connect: 建立连接, 含 TLS 握手(aiohttp 跟踪回调不区分 TCP 连接和 TLS 握手)
+    - ttfb: 请求头发送完成到收到响应头
+    - transfer: 读取响应内容
+    - total: 请求开始到响应内容读取结束
+    """
+
+    __slots__ = ('start', 'end', 'marks', 'spent', 'reused')
+
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.end = 0.0
+        # 阶段开始时间, 阶段累计耗时(秒, 重定向时累加)
+        self.marks: Dict[str, float] = {}
+        self.spent: Dict[str, float] = {}
+        # 是否复用了已有连接
+        self.reused = False
+
+    def mark(self, phase: str) -> None:
+        """阶段开始"""
+        self.marks[phase] = time.perf_counter()
+
+    def done(self, phase: str) -> None:
+        """阶段结束"""
+        start = self.marks.pop(phase, None)
+        if start is not None:
+            self.spent[phase] = self.spent.get(phase, 0.0) + time.perf_counter() - start
+
+    def finish(self) -> None:
+        """请求结束(响应内容读取完毕或请求出错)"""
+        self.end = time.perf_counter()
+
+    def as_dict(self) -> dict:
+        """各阶段耗时(毫秒): time_queue, time_dns, time_connect, time_ttfb, time_transfer, time_total"""
+        spent = self.spent
+        dns = spent.get('dns', 0.0)
+        timings = {
+            'time_queue': spent.get('queue', 0.0),
+            'time_dns': dns,
+            # 建立连接的过程包含域名解析
+            'time_connect': max(spent.get('connect', 0.0) - dns, 0.0),
+            'time_ttfb': spent.get('ttfb', 0.0),
+            'time_transfer': spent.get('transfer', 0.0),
+            'time_total': (self.end or time.perf_counter()) - self.start,
+        }
+        timings = {k: get_round(v * 1000) for k, v in timings.items()}
+        timings['conn_reused'] = self.reused
+        return timings
+
+
+def new_trace_config() -> TraceConfig:
+    """生成请求跟踪配置, 请求时传入 trace_request_ctx=RequestTimer() 记录各阶段耗时"""
+    trace_config = TraceConfig()
+    for phase, start, end in (
+            ('queue', trace_config.on_connection_queued_start, trace_config.on_connection_queued_end),
+            ('dns', trace_config.on_dns_resolvehost_start, trace_config.on_dns_resolvehost_end),
+            ('connect', trace_config.on_connection_create_start, trace_config.on_connection_create_end),
+            ('ttfb', trace_config.on_request_headers_sent, trace_config.on_request_end),
+    ):
+        start.append(partial(on_trace, RequestTimer.mark, phase))
+        end.append(partial(on_trace, RequestTimer.done, phase))
+
+    trace_config.on_connection_reuseconn.append(on_trace_reuseconn)
+    return trace_config
+
+
+async def on_trace(fn: Callable[[RequestTimer, str], None], phase: str, _session, ctx, _params) -> None:
+    """跟踪回调: 记录阶段开始或结束"""
+    timer = ctx.trace_request_ctx
+    isinstance(timer, RequestTimer) and fn(timer, phase)
+
+
+async def on_trace_reuseconn(_session, ctx, _params) -> None:
+    """跟踪回调: 复用已有连接"""
+    timer = ctx.trace_request_ctx
+    if isinstance(timer, RequestTimer):
+        timer.reused = True
+
+
+class BodyReader:
+    """
+    HTTP 响应内容流式读取, 内存占用不超过 keep_bytes
+
+    - 读取到 max_bytes 字节后停止(截断), 其余内容不再读取(连接随之关闭, 不复用)
+    - 仅保留前 keep_bytes 字节内容, 已读取的内容全部计入大小和 MD5
+    - 逐块检查是否包含指定字符串, 保留上一块末尾(最长字符串长度 - 1)字节, 跨块也能匹配
+    """
+
+    __slots__ = ('max_bytes', 'keep_bytes', 'encoding', 'size', 'truncated', 'md5', 'buf', 'pending', 'found',
+                 'overlap', 'tail')
+
+    def __init__(
+            self,
+            max_bytes: int,
+            keep_bytes: int,
+            needles: Iterable[str] = (),
+            encoding: str = 'utf-8',
+    ) -> None:
+        self.max_bytes = max(max_bytes, 0)
+        self.keep_bytes = min(max(keep_bytes, 0), self.max_bytes)
+        self.encoding = get_encoding(encoding)
+        self.size = 0
+        self.truncated = False
+        self.md5 = hashlib.md5()
+        self.buf = bytearray()
+        # 待匹配: {编码后的字符串: 原字符串}, 已匹配的字符串
+        self.pending: Dict[bytes, str] = {}
+        for needle in needles:
+            b = str(needle).encode(self.encoding, errors='replace')
+            b and self.pending.setdefault(b, str(needle))
+        self.found: List[str] = []
+        self.overlap = max((len(x) for x in self.pending), default=1) - 1
+        self.tail = b''
+
+    async def read(self, content: StreamReader) -> 'BodyReader':
+        """读取响应内容(resp.content)"""
+        async for chunk in content.iter_any():
+            if not self.feed(chunk):
+                break
+
+        return self
+
+    def feed(self, chunk: bytes) -> bool:
+        """处理一块内容, 达到大小上限时返回 False"""
+        if self.truncated:
+            return False
+
+        room = self.max_bytes - self.size
+        if len(chunk) > room:
+            chunk = chunk[:room]
+            self.truncated = True
+
+        self.size += len(chunk)
+        self.md5.update(chunk)
+        keep = self.keep_bytes - len(self.buf)
+        keep > 0 and self.buf.extend(chunk[:keep])
+        self.pending and chunk and self.match(chunk)
+
+        return not self.truncated
+
+    def match(self, chunk: bytes) -> None:
+        window = self.tail + chunk
+        for needle in [x for x in self.pending if x in window]:
+            self.found.append(self.pending.pop(needle))
+        self.tail = window[-self.overlap:] if self.overlap else b''
+
+    @property
+    def text(self) -> str:
+        """保留的内容(截断处的不完整字符被替换)"""
+        return self.buf.decode(self.encoding, errors='replace')
+
+    @property
+    def hexdigest(self) -> str:
+        return self.md5.hexdigest()
+
+
+def get_encoding(encoding: Optional[str], default: str = 'utf-8') -> str:
+    """有效的字符编码名称, 未知编码(响应头中的错误 charset)使用默认编码"""
+    try:
+        return codecs.lookup(encoding).name if encoding else default
+    except LookupError:
+        return default
+
+
+def set_http_options(**options: Any) -> None:
+    """设置共享会话池配置"""
+    SESSION_POOL.set_options(**options)
+
+
+def get_session(url: str) -> ClientSession:
+    """从共享会话池获取 URL 对应的会话"""
+    return SESSION_POOL.get(url)
+
+
+async def close_sessions() -> None:
+    """关闭共享会话池中的会话"""
+    await SESSION_POOL.close()
+
+
+def get_base_url(url: str) -> str:
+    """获取基础地址: 协议+主机+端口"""
+    try:
+        return str(URL(url).origin())
+    except Exception:
+        return url
+
+
+def get_running_loop_or_none() -> Optional[AbstractEventLoop]:
+    """获取运行中的事件循环, 不在事件循环中时返回 None"""
+    try:
+        return get_running_loop()
+    except RuntimeError:
+        return None
+
 
 async def request(
         url: str,
@@ -26,19 +330,35 @@ async def request(
         *,
         as_json: bool = True,
         throw: bool = False,
+        session: Optional[ClientSession] = None,
         **kwargs: Any,
 ) -> Union[dict, Tuple[Any]]:
-    """发起 HTTP 请求(异步)"""
-    async with ClientSession(connector=TCPConnector(ssl=False)) as client:
-        try:
-            async with client.request(method, url, **kwargs) as resp:
-                res = await resp.text()
-                return get_json_loads(res) if as_json else (res, resp.status, dict(resp.headers))
-        except Exception as e:
-            logger.debug('Exception: {}, {}: {}', e, method, url)
-            if throw:
-                raise e
-            return {} if as_json else ('', 504, {})
+    """发起 HTTP 请求(异步), 默认使用共享会话池, 可指定会话"""
+    if session is None:
+        session = get_session(url)
+
+    return await session_request(session, url, method, as_json=as_json, throw=throw, **kwargs)
+
+
+async def session_request(
+        client: ClientSession,
+        url: str,
+        method: str = 'POST',
+        *,
+        as_json: bool = True,
+        throw: bool = False,
+        **kwargs: Any,
+) -> Union[dict, Tuple[Any]]:
+    """使用指定会话发起 HTTP 请求(异步)"""
+    try:
+        async with client.request(method, url, **kwargs) as resp:
+            res = await resp.text()
+            return get_json_loads(res) if as_json else (res, resp.status, dict(resp.headers))
+    except Exception as e:
+        logger.debug('Exception: {}, {}: {}', e, method, url)
+        if throw:
+            raise e
+        return {} if as_json else ('', 504, {})
 
 
 async def ping(target: str, count: int = 3, timeout: int = 1000, interval: float = 1.0):
@@ -117,6 +437,7 @@ async def pyping(target: str, count: int = 3, timeout: float = 0.7, interval: fl
             'minimum': host.min_rtt,
             'maximum': host.max_rtt,
             'average': host.avg_rtt,
+            'jitter': host.jitter,
         }
 
     return {
@@ -124,6 +445,7 @@ async def pyping(target: str, count: int = 3, timeout: float = 0.7, interval: fl
         'minimum': 5000,
         'maximum': 5000,
         'average': 5000,
+        'jitter': 5000,
     }
 
 
@@ -164,3 +486,156 @@ def chk_port(
         pass
 
     return False, -1
+
+
+def get_host_port(address: Union[str, tuple, list], port: int = 80) -> Tuple[str, int]:
+    """
+    解析目标地址的主机和端口
+
+    e.g.::
+
+        # ('baidu.com', 443)
+        get_host_port('baidu.com:443')
+        get_host_port(('baidu.com', 443))
+
+        # ('::1', 443)
+        get_host_port('[::1]:443')
+
+        # ('baidu.com', 80)
+        get_host_port('baidu.com')
+    """
+    if isinstance(address, (list, tuple)):
+        host, port = (address[0], address[1]) if len(address) > 1 else (address[0], port)
+    else:
+        address = str(address).strip()
+        if address.startswith('['):
+            # [IPv6]:端口
+            host, _, port_str = address[1:].partition(']')
+            port = port_str.lstrip(':') or port
+        elif address.count(':') == 1:
+            host, port = address.split(':')
+        else:
+            host = address
+
+    return str(host).strip().strip('[]'), get_int(port, 80)
+
+
+class PortProber:
+    """
+    TCP 端口连通性检测(异步非阻塞连接, 不占用线程)
+
+    - 同时进行的检测数不超过 limit, 排队时间不计入超时和耗时
+    - 域名解析结果缓存 ttl_dns_cache 秒, 同一域名并发检测时共用一次解析, IP 地址不解析
+    - 双栈(AF_UNSPEC)时按 Happy Eyeballs(RFC 8305)交替尝试 IPv6/IPv4 地址, 每 happy_eyeballs_delay 秒启动下一个尝试
+    """
+
+    def __init__(self, limit: int = 1000, *, ttl_dns_cache: float = 60, happy_eyeballs_delay: float = 0.25) -> None:
+        self.limit = max(limit, 1)
+        self.ttl_dns_cache = ttl_dns_cache
+        self.happy_eyeballs_delay = happy_eyeballs_delay
+        self.semaphore: Optional[Tuple[AbstractEventLoop, Semaphore]] = None
+        # (主机, 端口, 协议族): (过期时间, 解析任务)
+        self.dns_cache: Dict[Tuple[str, int, int], Tuple[float, Future]] = {}
+        self.expired_at = time.monotonic()
+
+    async def probe(
+            self,
+            host: str,
+            port: int,
+            *,
+            family: int = AF_INET,
+            timeout: float = 5,
+    ) -> Tuple[bool, int, float]:
+        """
+        检测端口连通性
+
+        :param host: 主机名或 IP
+        :param port: 端口
+        :param family: AF_INET, AF_INET6, AF_UNSPEC(双栈)
+        :param timeout: 超时秒数(含域名解析)
+        :return: (是否连通, 错误码: 0 成功, ETIMEDOUT 超时, 其他为 errno 或 -1, 连接耗时毫秒(含域名解析))
+        """
+        async with self.get_semaphore():
+            start = time.perf_counter()
+            try:
+                await wait_for(self.connect(host, port, family), timeout)
+                code = 0
+            except TimeoutError:
+                code = errno.ETIMEDOUT
+            except OSError as e:
+                code = e.errno or -1
+            except Exception:
+                code = -1
+
+            return code == 0, code, get_round((time.perf_counter() - start) * 1000)
+
+    async def connect(self, host: str, port: int, family: int) -> None:
+        """连接到主机的任一地址"""
+        loop = get_running_loop()
+        addrs = await self.resolve(host, port, family)
+        if len(addrs) == 1:
+            await sock_connect(loop, *addrs[0])
+            return
+
+        delay = self.happy_eyeballs_delay if family == AF_UNSPEC else None
+        _, index, errors = await staggered_race([partial(sock_connect, loop, *x) for x in addrs], delay)
+        if index is None:
+            errors = [x for x in errors if x]
+            codes = {getattr(x, 'errno', None) for x in errors}
+            raise errors[0] if len(codes) == 1 else OSError(f'all addresses failed: {errors}')
+
+    async def resolve(self, host: str, port: int, family: int) -> List[Tuple[int, tuple]]:
+        """解析主机地址: [(协议族, 地址)], 双栈时 IPv6/IPv4 交替排列"""
+        try:
+            ip = ip_address(host)
+            return [(AF_INET6 if ip.version == 6 else AF_INET, (host, port))]
+        except ValueError:
+            pass
+
+        loop = get_running_loop()
+        now = time.monotonic()
+        key = (host, port, family)
+        item = self.dns_cache.get(key)
+        if not item or item[1].get_loop() is not loop or item[1].done() and (
+                item[0] <= now or item[1].cancelled() or item[1].exception()):
+            task = ensure_future(loop.getaddrinfo(host, port, family=family, type=SOCK_STREAM))
+            task.add_done_callback(lambda x: x.cancelled() or x.exception())
+            item = self.dns_cache[key] = (now + self.ttl_dns_cache, task)
+            now - self.expired_at > self.ttl_dns_cache and self.expire(now)
+
+        infos = await shield(item[1])
+        addrs = list(dict.fromkeys((x[0], x[4]) for x in infos))
+        if not addrs:
+            raise OSError(f'no address: {host}')
+
+        return interleave_addrs(addrs)
+
+    def expire(self, now: float) -> None:
+        """清理过期的域名解析缓存"""
+        self.expired_at = now
+        for key in [k for k, v in self.dns_cache.items() if v[0] <= now and v[1].done()]:
+            self.dns_cache.pop(key)
+
+    def get_semaphore(self) -> Semaphore:
+        loop = get_running_loop()
+        if not self.semaphore or self.semaphore[0] is not loop:
+            self.semaphore = (loop, Semaphore(self.limit))
+
+        return self.semaphore[1]
+
+
+async def sock_connect(loop: AbstractEventLoop, family: int, addr: tuple) -> None:
+    """非阻塞连接, 成功后立即关闭"""
+    with socket(family, SOCK_STREAM) as s:
+        s.setblocking(False)
+        await loop.sock_connect(s, addr)
+
+
+def interleave_addrs(addrs: List[Tuple[int, tuple]]) -> List[Tuple[int, tuple]]:
+    """按协议族交替排列地址, 首个地址的协议族优先(RFC 8305)"""
+    families = list(dict.fromkeys(x[0] for x in addrs))
+    if len(families) < 2:
+        return addrs
+
+    groups = [[x for x in addrs if x[0] == f] for f in families]
+    return [x for row in zip_longest(*groups) for x in row if x]
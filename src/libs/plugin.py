@@ -6,7 +6,6 @@
 
     :author: Fufu, 2021/6/9
 """
-import json
 from abc import ABC, abstractmethod
 from asyncio import Queue, events
 from contextlib import asynccontextmanager
@@ -16,6 +15,7 @@ from typing import Any, Callable, List, Optional, Tuple, Union
 
 from loguru import logger
 
+from .encoder import dumps
 from .fn import gen_data_fn
 from .metric import Metric
 
@@ -60,6 +60,21 @@ class RootPlugin(ABC):
 
         return default if interval < 1 else interval
 
+    def get_schedule_conf(self) -> dict:
+        """
+        特殊参数, 周期任务调度配置
+        align: 是否按周期对齐到整点; splay: 错峰范围(秒)
+        优先级: 插件配置 > 系统配置 > 默认值
+
+        :return:
+        """
+        align = self.conf.get_conf_value('main|schedule|align', True)
+        splay = self.conf.get_conf_value('main|schedule|splay', 5.0)
+        return {
+            'align': self.get_plugin_conf_value('schedule|align', align),
+            'splay': self.get_plugin_conf_value('schedule|splay', splay),
+        }
+
     def get_plugin_or_main_conf_value(
             self,
             key_path: str,
@@ -158,6 +173,10 @@ class RootPlugin(ABC):
 
         return metric
 
+    def has_common_plugin(self, key_path: str = '') -> bool:
+        """是否配置了同模块插件"""
+        return any(str(x).startswith('use_plugin_') for x in self.get_plugin_conf_value(key_path, {}))
+
     @staticmethod
     def metrics_as_dict(metrics: List[Metric]) -> List[dict]:
         """指标数据列表转为字典"""
@@ -166,7 +185,7 @@ class RootPlugin(ABC):
     @staticmethod
     def metrics_as_json(metrics: List[Metric]) -> str:
         """指标数据列表转为 JSON"""
-        return json.dumps(BasePlugin.metrics_as_dict(metrics)) if metrics else ''
+        return dumps(BasePlugin.metrics_as_dict(metrics)) if metrics else ''
 
     def use_func_data(self, conf_func: List[str], data: Optional[dict] = None) -> dict:
         """根据配置执行数据项生成函数"""
@@ -235,3 +254,10 @@ class BasePlugin(RootPlugin, ABC):
         # 数据队列
         self.in_queue = in_queue
         self.out_queue = out_queue
+
+    # 是否为处理链的最后一个插件(不再传递处理链停止信号)
+    last_stage = False
+
+    def is_passthrough(self) -> bool:
+        """是否为直通插件(不做任何处理), 直通插件不加入处理链"""
+        return False
@@ -0,0 +1,272 @@
+# -*- coding:utf-8 -*-
+"""
+    procfs.py
+    ~~~~~~~~
+    Linux /proc 快速采集(内存, CPU, 网卡流量), 字段与 psutil 结果一致, 不可用时返回 None 由调用方回退到 psutil
+
+    :author: Fufu, 2022/8/25
+"""
+import os
+import sys
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+from loguru import logger
+
+from .helper import get_round
+
+LINUX = sys.platform.startswith('linux')
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if LINUX else 100
+
+# 与 psutil.cpu_times() 一致的字段(旧内核可能缺少后面几项)
+CPU_TIMES_FIELDS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal', 'guest', 'guest_nice')
+
+# psutil 6.0 起已用内存为 total - available(同 free 命令), 之前为 total - free - cached - buffers
+USED_FROM_AVAILABLE = psutil.version_info >= (6, 0)
+
+# 与 psutil.net_io_counters() 一致的字段
+NET_IO_FIELDS = ('bytes_sent', 'bytes_recv', 'packets_sent', 'packets_recv', 'errin', 'errout', 'dropin', 'dropout')
+
+
+class ProcFile:
+    """
+    /proc 文件读取器
+
+    文件描述符和缓冲区在多次读取间复用, 每次从头读取(一次 preadv), 内容超过缓冲区时扩容重读.
+    """
+
+    def __init__(self, path: str, size: int = 8192) -> None:
+        self.path = path
+        self.fd: Optional[int] = None
+        self.buf = bytearray(size)
+        self.lock = Lock()
+
+    def read(self) -> bytes:
+        with self.lock:
+            if self.fd is None:
+                self.fd = os.open(self.path, os.O_RDONLY | getattr(os, 'O_CLOEXEC', 0))
+            while True:
+                n = os.preadv(self.fd, [self.buf], 0)
+                if n < len(self.buf):
+                    return bytes(memoryview(self.buf)[:n])
+                self.buf = bytearray(len(self.buf) * 2)
+
+    def close(self) -> None:
+        with self.lock:
+            self.fd is not None and os.close(self.fd)
+            self.fd = None
+
+
+class ProcFS:
+    """
+    /proc 快速采集
+
+    各项数据读取失败时记录警告并停用该项, 之后始终返回 None(回退到 psutil).
+    CPU 使用率为距上次读取的值, 首次读取为开机以来的平均值.
+    """
+
+    def __init__(self, root: str = '/proc') -> None:
+        self.root = root
+        self.enabled = LINUX and os.path.isdir(root)
+        # 已停用的数据项
+        self.disabled = set()
+        self.meminfo = ProcFile(os.path.join(root, 'meminfo'))
+        self.stat = ProcFile(os.path.join(root, 'stat'), 65536)
+        self.net_dev = ProcFile(os.path.join(root, 'net', 'dev'), 65536)
+        # 上次读取的 CPU 时间(时钟周期): 总体, 单核列表
+        self.last_times: Optional[List[int]] = None
+        self.last_percpu: List[List[int]] = []
+        self.physical_count: Optional[int] = None
+        self.lock = Lock()
+
+    def set_enabled(self, enabled: bool) -> None:
+        self.enabled = bool(enabled) and LINUX and os.path.isdir(self.root)
+
+    def available(self, name: str) -> bool:
+        return self.enabled and name not in self.disabled
+
+    def disable(self, name: str, e: Exception) -> None:
+        self.disabled.add(name)
+        logger.warning(f'procfs {name} unavailable, fallback to psutil: {e}')
+
+    def read_meminfo(self) -> Optional[dict]:
+        """内存状态, 同 psutil.virtual_memory()"""
+        if not self.available('meminfo'):
+            return None
+
+        try:
+            return parse_meminfo(self.meminfo.read())
+        except Exception as e:
+            self.disable('meminfo', e)
+            return None
+
+    def read_cpu(self) -> Optional[dict]:
+        """CPU 状态, 同 sysinfo.collect_cpu() (系统负载除外)"""
+        if not self.available('stat'):
+            return None
+
+        try:
+            with self.lock:
+                return self.parse_cpu(self.stat.read())
+        except Exception as e:
+            self.disable('stat', e)
+            return None
+
+    def read_net_dev(self) -> Optional[Dict[str, dict]]:
+        """网卡流量, 同 psutil.net_io_counters(pernic=True)"""
+        if not self.available('net_dev'):
+            return None
+
+        try:
+            return parse_net_dev(self.net_dev.read())
+        except Exception as e:
+            self.disable('net_dev', e)
+            return None
+
+    def parse_cpu(self, data: bytes) -> dict:
+        """解析 /proc/stat, 计算距上次读取的使用率"""
+        times, percpu, stats = parse_stat(data)
+        last_times = self.last_times or [0] * len(times)
+        last_percpu = self.last_percpu if len(self.last_percpu) == len(percpu) else [[0] * len(times)] * len(percpu)
+        self.last_times = times
+        self.last_percpu = percpu
+
+        if self.physical_count is None:
+            self.physical_count = psutil.cpu_count(logical=False)
+
+        fields = CPU_TIMES_FIELDS[:len(times)]
+        return {
+            'logical_count': len(percpu),
+            'count': self.physical_count,
+            'percent': get_busy_percent(last_times, times),
+            'percent_percpu': [get_busy_percent(x, y) for x, y in zip(last_percpu, percpu)],
+            'times': {k: get_round(v / CLOCK_TICKS) for k, v in zip(fields, times)},
+            'times_percent': dict(zip(fields, get_times_percent(last_times, times))),
+            'stats': stats,
+        }
+
+    def close(self) -> None:
+        for f in (self.meminfo, self.stat, self.net_dev):
+            f.close()
+
+
+def parse_meminfo(data: bytes) -> dict:
+    """解析 /proc/meminfo, 计算方式同 psutil.virtual_memory()"""
+    mems = {}
+    for line in data.splitlines():
+        fields = line.split()
+        if len(fields) >= 2:
+            mems[fields[0]] = int(fields[1]) * 1024
+
+    total = mems[b'MemTotal:']
+    free = mems[b'MemFree:']
+    buffers = mems.get(b'Buffers:', 0)
+    cached = mems.get(b'Cached:', 0) + mems.get(b'SReclaimable:', 0)
+    shared = mems.get(b'Shmem:', mems.get(b'MemShared:', 0))
+    active = mems.get(b'Active:', 0)
+    inactive = mems.get(b'Inactive:')
+    if inactive is None:
+        inactive = sum(mems.get(x, 0) for x in (b'Inact_dirty:', b'Inact_clean:', b'Inact_laundry:'))
+    slab = mems.get(b'Slab:', 0)
+
+    avail = mems.get(b'MemAvailable:')
+    if not avail:
+        # 无 MemAvailable 时(内核 3.14 以前)交由 psutil 估算
+        raise ValueError('MemAvailable not found')
+    if avail > total:
+        avail = free
+
+    if USED_FROM_AVAILABLE:
+        used = total - avail
+    else:
+        used = total - free - cached - buffers
+        if used < 0:
+            used = total - free
+
+    return {
+        'total': total,
+        'available': avail,
+        'percent': round((total - avail) / total * 100, 1) if total else 0.0,
+        'used': used,
+        'free': free,
+        'active': active,
+        'inactive': inactive,
+        'buffers': buffers,
+        'cached': cached,
+        'shared': shared,
+        'slab': slab,
+    }
+
+
+def parse_stat(data: bytes) -> Tuple[List[int], List[List[int]], dict]:
+    """解析 /proc/stat: (总体 CPU 时间, 单核 CPU 时间列表, CPU 统计信息), 时间单位为时钟周期"""
+    times = []
+    percpu = []
+    stats = {'ctx_switches': 0, 'interrupts': 0, 'soft_interrupts': 0, 'syscalls': 0}
+    for line in data.splitlines():
+        if line.startswith(b'cpu'):
+            values = [int(x) for x in line.split()[1:len(CPU_TIMES_FIELDS) + 1]]
+            if line.startswith(b'cpu '):
+                times = values
+            else:
+                percpu.append(values)
+        elif line.startswith(b'ctxt'):
+            stats['ctx_switches'] = int(line.split()[1])
+        elif line.startswith(b'intr'):
+            stats['interrupts'] = int(line.split()[1])
+        elif line.startswith(b'softirq'):
+            stats['soft_interrupts'] = int(line.split()[1])
+
+    if not times:
+        raise ValueError('cpu times not found')
+
+    return times, percpu, stats
+
+
+def parse_net_dev(data: bytes) -> Dict[str, dict]:
+    """解析 /proc/net/dev"""
+    nics = {}
+    for line in data.splitlines()[2:]:
+        name, _, values = line.rpartition(b':')
+        if not name:
+            continue
+        fields = [int(x) for x in values.split()]
+        nics[name.strip().decode('utf-8')] = dict(zip(NET_IO_FIELDS, (
+            fields[8], fields[0], fields[9], fields[1], fields[2], fields[10], fields[3], fields[11],
+        )))
+
+    return nics
+
+
+def get_cpu_deltas(t1: List[int], t2: List[int]) -> Tuple[List[int], int]:
+    """各项 CPU 时间差值及总时间差值(客户机时间已计入 user/nice, 不重复计算)"""
+    deltas = [max(0, y - x) for x, y in zip(t1, t2)]
+    return deltas, sum(deltas[:8])
+
+
+def get_busy_percent(t1: List[int], t2: List[int]) -> float:
+    """CPU 使用率, 同 psutil.cpu_percent()"""
+    deltas, total = get_cpu_deltas(t1, t2)
+    if not total:
+        return 0.0
+
+    # 空闲时间含 iowait
+    busy = total - deltas[3] - (deltas[4] if len(deltas) > 4 else 0)
+    return round(busy / total * 100, 1)
+
+
+def get_times_percent(t1: List[int], t2: List[int]) -> List[float]:
+    """各项 CPU 时间比例, 同 psutil.cpu_times_percent()"""
+    deltas, total = get_cpu_deltas(t1, t2)
+    scale = 100.0 / max(1, total)
+    return [min(max(0.0, round(x * scale, 1)), 100.0) for x in deltas]
+
+
+# 进程内共享的 /proc 采集器
+PROCFS = ProcFS()
+
+
+def set_procfs(enabled: bool) -> None:
+    """开启或关闭 /proc 快速采集"""
+    PROCFS.set_enabled(enabled)
@@ -6,15 +6,19 @@
 
     :author: Fufu, 2021/11/10
 """
-import time
 from operator import itemgetter
-from typing import Any, List, Optional, Union
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import psutil
 
 from ..libs.helper import get_date, get_int, get_round
 
 
+# 默认的进程信息字段
+PROCESS_FIELDS = ['pid', 'ppid', 'name', 'username', 'cpu_percent', 'memory_percent', 'exe', 'num_threads', 'create_time']
+
+
 def get_process_info(
         target: Optional[list] = None,
         fields: Optional[list] = None,
@@ -23,51 +27,163 @@ def get_process_info(
         reverse=True,
 ) -> list:
     """获取进程列表信息"""
-    fields = fields if fields and isinstance(fields, list) \
-        else ['pid', 'ppid', 'name', 'username', 'cpu_percent', 'memory_percent', 'exe', 'num_threads', 'create_time']
-
-    chk_names = target and isinstance(target, list)
-    as_ctime = 'create_time' in fields
-    as_mem = 'memory_percent' in fields
-    as_cpu = 'cpu_percent' in fields
-    logical_count = 1
-    if as_cpu:
-        logical_count = psutil.cpu_count()
-        list(psutil.process_iter(['cpu_percent']))
-        time.sleep(0.5)
-
-    pinfo_list = []
-    for proc in psutil.process_iter():
+    fields = fields if fields and isinstance(fields, list) else PROCESS_FIELDS
+    return select_process_info(scan_process_info(fields), target, orderby=orderby, reverse=reverse)
+
+
+# 进程生命周期内不变的字段, 首次发现进程时读取并缓存
+PROCESS_STATIC_FIELDS = {'name', 'exe', 'username', 'create_time', 'cmdline', 'cwd'}
+
+# Linux 从 /proc/<pid>/stat 读取进程启动时间和父进程号(psutil 内部方法, oneshot() 中与 CPU 时间等字段共用一次读取)
+PROC_STAT = psutil.LINUX and hasattr(psutil._psplatform.Process, '_parse_stat_file')
+
+
+class ProcessTable:
+    """
+    进程表
+
+    按 (pid, create_time) 在多次采集间保留 psutil.Process 对象和不变字段,
+    CPU 使用率为距上次采集的值(无需等待), 仅新增, 退出和进程号被复用的进程会创建或释放对象,
+    每个进程的字段在 oneshot() 中批量读取. 进程首次出现时 CPU 使用率为 0.
+    """
+
+    def __init__(self, fields: List[str]) -> None:
+        self.fields = fields
+        self.static_fields = [x for x in fields if x in PROCESS_STATIC_FIELDS]
+        self.dynamic_fields = [x for x in fields if x not in PROCESS_STATIC_FIELDS]
+        # 父进程号从 stat 读取(新版 psutil 的 ppid() 会创建新的进程对象检查进程号复用)
+        self.stat_ppid = PROC_STAT and 'ppid' in self.dynamic_fields
+        self.stat_ppid and self.dynamic_fields.remove('ppid')
+        # pid: (进程对象, 不变字段和启动时间 _start)
+        self.procs: Dict[int, Tuple[psutil.Process, dict]] = {}
+        self.lock = Lock()
+
+    def scan(self) -> List[dict]:
+        """遍历所有进程, 获取进程信息(每次返回新的字典)"""
+        with self.lock:
+            logical_count = psutil.cpu_count() or 1
+            procs = {}
+            pinfo_list = []
+            for pid in psutil.pids():
+                item = self.procs.get(pid) or self.new_process(pid)
+                if item is None:
+                    continue
+
+                proc, static = item
+                try:
+                    with proc.oneshot():
+                        stat = get_stat(proc)
+                        # 进程号已被新进程复用(create_time() 有缓存, 重新读取启动时间与缓存的值比较)
+                        if pid in self.procs and is_reused(proc, static, stat):
+                            item = self.new_process(pid)
+                            if item is None:
+                                continue
+                            proc, static = item
+                            stat = get_stat(proc)
+                        dynamic = proc.as_dict(attrs=self.dynamic_fields)
+                        if self.stat_ppid:
+                            dynamic['ppid'] = get_int(stat['ppid'])
+                except psutil.Error:
+                    continue
+
+                procs[pid] = item
+                if not static.get('_name'):
+                    continue
+
+                pinfo = {k: static[k] if k in static else dynamic.get(k) for k in self.fields}
+                if 'create_at' in static:
+                    pinfo['create_at'] = static['create_at']
+                if 'cpu_percent' in pinfo:
+                    pinfo['cpu_percent'] = get_round((pinfo['cpu_percent'] or 0) / logical_count, default=0)
+                if 'memory_percent' in pinfo:
+                    pinfo['memory_percent'] = get_round(pinfo['memory_percent'] or 0, default=0)
+                pinfo_list.append(pinfo)
+
+            # 释放已退出的进程
+            self.procs = procs
+
+            return pinfo_list
+
+    def new_process(self, pid: int) -> Optional[Tuple[psutil.Process, dict]]:
+        """新进程, 读取并缓存不变字段"""
         try:
-            pinfo = proc.as_dict(attrs=fields)
+            proc = psutil.Process(pid)
+            with proc.oneshot():
+                static = proc.as_dict(attrs=self.static_fields)
+                static['_name'] = proc.name()
+                static['_start'] = (get_stat(proc) or {}).get('create_time')
         except psutil.Error:
-            pass
-        else:
-            # 指定进程名(默认采集所有进程)
-            proc_name = proc.name()
-            if not proc_name or chk_names and proc_name not in target:
-                continue
-            # 核算 CPU 占用
-            if as_cpu:
-                pinfo['cpu_percent'] = get_round(pinfo.get('cpu_percent', 0) / logical_count, default=0)
-            # 处理默认字段格式
-            if as_mem:
-                pinfo['memory_percent'] = get_round(pinfo.get('memory_percent', 0), default=0)
-            if as_ctime:
-                pinfo['create_time'] = get_int(pinfo.get('create_time', 0), default=0)
-                pinfo['create_at'] = get_date(pinfo['create_time'], out_fmt='iso')
-            pinfo_list.append(pinfo)
-
-    if not orderby:
-        return pinfo_list
-
-    orderby_list = orderby if isinstance(orderby, list) else [orderby]
-    orderby = list(set(orderby_list) & set(fields))
-    if not orderby:
-        return pinfo_list
-
-    orderby.sort(key=orderby_list.index)
-    pinfo_list = sorted(pinfo_list, key=itemgetter(*orderby), reverse=reverse)
+            return None
+
+        if 'create_time' in static:
+            static['create_time'] = get_int(static['create_time'], default=0)
+            static['create_at'] = get_date(static['create_time'], out_fmt='iso')
+
+        return proc, static
+
+
+def get_stat(proc: psutil.Process) -> Optional[dict]:
+    """Linux /proc/<pid>/stat 的解析结果(不缓存, oneshot() 中只读取一次), 其他系统为 None"""
+    return proc._proc._parse_stat_file() if PROC_STAT else None
+
+
+def is_reused(proc: psutil.Process, static: dict, stat: Optional[dict]) -> bool:
+    """进程号是否已被新进程复用, 比较启动时间, 无 stat 时由 is_running() 创建新的进程对象比较"""
+    if stat is not None:
+        return stat.get('create_time') != static.get('_start')
+
+    return not proc.is_running()
+
+
+# 字段列表: 进程表
+_PROCESS_TABLES: Dict[Tuple[str, ...], ProcessTable] = {}
+
+
+def scan_process_info(fields: Optional[list] = None) -> list:
+    """遍历所有进程, 获取进程信息(增量进程表)"""
+    fields = fields if fields and isinstance(fields, list) else PROCESS_FIELDS
+    key = tuple(fields)
+    table = _PROCESS_TABLES.get(key)
+    if table is None:
+        table = _PROCESS_TABLES[key] = ProcessTable(fields)
+
+    return table.scan()
+
+
+def select_process_info(
+        pinfo_list: list,
+        target: Optional[list] = None,
+        fields: Optional[list] = None,
+        *,
+        orderby: Optional[Union[str, List[str]]] = None,
+        reverse=True,
+        limit: int = 0,
+) -> list:
+    """
+    从进程列表中筛选进程信息
+
+    :param pinfo_list: 进程列表
+    :param target: 指定进程名(默认所有进程)
+    :param fields: 指定字段(默认所有字段), 生成新的进程信息字典
+    :param orderby: 排序字段
+    :param reverse: 是否倒序
+    :param limit: 数量限制(排序后), 0 为不限制
+    :return:
+    """
+    if target and isinstance(target, list):
+        pinfo_list = [x for x in pinfo_list if x.get('name') in target]
+
+    if orderby and pinfo_list:
+        orderby_list = orderby if isinstance(orderby, list) else [orderby]
+        orderby = [x for x in orderby_list if x in pinfo_list[0]]
+        if orderby:
+            pinfo_list = sorted(pinfo_list, key=itemgetter(*orderby), reverse=reverse)
+
+    if limit > 0:
+        pinfo_list = pinfo_list[:limit]
+
+    if fields:
+        pinfo_list = [{k: x[k] for k in fields if k in x} for x in pinfo_list]
 
     return pinfo_list
 
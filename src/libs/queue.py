@@ -0,0 +1,203 @@
+# -*- coding:utf-8 -*-
+"""
+    queue.py
+    ~~~~~~~~
+    有界数据通道, 支持队列满时的溢出策略和丢弃计数
+
+    :author: Fufu, 2022/8/15
+"""
+from asyncio import Queue
+from typing import Any, Callable, Dict, List, Optional
+from weakref import WeakSet
+
+from loguru import logger
+
+from .metric import MetricBatch, iter_metrics
+
+# 溢出策略: 阻塞生产者, 丢弃最旧数据, 丢弃最新数据, 仅保留报警数据
+POLICY_BLOCK = 'block'
+POLICY_DROP_OLDEST = 'drop_oldest'
+POLICY_DROP_NEWEST = 'drop_newest'
+POLICY_KEEP_ALARM = 'keep_alarm'
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST, POLICY_KEEP_ALARM)
+
+# 默认队列长度和溢出策略
+DEFAULT_MAXSIZE = 10000
+DEFAULT_POLICY = POLICY_DROP_OLDEST
+
+# 所有工作中的数据通道, 用于统计丢弃数量
+_QUEUES = WeakSet()
+
+
+class MetricQueue(Queue):
+    """
+    有界数据通道
+
+    - block: `await put()` 时阻塞生产者, 同步的 `put_nowait()` 无法阻塞, 队列满时丢弃最新数据
+    - drop_oldest: 丢弃队列中最旧的数据
+    - drop_newest: 丢弃当前待入队的数据
+    - keep_alarm: 丢弃非报警数据, 队列中全是报警数据时丢弃最旧的报警数据
+
+    数据可以是单个指标或指标批次, 丢弃数量按指标计数.
+
+    关闭信号等控制数据不会被丢弃, 队列满时为其丢弃最旧的数据.
+    """
+
+    def __init__(self, maxsize: int = 0, policy: str = DEFAULT_POLICY, *, name: str = '') -> None:
+        super().__init__(maxsize if maxsize > 0 else 0)
+        self.policy = policy if policy in POLICIES else DEFAULT_POLICY
+        self.name = name
+        # 丢弃的数据数量
+        self.dropped = 0
+        # 上一次统计时的丢弃数量
+        self.dropped_reported = 0
+        _QUEUES.add(self)
+
+    async def put(self, item: Any) -> None:
+        """入队, 仅 block 策略时等待队列空位"""
+        if self.policy == POLICY_BLOCK and not is_control(item):
+            return await super().put(item)
+
+        self.put_nowait(item)
+
+    def put_nowait(self, item: Any) -> None:
+        """入队, 队列满时按策略丢弃数据, 不抛出 QueueFull"""
+        if self.full():
+            item = self.make_room(item)
+            if item is None:
+                return
+
+        super().put_nowait(item)
+
+    def make_room(self, item: Any) -> Any:
+        """按策略腾出空位, 返回可以入队的数据, None 表示已丢弃"""
+        if is_control(item) or self.policy == POLICY_DROP_OLDEST:
+            # 控制数据总是入队, 必要时丢弃最旧的数据
+            if self.evict(lambda x: not is_control(x)):
+                return item
+
+        elif self.policy == POLICY_KEEP_ALARM:
+            # 仅保留报警数据部分, 优先丢弃不含报警数据的旧数据
+            alarm_item = get_alarm_part(item)
+            if alarm_item is not None and (self.evict(lambda x: not is_control(x) and not has_alarm(x))
+                                           or self.evict(lambda x: not is_control(x))):
+                self.drop(item, count_metrics(item) - count_metrics(alarm_item))
+                return alarm_item
+
+        self.drop(item)
+        return None
+
+    def evict(self, match: Callable[[Any], bool]) -> bool:
+        """丢弃队列中第一个(最旧的)匹配的数据"""
+        for i, x in enumerate(self._queue):
+            if match(x):
+                del self._queue[i]
+                self.drop(x)
+                self.task_done()
+                return True
+
+        return False
+
+    def drop(self, item: Any, count: Optional[int] = None) -> None:
+        """丢弃数据并计数(按指标数量)"""
+        if count is None:
+            count = count_metrics(item)
+        if count <= 0:
+            return
+
+        self.dropped == 0 and logger.warning(f'queue {self.name} is full({self.maxsize}), policy: {self.policy}')
+        self.dropped += count
+
+
+class QueueFanout:
+    """数据分发通道, 写入的数据分发到多个数据通道(自身不存储数据)"""
+
+    def __init__(self, queues: Optional[List[Queue]] = None) -> None:
+        self.queues = list(queues) if queues else []
+
+    async def put(self, item: Any) -> None:
+        """分发数据, 按各通道的溢出策略等待或丢弃"""
+        for q in self.queues:
+            await q.put(item)
+
+    def put_nowait(self, item: Any) -> None:
+        """分发数据"""
+        for q in self.queues:
+            q.put_nowait(item)
+
+
+def is_control(item: Any) -> bool:
+    """是否为控制数据(如: 插件关闭信号, 处理链停止信号)"""
+    return getattr(item, 'is_closed', False) or getattr(item, 'is_stopped', False)
+
+
+def is_alarm(item: Any) -> bool:
+    """是否为报警数据"""
+    return getattr(item, 'tag', '') == 'alarm'
+
+
+def has_alarm(item: Any) -> bool:
+    """是否包含报警数据(单个指标或批次)"""
+    return any(is_alarm(x) for x in iter_metrics(item))
+
+
+def get_alarm_part(item: Any) -> Any:
+    """获取数据中的报警和控制数据部分, 没有时返回 None"""
+    if isinstance(item, MetricBatch):
+        batch = item.filter(lambda x: is_alarm(x) or is_control(x))
+        return batch if batch else None
+
+    return item if is_alarm(item) or is_control(item) else None
+
+
+def count_metrics(item: Any) -> int:
+    """数据中的指标数量"""
+    return len(item) if isinstance(item, MetricBatch) else 1
+
+
+def new_queue(conf: Any, stage: str, name: str = '') -> MetricQueue:
+    """
+    按配置生成数据通道
+    优先级: main|queue|{stage} > main|queue > 默认值
+
+    :param conf: 系统配置
+    :param stage: 阶段名称, 如: input, processor, aggs, output
+    :param name: 通道名称, 用于统计
+    :return:
+    """
+    maxsize = conf.get_conf_value('main|queue|maxsize', DEFAULT_MAXSIZE)
+    policy = conf.get_conf_value('main|queue|policy', DEFAULT_POLICY)
+    maxsize = conf.get_conf_value(f'main|queue|{stage}|maxsize', maxsize)
+    policy = conf.get_conf_value(f'main|queue|{stage}|policy', policy)
+
+    return MetricQueue(maxsize, policy, name=name or stage)
+
+
+def get_queue_stats(*, only_new: bool = False) -> Dict[str, int]:
+    """
+    获取各数据通道的丢弃数量
+
+    :param only_new: 仅返回上次统计后有新增丢弃的通道(新增数量)
+    :return:
+    """
+    stats = {}
+    for q in list(_QUEUES):
+        dropped = q.dropped - q.dropped_reported if only_new else q.dropped
+        if only_new:
+            q.dropped_reported = q.dropped
+        if dropped or not only_new:
+            stats[q.name] = stats.get(q.name, 0) + dropped
+
+    return stats
+
+
+def get_queue_pending() -> int:
+    """各数据通道中未处理的指标数量(不含控制数据)"""
+    return sum(1 for q in list(_QUEUES) for x in q._queue for m in iter_metrics(x) if not is_control(m))
+
+
+def log_queue_stats() -> Optional[Dict[str, int]]:
+    """记录新增的丢弃数量"""
+    stats = get_queue_stats(only_new=True)
+    stats and logger.warning(f'queue dropped: {stats}')
+    return stats
@@ -0,0 +1,183 @@
+# -*- coding:utf-8 -*-
+"""
+    scheduler.py
+    ~~~~~~~~
+    定时任务调度器, 所有周期任务共用一个定时器(最小堆), 支持整点对齐, 错峰偏移, 错过周期计数
+
+    :author: Fufu, 2022/8/23
+"""
+import socket
+import time
+import zlib
+from asyncio import AbstractEventLoop, TimerHandle, get_running_loop
+from heapq import heappop, heappush
+from itertools import count
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from loguru import logger
+
+# 错峰偏移按主机名区分, 避免所有主机在同一时刻采集和推送
+HOSTNAME = socket.gethostname()
+
+
+class Job:
+    """周期任务"""
+
+    __slots__ = ('name', 'callback', 'interval', 'align', 'offset', 'due', 'runs', 'missed', 'cancelled')
+
+    def __init__(
+            self,
+            name: str,
+            callback: Callable[[], Optional[bool]],
+            interval: Union[float, Callable[[], float]],
+            align: bool,
+            offset: float,
+    ) -> None:
+        # 任务名称, 回调函数(返回 False 时不再调度), 周期(秒, 或返回周期的函数, 每次调度时获取)
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        # 是否按周期对齐到整点(如: 60 秒对齐到每分钟 :00), 对齐后的偏移秒数
+        self.align = align
+        self.offset = offset
+        # 下次执行时间(事件循环单调时间), 执行次数, 错过的周期数
+        self.due = 0.0
+        self.runs = 0
+        self.missed = 0
+        self.cancelled = False
+
+    def get_interval(self) -> float:
+        """当前周期(秒)"""
+        interval = self.interval() if callable(self.interval) else self.interval
+        return max(float(interval), 0.001)
+
+    def next_due(self, now: float, wall: Optional[float] = None) -> float:
+        """
+        计算下次执行时间, 记录错过的周期数(执行时间比计划时间晚一个周期以上)
+
+        :param now: 当前单调时间(loop.time())
+        :param wall: 当前时间戳, 默认为 time.time(), 仅用于计算到下一个对齐时间点的距离
+        :return: 下次执行的单调时间
+        """
+        interval = self.get_interval()
+        missed = int((now - self.due) // interval)
+        if missed > 0:
+            self.missed += missed
+            logger.warning(f'scheduler job {self.name} missed {missed} ticks, total: {self.missed}')
+
+        if self.align:
+            # 下一个对齐时间点(墙上时间), 换算为单调时间, 系统时间跳变不影响已排定的任务
+            wall = time.time() if wall is None else wall
+            return now + (wall - self.offset) // interval * interval + interval + self.offset - wall
+
+        return self.due + interval * (max(missed, 0) + 1)
+
+    def cancel(self) -> None:
+        """取消任务"""
+        self.cancelled = True
+
+
+class Scheduler:
+    """
+    定时任务调度器
+
+    所有任务按下次执行时间放入最小堆, 事件循环中只有一个定时器(最早到期的任务),
+    到期时依次执行回调并重新入堆. 回调为普通函数, 应立即返回, 耗时操作需自行创建协程任务.
+    执行时间使用事件循环的单调时间(系统时间回拨时不会停顿), 仅整点对齐时参考系统时间.
+    """
+
+    def __init__(self) -> None:
+        # 最小堆: (下次执行时间, 序号, 任务)
+        self.heap: List[Tuple[float, int, Job]] = []
+        self.seq = count()
+        self.loop: Optional[AbstractEventLoop] = None
+        self.timer: Optional[TimerHandle] = None
+
+    def add(
+            self,
+            name: str,
+            callback: Callable[[], Optional[bool]],
+            interval: Union[float, Callable[[], float]],
+            *,
+            align: bool = True,
+            splay: float = 0.0,
+            immediate: bool = True,
+    ) -> Job:
+        """
+        添加周期任务
+
+        :param name: 任务名称, 同时用于计算错峰偏移
+        :param callback: 回调函数, 返回 False 时不再调度
+        :param interval: 周期(秒), 或返回周期的函数(配置热加载)
+        :param align: 是否按周期对齐到整点
+        :param splay: 错峰范围(秒), 按主机名和任务名称固定偏移 [0, splay), 不同主机的同名任务错开
+        :param immediate: 是否立即执行第一次
+        :return:
+        """
+        loop = get_running_loop()
+        if loop is not self.loop:
+            # 新的事件循环, 旧任务失效
+            self.heap.clear()
+            self.timer = None
+            self.loop = loop
+
+        job = Job(name, callback, interval, align, get_offset(f'{HOSTNAME}|{name}', splay))
+        job.due = loop.time()
+        if not immediate:
+            job.due = job.next_due(job.due)
+        self.push(job)
+
+        return job
+
+    def push(self, job: Job) -> None:
+        """任务入堆, 必要时提前定时器"""
+        heappush(self.heap, (job.due, next(self.seq), job))
+        if self.heap[0][2] is job:
+            self.arm()
+
+    def arm(self) -> None:
+        """按最早到期的任务设置定时器"""
+        self.timer and self.timer.cancel()
+        self.timer = None
+        while self.heap and self.heap[0][2].cancelled:
+            heappop(self.heap)
+        if self.heap:
+            self.timer = self.loop.call_at(self.heap[0][0], self.fire)
+
+    def fire(self) -> None:
+        """执行到期的任务"""
+        self.timer = None
+        now = self.loop.time()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, job = heappop(self.heap)
+            if job.cancelled:
+                continue
+
+            job.runs += 1
+            try:
+                if job.callback() is False:
+                    continue
+            except Exception as e:
+                logger.error(f'scheduler job {job.name} error: {e}')
+
+            if not job.cancelled:
+                job.due = job.next_due(now)
+                heappush(self.heap, (job.due, next(self.seq), job))
+
+        self.arm()
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """各任务的执行次数和错过的周期数"""
+        return {x.name: {'runs': x.runs, 'missed': x.missed} for _, _, x in self.heap if not x.cancelled}
+
+
+def get_offset(name: str, splay: float) -> float:
+    """按名称计算固定的错峰偏移秒数: [0, splay)"""
+    if splay <= 0:
+        return 0.0
+
+    return zlib.crc32(name.encode('utf-8')) % 10000 / 10000 * splay
+
+
+# 进程内共享的调度器
+SCHEDULER = Scheduler()
@@ -0,0 +1,230 @@
+# -*- coding:utf-8 -*-
+"""
+    spool.py
+    ~~~~~~~~
+    磁盘缓存(预写日志), 数据按序写入段文件, 确认后删除, 支持重启后继续读取
+
+    :author: Fufu, 2022/8/21
+"""
+import mmap
+import os
+import zlib
+from struct import Struct
+from threading import Lock
+from typing import Iterator, List, Optional, Tuple
+
+from loguru import logger
+
+# 记录头: 魔数, 序号, 数据长度, CRC32
+HEADER = Struct('<4sQII')
+MAGIC = b'PAS1'
+
+# 段文件扩展名
+SEGMENT_EXT = '.seg'
+
+
+class Spool:
+    """
+    磁盘缓存
+
+    - 段文件: {path}/{序号}.seg, 序号为段内第一条记录的序号, 记录为: 记录头 + 数据
+    - 游标文件: {path}/cursor, 已确认的最后一条记录的序号
+    - 读取时使用内存映射, 每次仅复制一条记录的数据
+    - 总大小超过上限时, 丢弃最旧的段文件
+
+    线程安全, 文件读写为阻塞操作, 协程中应使用线程执行.
+    """
+
+    def __init__(self, path: str, *, max_bytes: int = 256 << 20, segment_bytes: int = 16 << 20) -> None:
+        self.path = path
+        self.max_bytes = max(max_bytes, 1 << 20)
+        self.segment_bytes = max(min(segment_bytes, self.max_bytes // 4), 1 << 16)
+        self.cursor_file = os.path.join(path, 'cursor')
+        self.lock = Lock()
+        os.makedirs(path, exist_ok=True)
+
+        # 段文件: [(起始序号, 文件路径)]
+        self.segments = self.load_segments()
+        self.size = sum(os.path.getsize(x) for _, x in self.segments)
+
+        # 下一条记录的序号
+        self.next_seq = self.recover()
+        # 已确认的最后一条记录的序号
+        self.acked = self.load_cursor()
+
+        # 写入中的段文件
+        self.writer = None
+        self.writer_path = ''
+        self.writer_size = 0
+
+        # 读取位置: (段文件, 偏移量), 未确认的记录: (序号, 段文件, 下一条记录的偏移量)
+        self.read_pos = None
+        self.unacked = None
+
+    @property
+    def pending(self) -> int:
+        """待确认的记录数量"""
+        return self.next_seq - self.acked - 1
+
+    def append(self, data: bytes) -> int:
+        """追加记录, 返回记录序号"""
+        with self.lock:
+            if self.writer is None or self.writer_size >= self.segment_bytes:
+                self.rotate()
+
+            seq = self.next_seq
+            record = HEADER.pack(MAGIC, seq, len(data), zlib.crc32(data)) + data
+            self.writer.write(record)
+            self.writer.flush()
+            self.next_seq += 1
+            self.writer_size += len(record)
+            self.size += len(record)
+            self.trim()
+
+            return seq
+
+    def peek(self) -> Optional[Tuple[int, bytes]]:
+        """读取最旧的未确认记录: (序号, 数据), 没有时返回 None"""
+        with self.lock:
+            while self.segments:
+                if self.read_pos is None or self.read_pos[0] != self.segments[0][1]:
+                    self.read_pos = (self.segments[0][1], 0)
+
+                path, offset = self.read_pos
+                for seq, offset, data in iter_segment(path, offset):
+                    if seq > self.acked:
+                        self.unacked = (seq, path, offset)
+                        return seq, data
+                    self.read_pos = (path, offset)
+
+                if path == self.writer_path:
+                    return None
+
+                # 段文件已读完(或记录损坏), 读取下一段文件
+                self.remove_segment()
+
+            return None
+
+    def ack(self, seq: int) -> None:
+        """确认记录已处理"""
+        with self.lock:
+            if self.unacked and self.unacked[0] == seq:
+                self.read_pos = self.unacked[1:]
+                self.unacked = None
+            self.acked = max(self.acked, seq)
+            self.save_cursor()
+
+    def close(self) -> None:
+        """关闭段文件"""
+        with self.lock:
+            self.writer and self.writer.close()
+            self.writer = None
+            self.writer_path = ''
+
+    def rotate(self) -> None:
+        """生成新的段文件"""
+        self.writer and self.writer.close()
+        self.writer_path = os.path.join(self.path, f'{self.next_seq:020d}{SEGMENT_EXT}')
+        self.writer = open(self.writer_path, 'ab')
+        self.writer_size = 0
+        self.segments.append((self.next_seq, self.writer_path))
+
+    def trim(self) -> None:
+        """超过大小上限时丢弃最旧的段文件(不含写入中的段文件)"""
+        while self.size > self.max_bytes and len(self.segments) > 1:
+            dropped = self.segments[1][0] - max(self.segments[0][0], self.acked + 1)
+            self.remove_segment()
+            dropped > 0 and logger.warning(f'spool {self.path} is full({self.max_bytes}), dropped: {dropped}')
+
+    def remove_segment(self) -> None:
+        """删除最旧的段文件, 其中的记录视为已确认"""
+        _, path = self.segments.pop(0)
+        try:
+            self.size -= os.path.getsize(path)
+            os.remove(path)
+        except OSError as e:
+            logger.error(f'spool remove segment error: {path}, {e}')
+
+        acked = self.segments[0][0] - 1 if self.segments else self.next_seq - 1
+        if acked > self.acked:
+            self.acked = acked
+            self.save_cursor()
+        self.read_pos = None
+        self.unacked = None
+
+    def load_segments(self) -> List[Tuple[int, str]]:
+        """按序号加载已有的段文件"""
+        segments = []
+        for name in os.listdir(self.path):
+            seq, ext = os.path.splitext(name)
+            if ext == SEGMENT_EXT and seq.isdigit():
+                segments.append((int(seq), os.path.join(self.path, name)))
+
+        return sorted(segments)
+
+    def recover(self) -> int:
+        """检查最后一个段文件, 截断不完整的记录, 返回下一条记录的序号"""
+        if not self.segments:
+            return self.load_cursor() + 1
+
+        next_seq, path = self.segments[-1]
+        offset = 0
+        for seq, offset, _ in iter_segment(path):
+            next_seq = seq + 1
+
+        size = os.path.getsize(path)
+        if size > offset:
+            logger.warning(f'spool truncate segment: {path}, {size} -> {offset}')
+            os.truncate(path, offset)
+            self.size -= size - offset
+
+        return next_seq
+
+    def load_cursor(self) -> int:
+        """加载已确认的序号, 不小于第一个段文件起始序号 - 1"""
+        try:
+            with open(self.cursor_file, 'r') as f:
+                acked = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            acked = 0
+
+        if self.segments:
+            return max(acked, self.segments[0][0] - 1)
+
+        return acked
+
+    def save_cursor(self) -> None:
+        """保存已确认的序号"""
+        tmp_file = f'{self.cursor_file}.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(str(self.acked))
+        os.replace(tmp_file, self.cursor_file)
+
+
+def iter_segment(path: str, offset: int = 0) -> Iterator[Tuple[int, int, bytes]]:
+    """
+    按序读取段文件中的记录(内存映射), 遇到不完整或损坏的记录时停止
+
+    :param path: 段文件路径
+    :param offset: 起始位置
+    :return: (序号, 下一条记录的位置, 数据)
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= offset:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while offset + HEADER.size <= size:
+                magic, seq, length, crc = HEADER.unpack_from(mm, offset)
+                start = offset + HEADER.size
+                end = start + length
+                if magic != MAGIC or end > size:
+                    break
+
+                data = mm[start:end]
+                if zlib.crc32(data) != crc:
+                    break
+
+                offset = end
+                yield seq, offset, data
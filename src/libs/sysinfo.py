@@ -0,0 +1,151 @@
+# -*- coding:utf-8 -*-
+"""
+    sysinfo.py
+    ~~~~~~~~
+    系统状态快照, 在专用线程中每周期采集一次, 供 cpu, mem, process, disk 等采集插件共用
+
+    :author: Fufu, 2022/8/24
+"""
+import time
+from asyncio import Future, gather, get_running_loop
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import psutil
+from loguru import logger
+
+from .helper import get_round
+from .procfs import PROCFS
+from .psutil import scan_process_info, to_dict
+
+
+def collect_cpu() -> dict:
+    """CPU 状态, Linux 优先读取 /proc/stat"""
+    try:
+        loadavg = psutil.getloadavg()
+    except Exception:
+        loadavg = [0]
+
+    cpu = PROCFS.read_cpu()
+    if cpu:
+        cpu['loadavg'] = loadavg
+        return cpu
+
+    return {
+        # CPU 逻辑个数, 物理个数
+        'logical_count': psutil.cpu_count(),
+        'count': psutil.cpu_count(logical=False),
+        # CPU 总使用率, 单核使用率(距上次采集)
+        'percent': psutil.cpu_percent(interval=None),
+        'percent_percpu': psutil.cpu_percent(interval=None, percpu=True),
+        # CPU 运行时间, 运行时间比例
+        'times': {k: get_round(v) for k, v in to_dict(psutil.cpu_times()).items()},
+        'times_percent': to_dict(psutil.cpu_times_percent()),
+        # CPU 统计信息
+        'stats': to_dict(psutil.cpu_stats()),
+        # 1, 5, 15 分钟系统平均负载
+        'loadavg': loadavg,
+    }
+
+
+def collect_mem() -> dict:
+    """内存状态, Linux 优先读取 /proc/meminfo"""
+    return PROCFS.read_meminfo() or to_dict(psutil.virtual_memory())
+
+
+def collect_disk() -> list:
+    """可写分区(使用情况可能因挂载点无响应而阻塞, 由 diskusage 单独探测)"""
+    return [to_dict(x) for x in psutil.disk_partitions() if str(x.opts).startswith('rw,')]
+
+
+def collect_disk_io() -> dict:
+    """磁盘 IO 计数: {设备: 计数}"""
+    return {k: to_dict(v) for k, v in (psutil.disk_io_counters(perdisk=True) or {}).items()}
+
+
+# 快照内容: 名称: 采集函数
+COLLECTORS: Dict[str, Callable[[], Any]] = {
+    'cpu': collect_cpu,
+    'mem': collect_mem,
+    'disk': collect_disk,
+    'disk_io': collect_disk_io,
+    'process': scan_process_info,
+}
+
+
+class SystemSnapshot:
+    """
+    系统状态快照
+
+    快照按内容(cpu, mem, disk, disk_io, process)分别缓存, 在有效期内多个插件读取同一份数据,
+    同一内容正在采集时等待该次采集结果, 所有采集在同一个专用线程中依次执行.
+    """
+
+    def __init__(self) -> None:
+        # 专用采集线程
+        self.executor: Optional[ThreadPoolExecutor] = None
+        # 名称: (采集时间, 数据)
+        self.cache: Dict[str, Tuple[float, Any]] = {}
+        # 名称: 采集中的任务
+        self.pending: Dict[str, Future] = {}
+
+    async def get(self, *names: str, max_age: float = 5.0) -> Dict[str, Any]:
+        """
+        获取快照数据, 超过有效期时重新采集
+
+        :param names: 快照内容名称, 如: cpu, process
+        :param max_age: 有效期(秒), 通常为采集周期的一半, 同一周期内的插件共用一次采集结果
+        :return: {名称: 数据}, 采集失败时数据为 None
+        """
+        loop = get_running_loop()
+        now = time.monotonic()
+        result = {}
+        waiting = {}
+        missing = []
+        for name in names:
+            cached = self.cache.get(name)
+            if cached and now - cached[0] < max_age:
+                result[name] = cached[1]
+                continue
+            fut = self.pending.get(name)
+            if fut and fut.get_loop() is loop and not fut.done():
+                waiting[name] = fut
+            else:
+                missing.append(name)
+
+        if missing:
+            fut = loop.run_in_executor(self.get_executor(), self.collect, tuple(missing))
+            for name in missing:
+                self.pending[name] = fut
+                waiting[name] = fut
+
+        for name, data in zip(waiting, await gather(*waiting.values())):
+            result[name] = data[name]
+
+        return result
+
+    def collect(self, names: Tuple[str, ...]) -> Dict[str, Any]:
+        """在采集线程中依次采集"""
+        result = {}
+        for name in names:
+            start = time.perf_counter()
+            try:
+                result[name] = COLLECTORS[name]()
+            except Exception as e:
+                logger.error(f'snapshot {name} error: {e}')
+                result[name] = None
+                continue
+            self.cache[name] = (time.monotonic(), result[name])
+            logger.debug(f'snapshot {name} end, cost: {time.perf_counter() - start:.6}')
+
+        return result
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+
+        return self.executor
+
+
+# 进程内共享的系统状态快照
+SYSTEM_SNAPSHOT = SystemSnapshot()
@@ -6,36 +6,84 @@
 
     :author: Fufu, 2021/6/7
 """
-from typing import Any
+from collections import Counter
+from typing import Any, Dict
 
 from loguru import logger
 
-from ..libs.metric import Metric
+from ..libs.metric import Metric, MetricBatch, iter_metrics
 from ..libs.plugin import BasePlugin
 
+# 数据统计项: delivered 已发布, spooled 写入磁盘缓存, dropped 丢弃
+OUTPUT_STATS_KEYS = ('delivered', 'spooled', 'dropped')
+
+# 各输出插件的数据统计: {'插件名.统计项': 数量}, 如: es.delivered
+OUTPUT_STATS = Counter()
+
 
 class OutputPlugin(BasePlugin):
     """数据发布插件基类"""
 
     module = 'output'
 
+    # 是否为共享的公共输出插件(数据来自所有插件, 不因单个插件关闭而退出)
+    shared = False
+
     async def run(self) -> None:
         """数据打包并提交发布"""
         logger.debug(f'{self.module}.{self.name}({self.alias}) is working')
         is_closed = False
         while not is_closed:
-            # 取队列数据
-            metric = await self.in_queue.get()
-            is_closed = metric.is_closed
+            # 取队列数据(单个指标或批次)
+            item = await self.in_queue.get()
+            if item.is_stopped:
+                # 程序退出, 已处理完之前的数据
+                self.in_queue.task_done()
+                break
+
+            if self.shared and item.is_closed:
+                # 共享插件忽略单个插件的关闭信号
+                item = item.filter(lambda x: not x.is_closed) if isinstance(item, MetricBatch) else None
+                if not item:
+                    self.in_queue.task_done()
+                    continue
+
+            is_closed = item.is_closed
 
             # 数据传递
-            self.out_queue and self.out_queue.put_nowait(metric)
+            self.out_queue and await self.out_queue.put(item)
 
-            await self.write(metric)
+            await self.write_batch(item) if isinstance(item, MetricBatch) else await self.write(item)
+            self.count('delivered', sum(1 for x in iter_metrics(item) if not x.is_closed))
             self.in_queue.task_done()
 
         logger.debug(f'{self.module}.{self.name}({self.alias}) is closed')
 
+    def is_passthrough(self) -> bool:
+        """未重写发布方法时为直通插件"""
+        cls = type(self)
+        return cls.run is OutputPlugin.run and cls.write is OutputPlugin.write \
+            and cls.write_batch is OutputPlugin.write_batch
+
+    def count(self, key: str, num: int = 1) -> None:
+        """数据统计(按输出插件), 程序退出时汇总"""
+        OUTPUT_STATS[f'{self.name}.{key}'] += num
+
     async def write(self, metric: Metric) -> Any:
         """写入数据"""
         pass
+
+    async def write_batch(self, batch: MetricBatch) -> Any:
+        """批量写入数据, 默认逐个写入"""
+        for metric in batch:
+            await self.write(metric)
+
+
+def get_output_stats() -> Dict[str, Dict[str, int]]:
+    """各输出插件的数据统计: {插件名: {delivered, spooled, dropped}}"""
+    stats = {}
+    for k, v in OUTPUT_STATS.items():
+        name, _, key = k.rpartition('.')
+        stats.setdefault(name, dict.fromkeys(OUTPUT_STATS_KEYS, 0))[key] = v
+
+    return stats
@@ -7,13 +7,28 @@
     :author: Fufu, 2021/6/7
 """
 import asyncio
-from typing import List
+import gzip
+import os
+import random
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
 
 from loguru import logger
 
 from . import OutputPlugin
-from ..libs.metric import Metric
+from ..libs.breaker import CircuitBreaker
+from ..libs.encoder import dumpb, encode_doc, join_bulk, loads
+from ..libs.metric import Metric, iter_metrics
+from ..libs.helper import get_int
 from ..libs.net import request
+from ..libs.scheduler import SCHEDULER
+from ..libs.spool import Spool
+
+# 请求体压缩方法: Content-Encoding
+COMPRESSORS = {
+    'gzip': lambda data, level: gzip.compress(data, compresslevel=level),
+    'deflate': lambda data, level: zlib.compress(data, level),
+}
 
 
 class Es(OutputPlugin):
@@ -25,44 +40,307 @@ class Es(OutputPlugin):
     es_api = 'http://data-router.demo.com:6600/v1/monitor_metric/bulk'
     es_index = 'monitor_metric'
 
+    # 缺省的批量提交阈值: 数据条数, 数据字节数(编码后, 压缩前)
+    max_batch_docs = 5000
+    max_batch_bytes = 5 * 1024 * 1024
+
+    def __init__(self, conf: Any, in_queue: Optional[asyncio.Queue], out_queue: Optional[asyncio.Queue]) -> None:
+        super().__init__(conf, in_queue, out_queue)
+
+        # 待提交的数据(入缓冲区时即编码): {接口: [数据]}
+        self.buffer: Dict[str, List[bytes]] = {}
+        self.buffer_docs = 0
+        self.buffer_bytes = 0
+
+        # 数据标识对应的接口, 每次提交后重新获取
+        self.api_urls = {}
+
+        # 磁盘缓存, 投递失败的数据写入缓存, 接口恢复后按序重放
+        self.spool = None
+        self.replay_task = None
+
+        # 进行中的提交任务, 定时推送任务
+        self.tasks = set()
+        self.flush_task = None
+
+        # 插件是否已关闭(关闭后不再定时推送和重放磁盘缓存)
+        self.closed = False
+
+        # 并发提交请求数上限, 达到上限时暂停读取队列, 积压数据按队列溢出策略处理
+        self.writers = asyncio.Semaphore(max(self.get_plugin_conf_value('max_writers', 4), 1))
+
+        # 熔断器, 熔断期间数据直接写入磁盘缓存
+        self.breaker = CircuitBreaker(
+            self.get_plugin_conf_value('breaker_failures', 5),
+            self.get_plugin_conf_value('breaker_timeout', 30.0),
+        )
+
     async def run(self) -> None:
-        """数据打包并提交发布"""
+        """数据打包并提交发布, 由调度器定时提交, 数据量达到阈值时立即提交"""
         logger.debug(f'{self.module}.{self.name}({self.alias}) is working')
+        job = SCHEDULER.add(
+            f'{self.module}.{self.name}.{self.alias}',
+            self.tick,
+            lambda: self.get_interval(30),
+            immediate=False,
+            **self.get_schedule_conf(),
+        )
         is_closed = False
-        while not is_closed:
-            # 定时推送
-            await asyncio.sleep(self.get_interval(30))
-
-            # 取队列数据
-            metrics = []
-            while not self.in_queue.empty():
-                metric = self.in_queue.get_nowait()
-                metrics.append(metric)
+        try:
+            while not is_closed:
+                # 取队列数据(单个指标或批次)
+                item = await self.in_queue.get()
+                for x in iter_metrics(item):
+                    x.is_closed or x.is_stopped or self.add(x)
+
+                # 程序退出(停止信号), 或插件关闭(共享插件忽略单个插件的关闭信号)
+                is_closed = item.is_stopped or (item.is_closed and not self.shared)
+
                 # 数据传递
-                self.out_queue and self.out_queue.put_nowait(metric)
+                self.out_queue and not item.is_stopped and self.out_queue.put_nowait(item)
                 self.in_queue.task_done()
 
-            # 执行推送
-            metrics and asyncio.create_task(self.write(metrics))
+                # 达到批量提交阈值
+                not is_closed and self.is_full() and await self.flush()
+
+            await self.close()
+        except asyncio.CancelledError:
+            # 程序退出超时被取消(如: 提交时等待空闲请求, 队列积压), 数据直接写入磁盘缓存
+            await self.abort()
+            raise
+        finally:
+            job.cancel()
 
         logger.debug(f'{self.module}.{self.name}({self.alias}) is closed')
 
-    async def write(self, metrics: List[Metric]) -> None:
-        """写入数据"""
-        # 根据 tag 对应接口和数据
-        post_data = {}
-        for x in metrics:
-            k = f'{x.tag}.{x.name}'
-            if k not in post_data:
-                post_data[k] = {
-                    'api_url': self.get_es_api(x.tag),
-                    'data': [],
-                }
-            post_data[k]['data'].append(x)
-
-        for k, d in post_data.items():
-            resp = await request(d['api_url'], json=self.metrics_as_dict(d['data']))
-            logger.debug('es.post: {}, api_url: {}, resp: {}', k, d['api_url'], resp)
+    def tick(self) -> None:
+        """定时推送, 尝试重放磁盘缓存, 上一次定时推送仍在等待时跳过"""
+        if self.closed:
+            return
+
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self.flush())
+        self.start_replay()
+
+    def add(self, metric: Metric) -> None:
+        """编码数据并加入缓冲区"""
+        if metric.tag not in self.api_urls:
+            self.api_urls[metric.tag] = self.get_es_api(metric.tag)
+
+        doc = encode_doc(metric)
+        self.buffer.setdefault(self.api_urls[metric.tag], []).append(doc)
+        self.buffer_docs += 1
+        self.buffer_bytes += len(doc)
+
+    def is_full(self) -> bool:
+        """缓冲区是否达到批量提交阈值(数据条数或字节数), 阈值为 0 表示不限制"""
+        max_docs = self.get_plugin_conf_value('max_batch_docs', self.max_batch_docs)
+        max_bytes = self.get_plugin_conf_value('max_batch_bytes', self.max_batch_bytes)
+        return 0 < max_docs <= self.buffer_docs or 0 < max_bytes <= self.buffer_bytes
+
+    async def flush(self, *, limit: bool = True) -> List[asyncio.Task]:
+        """提交缓冲区中的数据, 每个接口一个请求, 并发请求数达到上限时等待(limit=False 时不限制)"""
+        buffer, self.buffer = self.buffer, {}
+        self.buffer_docs = self.buffer_bytes = 0
+        self.api_urls = {}
+
+        tasks = []
+        items = list(buffer.items())
+        for i, (api_url, docs) in enumerate(items):
+            try:
+                limit and await self.writers.acquire()
+            except asyncio.CancelledError:
+                # 未提交的数据放回缓冲区
+                for x in items[i:]:
+                    self.restore(*x)
+                raise
+            task = asyncio.create_task(self.post(api_url, docs))
+            limit and task.add_done_callback(lambda _: self.writers.release())
+            task.add_done_callback(self.tasks.discard)
+            self.tasks.add(task)
+            tasks.append(task)
+
+        return tasks
+
+    def restore(self, api_url: str, docs: List[bytes]) -> None:
+        """未提交的数据放回缓冲区(在新数据之前)"""
+        self.buffer[api_url] = docs + self.buffer.get(api_url, [])
+        self.buffer_docs += len(docs)
+        self.buffer_bytes += sum(len(x) for x in docs)
+
+    async def close(self) -> None:
+        """最后一次提交, 等待进行中的请求, 超时未完成的请求写入磁盘缓存"""
+        self.closed = True
+        self.replay_task and self.replay_task.cancel()
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            await asyncio.wait([self.flush_task])
+        await self.flush(limit=False)
+        tasks = set(self.tasks)
+        try:
+            tasks and await asyncio.wait(tasks, timeout=self.conf.get_conf_value('main|shutdown_timeout', 10.0))
+        finally:
+            pending = [x for x in tasks if not x.done()]
+            for task in pending:
+                task.cancel()
+            pending and await asyncio.wait(pending)
+            self.spool and self.spool.close()
+
+    async def abort(self) -> None:
+        """取消定时推送和进行中的请求(写入磁盘缓存), 缓冲区中的数据写入磁盘缓存"""
+        self.closed = True
+        self.replay_task and self.replay_task.cancel()
+        tasks = [x for x in (self.flush_task, *self.tasks) if x and not x.done()]
+        for task in tasks:
+            task.cancel()
+        tasks and await asyncio.wait(tasks)
+
+        buffer, self.buffer = self.buffer, {}
+        self.buffer_docs = self.buffer_bytes = 0
+        for api_url, docs in buffer.items():
+            self.save_nowait(api_url, *self.encode(docs), len(docs))
+        self.spool and self.spool.close()
+
+    async def post(self, api_url: str, docs: List[bytes]) -> None:
+        """提交数据到接口, 失败或熔断时写入磁盘缓存"""
+        body, headers = self.encode(docs)
+        try:
+            if self.breaker.allow():
+                try:
+                    status = await self.send(api_url, body, headers, self.get_plugin_conf_value('retry', 3))
+                except BaseException:
+                    # 异常或被取消时记为失败, 释放半开状态的探测请求
+                    self.breaker.record(False)
+                    raise
+                self.breaker.record(not is_retryable(status))
+                if is_ok(status):
+                    self.count('delivered', len(docs))
+                    self.start_replay()
+                    return
+                if not is_retryable(status):
+                    logger.error('es.post rejected: {}, status: {}, api_url: {}', len(docs), status, api_url)
+                    self.count('dropped', len(docs))
+                    return
+        except asyncio.CancelledError:
+            # 程序退出时未完成的请求, 直接写入磁盘缓存
+            self.save_nowait(api_url, body, headers, len(docs))
+            raise
+
+        await self.save(api_url, body, headers, len(docs))
+
+    async def save(self, api_url: str, body: bytes, headers: dict, docs: int) -> None:
+        """写入磁盘缓存(在线程中执行)"""
+        record = self.new_record(api_url, body, headers, docs)
+        record and await self.to_thread(self.spool.append, record)
+
+    def save_nowait(self, api_url: str, body: bytes, headers: dict, docs: int) -> None:
+        """写入磁盘缓存"""
+        record = self.new_record(api_url, body, headers, docs)
+        record and self.spool.append(record)
+
+    def new_record(self, api_url: str, body: bytes, headers: dict, docs: int) -> Optional[bytes]:
+        """生成磁盘缓存记录, 未开启磁盘缓存时丢弃数据"""
+        if self.get_spool() is None:
+            logger.warning('es.post dropped: {}, api_url: {}', docs, api_url)
+            self.count('dropped', docs)
+            return None
+
+        self.count('spooled', docs)
+        return dumpb({'url': api_url, 'headers': headers, 'docs': docs}) + b'\n' + body
+
+    async def send(self, api_url: str, body: bytes, headers: dict, retry: int = 0) -> int:
+        """
+        发送请求(按配置压缩请求体), 返回状态码
+        429/5xx 时重试, 指数退避 + 随机抖动, 429 时优先使用 Retry-After
+        """
+        headers = dict(headers)
+        encoding = self.get_plugin_conf_value('compress', '').lower()
+        if encoding in COMPRESSORS:
+            level = self.get_plugin_conf_value('compress_level', 6)
+            body = await self.to_thread(COMPRESSORS[encoding], body, level)
+            headers['Content-Encoding'] = encoding
+
+        backoff = self.get_plugin_conf_value('retry_backoff', 1.0)
+        backoff_max = self.get_plugin_conf_value('retry_backoff_max', 30.0)
+        attempt = 0
+        while True:
+            resp, status, resp_headers = await request(api_url, data=body, headers=headers, as_json=False)
+            logger.debug('es.post: {}, bytes: {}, api_url: {}, resp: {}', status, len(body), api_url, resp)
+            if attempt >= retry or not is_retryable(status):
+                return status
+
+            delay = min(backoff * 2 ** attempt, backoff_max)
+            delay = get_int(resp_headers.get('Retry-After'), 0) or delay / 2 + random.uniform(0, delay / 2)
+            await asyncio.sleep(min(delay, backoff_max))
+            attempt += 1
+
+    def start_replay(self) -> None:
+        """磁盘缓存中有数据时, 开始重放"""
+        if self.closed:
+            return
+
+        spool = self.get_spool()
+        if spool and spool.pending and (self.replay_task is None or self.replay_task.done()):
+            self.replay_task = asyncio.create_task(self.replay(spool))
+
+    async def replay(self, spool: Spool) -> None:
+        """按序重放磁盘缓存中的数据(限速), 失败时停止, 等待下次触发"""
+        rate = self.get_plugin_conf_value('spool_replay_rate', 10.0)
+        count = 0
+        while True:
+            record = await self.to_thread(spool.peek)
+            if record is None:
+                break
+
+            # 熔断期间停止重放, 冷却后第一个重放请求作为探测请求
+            if not self.breaker.allow():
+                break
+
+            seq, data = record
+            meta, _, body = data.partition(b'\n')
+            meta = loads(meta)
+            try:
+                status = await self.send(meta['url'], body, meta['headers'])
+            except BaseException:
+                self.breaker.record(False)
+                raise
+            self.breaker.record(not is_retryable(status))
+            if is_retryable(status):
+                break
+
+            if is_ok(status):
+                self.count('delivered', meta.get('docs', 0))
+            else:
+                logger.error('es.replay rejected: {}, status: {}', seq, status)
+                self.count('dropped', meta.get('docs', 0))
+            await self.to_thread(spool.ack, seq)
+            count += 1
+            rate > 0 and await asyncio.sleep(1 / rate)
+
+        count and logger.info(f'es spool replayed: {count}, pending: {spool.pending}')
+
+    def get_spool(self) -> Optional[Spool]:
+        """获取磁盘缓存, 目录: spool_dir/es.插件名"""
+        if self.spool is None and self.get_plugin_conf_value('spool', True):
+            path = self.get_plugin_conf_value('spool_dir', '') or os.path.join(self.conf.root_dir, 'log', 'spool')
+            self.spool = Spool(
+                os.path.join(path, f'{self.name}.{self.alias or "default"}'),
+                max_bytes=self.get_plugin_conf_value('spool_max_bytes', 256 << 20),
+                segment_bytes=self.get_plugin_conf_value('spool_segment_bytes', 16 << 20),
+            )
+
+        return self.spool
+
+    def encode(self, docs: List[bytes]) -> Tuple[bytes, dict]:
+        """
+        生成请求体和请求头
+        format: json 为 JSON 数组(默认); ndjson 为 ES bulk 接口格式, 每个数据前附加动作行
+        """
+        if self.get_plugin_conf_value('format', 'json') == 'ndjson':
+            action = self.get_plugin_conf_value('bulk_action', {'index': {}})
+            return join_bulk(docs, ndjson=True, action=action), {'Content-Type': 'application/x-ndjson'}
+
+        return join_bulk(docs), {'Content-Type': 'application/json'}
 
     def get_es_api(self, tag: str) -> str:
         """获取 ES 上报接口"""
@@ -70,3 +348,13 @@ class Es(OutputPlugin):
         es_api = self.get_plugin_conf_value('url', self.es_api).replace('{es_index}', es_index)
 
         return es_api
+
+
+def is_ok(status: int) -> bool:
+    """请求是否成功"""
+    return 200 <= status < 300
+
+
+def is_retryable(status: int) -> bool:
+    """请求失败是否可重试: 限流, 服务端错误, 请求异常(504)"""
+    return status == 429 or status >= 500
@@ -8,7 +8,7 @@
 """
 from loguru import logger
 
-from ..libs.metric import Metric
+from ..libs.metric import Metric, MetricBatch
 from ..libs.plugin import BasePlugin
 
 
@@ -25,19 +25,35 @@ class ProcessorPlugin(BasePlugin):
         logger.debug(f'{self.module}.{self.name}({self.alias}) is working')
         is_closed = False
         while not is_closed:
-            # 取队列数据
-            metric = await self.in_queue.get()
-            is_closed = metric.is_closed
-
-            # 数据处理
-            metric = await self.apply(metric)
+            # 取队列数据(单个指标或批次)
+            item = await self.in_queue.get()
+            is_closed = item.is_closed
+            if item.is_stopped:
+                # 处理链已重建, 传递停止信号后退出
+                self.last_stage or await self.out_queue.put(item)
+                self.in_queue.task_done()
+                break
+
+            # 数据处理, 关闭信号直接传递
+            if not is_closed:
+                item = await self.apply_batch(item) if isinstance(item, MetricBatch) else await self.apply(item)
 
             # 传递数据
-            self.out_queue.put_nowait(metric)
+            await self.out_queue.put(item)
             self.in_queue.task_done()
 
         logger.debug(f'{self.module}.{self.name}({self.alias}) is closed')
 
+    def is_passthrough(self) -> bool:
+        """未重写处理方法且未配置公共插件时为直通插件"""
+        cls = type(self)
+        return cls.apply is ProcessorPlugin.apply and cls.apply_batch is ProcessorPlugin.apply_batch \
+            and not self.has_common_plugin()
+
     async def apply(self, metric: Metric) -> Metric:
         """数据处理"""
         return await self.use_common_plugin(metric)
+
+    async def apply_batch(self, batch: MetricBatch) -> MetricBatch:
+        """批量数据处理, 默认逐个调用 apply"""
+        return MetricBatch([await self.apply(x) for x in batch])
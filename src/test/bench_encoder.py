@@ -0,0 +1,104 @@
+# -*- coding:utf-8 -*-
+"""
+    bench_encoder.py
+    ~~~~~~~~
+    JSON 编码器性能对比, 使用与实际采集数据结构相同的指标数据
+
+    python3 -m src.test.bench_encoder
+
+    :author: Fufu, 2022/8/19
+"""
+import json
+import timeit
+from random import randint, random
+from types import MappingProxyType
+
+from ..libs.encoder import BACKENDS, Encoder
+from ..libs.metric import Metric
+
+INFO = MappingProxyType({'node_ip': '192.168.1.100', 'host_name': 'WebServer'})
+
+
+def gen_metrics() -> dict:
+    """生成各插件的指标数据"""
+    cpu = Metric('cpu', {
+        'logical_count': 32,
+        'count': 16,
+        'percent': 12.3,
+        'percent_percpu': [round(random() * 100, 1) for _ in range(32)],
+        'max_percent': 99.1,
+        'times': {k: round(random() * 1e6, 2) for k in ('user', 'nice', 'system', 'idle', 'iowait', 'irq')},
+        'times_percent': {k: round(random() * 100, 1) for k in ('user', 'nice', 'system', 'idle', 'iowait')},
+        'stats': {'ctx_switches': 17157214700, 'interrupts': 14394108423, 'soft_interrupts': 18238331768},
+        'loadavg': [1.2, 0.8, 0.5],
+        'loadavg_precent': [3.75, 2.5, 1.56],
+        'loadavg_precent_1': 3.75,
+        'process_top': [{'pid': i, 'name': f'proc{i}', 'cpu_percent': 1.5} for i in range(5)],
+    }, info=INFO)
+    mem = Metric('mem', {
+        k: randint(1 << 20, 1 << 34) for k in ('total', 'available', 'used', 'free', 'active', 'inactive', 'cached')
+    }, info=INFO)
+    disk = [Metric('disk', {
+        'device': f'/dev/sd{chr(97 + i)}1', 'mountpoint': f'/data{i}', 'fstype': 'ext4', 'opts': 'rw,relatime',
+        'total': 42004086784, 'used': 22808981504, 'free': 17031004160, 'percent': 57.3,
+        'human_total': '39.1 GB', 'human_used': '21.2 GB', 'human_free': '15.9 GB',
+    }, info=INFO) for i in range(8)]
+    network = [Metric('network', {
+        'nic': f'eth{i}', 'interval': 60.01, 'isup': True, 'duplex': 2, 'speed': 10000, 'mtu': 1500,
+        'mac': '52:54:00:12:34:56', 'ipv4': f'10.0.0.{i}', 'bytes_sent': randint(1, 1 << 40),
+        'bytes_recv': randint(1, 1 << 40), 'packets_sent': randint(1, 1 << 30), 'packets_recv': randint(1, 1 << 30),
+        'bps_in': 123456.78, 'bps_out': 654321.0, 'pps_in': 1234, 'pps_out': 4321,
+        'human_kbps_in': '123.5 Kbps', 'human_kbps_out': '654.3 Kbps',
+    }, info=INFO) for i in range(16)]
+    curl = [Metric('curl', {
+        'tag': f'检查目标{i}', 'url': f'https://api{i}.demo.com/healthcheck', 'method': 'GET', 'host': '',
+        'response': '{"ok": 1, "msg": "正常"}' * 10, 'status': 200,
+        'headers': {'Server': 'nginx', 'Content-Type': 'application/json', 'Content-Length': '240'},
+    }, info=INFO) for i in range(200)]
+    process = Metric('process', {'pinfo_list': [{
+        'pid': i, 'ppid': 1, 'name': f'proc{i}', 'username': 'root', 'cpu_percent': 0.5,
+        'memory_percent': 0.12, 'exe': f'/usr/bin/proc{i}', 'num_threads': 4, 'create_time': 1636942839,
+        'create_at': '2021-11-15T10:20:39+08:00',
+    } for i in range(500)]}, info=INFO)
+
+    return {
+        'cpu': [cpu],
+        'mem': [mem],
+        'disk': disk,
+        'network': network,
+        'curl': curl,
+        'process': [process],
+    }
+
+
+def stdlib_as_dict(metrics: list) -> bytes:
+    """原实现: 先转为字典列表, 再整体编码"""
+    return json.dumps([m.as_dict for m in metrics]).encode('utf-8')
+
+
+def encoder_as_dict(encoder: Encoder, metrics: list) -> bytes:
+    """同一编码器, 逐个生成 as_dict 合并字典后编码(对比拼接编码)"""
+    return encoder.join_bulk([encoder.dumpb(m.as_dict) for m in metrics])
+
+
+def main(number: int = 200) -> None:
+    samples = gen_metrics()
+    samples['all'] = [m for x in samples.values() for m in x]
+    print(f'{"shape":<10}{"metrics":>8}{"bytes":>10}  {"encoder":<18}{"ms/op":>10}{"speedup":>10}')
+    for shape, metrics in samples.items():
+        base = timeit.timeit(lambda: stdlib_as_dict(metrics), number=number) / number * 1000
+        size = len(stdlib_as_dict(metrics))
+        print(f'{shape:<10}{len(metrics):>8}{size:>10}  {"json(as_dict)":<18}{base:>10.3f}{1:>10.2f}')
+        for backend in BACKENDS:
+            encoder = Encoder(backend)
+            for ndjson in (False, True):
+                name = f'{backend}{"(ndjson)" if ndjson else ""}'
+                cost = timeit.timeit(lambda: encoder.encode_bulk(metrics, ndjson=ndjson), number=number)
+                cost = cost / number * 1000
+                print(f'{"":<28}  {name:<18}{cost:>10.3f}{base / cost:>10.2f}')
+            cost = timeit.timeit(lambda: encoder_as_dict(encoder, metrics), number=number) / number * 1000
+            print(f'{"":<28}  {backend + "(as_dict)":<18}{cost:>10.3f}{base / cost:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+# -*- coding:utf-8 -*-
+"""
+    bench_procfs.py
+    ~~~~~~~~
+    内存, CPU, 网卡流量采集性能对比: psutil 与 /proc 快速采集(仅 Linux)
+
+    python3 -m src.test.bench_procfs
+
+    :author: Fufu, 2022/8/25
+"""
+import timeit
+
+import psutil
+
+from ..libs.helper import get_round
+from ..libs.procfs import PROCFS
+from ..libs.psutil import to_dict
+
+
+def psutil_mem() -> dict:
+    return to_dict(psutil.virtual_memory())
+
+
+def psutil_cpu() -> dict:
+    """同 sysinfo.collect_cpu() 的 psutil 实现(系统负载除外)"""
+    return {
+        'logical_count': psutil.cpu_count(),
+        'count': psutil.cpu_count(logical=False),
+        'percent': psutil.cpu_percent(interval=None),
+        'percent_percpu': psutil.cpu_percent(interval=None, percpu=True),
+        'times': {k: get_round(v) for k, v in to_dict(psutil.cpu_times()).items()},
+        'times_percent': to_dict(psutil.cpu_times_percent()),
+        'stats': to_dict(psutil.cpu_stats()),
+    }
+
+
+def psutil_net() -> dict:
+    return {nic: to_dict(data) for nic, data in psutil.net_io_counters(pernic=True).items()}
+
+
+def main(number: int = 2000) -> None:
+    if not PROCFS.enabled:
+        print('procfs is not available on this platform')
+        return
+
+    cases = {
+        'mem': (psutil_mem, PROCFS.read_meminfo),
+        'cpu': (psutil_cpu, PROCFS.read_cpu),
+        'network': (psutil_net, PROCFS.read_net_dev),
+    }
+    print(f'{"shape":<10}{"psutil us/op":>14}{"procfs us/op":>14}{"speedup":>10}')
+    for shape, (base_fn, fast_fn) in cases.items():
+        assert fast_fn() is not None, f'procfs {shape} unavailable'
+        base = timeit.timeit(base_fn, number=number) / number * 1e6
+        fast = timeit.timeit(fast_fn, number=number) / number * 1e6
+        print(f'{shape:<10}{base:>14.1f}{fast:>14.1f}{base / fast:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
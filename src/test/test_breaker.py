@@ -0,0 +1,42 @@
+# -*- coding:utf-8 -*-
+"""
+    test_breaker.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/22
+"""
+import time
+
+from ..libs.breaker import CircuitBreaker
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(2, 0.05)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+
+    # 冷却后仅放行一个探测请求
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.is_closed and breaker.allow() and breaker.failures == 0
+
+
+def test_circuit_breaker_lost_probe():
+    breaker = CircuitBreaker(1, 0.05)
+    breaker.record(False)
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()
+
+    # 探测请求未记录结果(调用方异常), 超过冷却时间后放行新的探测请求
+    time.sleep(0.06)
+    assert breaker.state == 'half_open' and breaker.allow() and not breaker.allow()
+    breaker.record(True)
+    assert breaker.is_closed
@@ -22,3 +22,26 @@ interval: 1000'''
     assert len(res) == 2
     assert isinstance(res.get('open'), list)
     assert 'cpu' in res.get('open', [])
+
+
+def test_conf_snapshot():
+    conf = Config()
+    conf.main = {'interval': 60, 'alarm': {'code': 'alarm'}}
+    conf.aggs = {'ping': {'alarm': {'loss': '10', 'target': {'a': {'loss': 20}}}}}
+    conf.snapshot = conf.new_snapshot()
+
+    assert conf.get_conf_value('main|interval', 0) == 60
+    assert conf.get_conf_value('main|interval', '') == '60'
+    assert conf.get_conf_value('aggs|ping|alarm|loss', -0.1) == 10.0
+    assert conf.get_conf_value('aggs|ping|alarm|loss', -0.1) == 10.0
+    assert conf.get_conf_value('aggs|ping|alarm|target|a|loss', -0.1) == 20.0
+    assert conf.get_conf_value('aggs|ping|alarm|average', -0.1) == -0.1
+    assert conf.get_conf_value('aggs|ping|alarm|loss|x', 1) == 1
+    assert conf.get_conf_value('aggs|ping', {}) == conf.aggs['ping']
+    assert conf.get_conf_value('aggs') is conf.aggs
+    assert conf.get_conf_value('nothing|x', 3) == 3
+
+    # 配置整体替换后缓存失效
+    conf.aggs = {'ping': {'alarm': {'loss': 30}}}
+    assert conf.get_conf_value('aggs|ping|alarm|loss', -0.1) == 30.0
+    assert conf.get_conf_value('main|interval', 0) == 60
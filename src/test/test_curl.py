@@ -0,0 +1,166 @@
+# -*- coding:utf-8 -*-
+"""
+    test_curl.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/27
+"""
+import asyncio
+import hashlib
+
+from aiohttp import web
+
+from ..aggs.curl import Curl as AggsCurl
+from ..conf.config import Config
+from ..input.curl import Curl
+from ..libs.metric import Metric
+from ..libs.net import BodyReader
+from ..libs.queue import MetricQueue
+
+
+async def start_server(peers: set) -> web.AppRunner:
+    async def handle(request):
+        peers.add(request.transport.get_extra_info('peername'))
+        return web.Response(text='ok')
+
+    async def handle_big(_request):
+        return web.Response(text='x' * 200000 + 'needle' + 'y' * 200000)
+
+    app = web.Application()
+    app.router.add_get('/', handle)
+    app.router.add_get('/big', handle_big)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', 0).start()
+    return runner
+
+
+def test_session_reuse():
+    async def run():
+        peers = set()
+        runner = await start_server(peers)
+        port = runner.addresses[0][1]
+        conf = Config()
+        conf.input = {'curl': {'worker_limit': 5, 'target': {
+            'a': {'url': f'http://127.0.0.1:{port}/'},
+        }}}
+        queue = MetricQueue()
+        plugin = Curl(conf, None, queue)
+
+        target = conf.input['curl']['target']['a']
+
+        # 多次采集复用同一连接
+        for _ in range(3):
+            await plugin.gather_target('a', target)
+        assert len(peers) == 1
+        session = plugin.session[2]
+        metric = queue.get_nowait()
+        assert metric.get('status') == 200
+        assert metric.get('time_connect') > 0 and metric.get('time_total') >= metric.get('time_ttfb') > 0
+        assert metric.get('conn_reused') is False
+        assert queue.get_nowait().get('conn_reused') is True
+
+        # 配置变化时重建会话, 旧会话关闭
+        conf.input['curl']['keepalive_timeout'] = 10
+        await plugin.gather_target('a', target)
+        assert plugin.session[2] is not session and session.closed
+        assert len(peers) == 2
+
+        # 每次使用新连接
+        target['fresh_connection'] = True
+        await plugin.gather_target('a', target)
+        await plugin.gather_target('a', target)
+        assert len(peers) == 4
+
+        await plugin.session[2].close()
+        await runner.cleanup()
+
+    asyncio.run(run())
+
+
+def test_target_jobs():
+    async def run():
+        conf = Config()
+        conf.main = {'interval': 60}
+        conf.plugins_open = {'curl'}
+        conf.input = {'curl': {'max_inflight': 2, 'target': {
+            'a': {'url': 'http://127.0.0.1:1/'},
+            'b': {'url': 'http://127.0.0.1:1/', 'interval': 10},
+            'c': {'url': ''},
+        }}}
+        plugin = Curl(conf, None, MetricQueue())
+        await plugin.run_gather()
+        assert set(plugin.target_jobs) == {'a', 'b'}
+        job_a, job_b = plugin.target_jobs['a'][-1], plugin.target_jobs['b'][-1]
+        assert job_a.get_interval() == 60 and job_b.get_interval() == 10
+        # 按标记固定偏移分散在周期内
+        assert 0 <= job_a.offset < 60 and 0 <= job_b.offset < 10 and job_a.offset != job_b.offset
+
+        # 配置不变时保留, 变化或删除时取消
+        await plugin.run_gather()
+        assert plugin.target_jobs['a'][-1] is job_a
+        conf.input['curl']['target'].pop('a')
+        conf.input['curl']['target']['b'] = {'url': 'http://127.0.0.1:1/', 'interval': 20}
+        await plugin.run_gather()
+        assert set(plugin.target_jobs) == {'b'} and job_a.cancelled and job_b.cancelled
+
+        # 插件并发请求数限制
+        assert plugin.get_inflight() is plugin.get_inflight()
+        assert plugin.get_inflight()._value == 2
+        plugin.target_jobs['b'][-1].cancel()
+
+    asyncio.run(run())
+
+
+def test_chk_timing():
+    metric = Metric('curl', {'time_dns': 10.5, 'time_ttfb': 1200.0})
+    assert AggsCurl.chk_timing(metric, {'dns': 20, 'connect': 1, 'ttfb': 2000}) == (True, '')
+    ok, info = AggsCurl.chk_timing(metric, {'dns': 20, 'ttfb': '1000'})
+    assert not ok and 'ttfb 1200.0>1000' in info
+
+
+def test_body_reader():
+    # 跨块匹配, 截断, 仅保留前缀
+    reader = BodyReader(10, 4, ['cde', 'zz', '中'])
+    assert reader.feed(b'abc') and reader.feed(b'de')
+    assert not reader.feed(b'fghijkl')
+    assert reader.size == 10 and reader.truncated and reader.text == 'abcd'
+    assert reader.found == ['cde'] and reader.hexdigest == hashlib.md5(b'abcdefghij').hexdigest()
+
+    # 恰好读完不算截断, 未知编码使用 utf-8
+    reader = BodyReader(3, 3, ['中'], 'unknown-charset')
+    assert reader.feed('中'.encode()) and not reader.truncated and reader.found == ['中']
+
+
+def test_body_limit():
+    async def run():
+        runner = await start_server(set())
+        port = runner.addresses[0][1]
+        conf = Config()
+        conf.input = {'curl': {'max_body_bytes': 300000, 'target': {
+            'big': {'url': f'http://127.0.0.1:{port}/big'},
+        }}}
+        conf.aggs = {'curl': {'alarm': {'target': {'big': {'contains': 'needle'}}}}}
+        queue = MetricQueue()
+        plugin = Curl(conf, None, queue)
+        target = conf.input['curl']['target']['big']
+
+        await plugin.gather_target('big', target)
+        metric = queue.get_nowait()
+        assert metric.get('status') == 200 and metric.get('response_truncated') is True
+        assert metric.get('response_size') == 300000 and metric.get('response') == 'x' * 4096
+        assert metric.get('response_contains') == ['needle']
+        assert AggsCurl.chk_contains(metric, 'needle') == (True, '')
+
+        # 单个目标的配置优先, 需要检查 JSON 时保留全部已读内容
+        target['max_body_bytes'] = 1000
+        conf.aggs['curl']['alarm']['target']['big']['json'] = None
+        await plugin.gather_target('big', target)
+        metric = queue.get_nowait()
+        assert metric.get('response') == 'x' * 1000 and metric.get('response_contains') == []
+        assert AggsCurl.chk_contains(metric, 'needle')[0] is False
+
+        await plugin.session[2].close()
+        await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,61 @@
+# -*- coding:utf-8 -*-
+"""
+    test_delta.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/26
+"""
+import asyncio
+
+from ..common.rate import Rate
+from ..conf.config import Config
+from ..libs.delta import DeltaStore
+from ..libs.metric import Metric
+
+
+def test_delta_store():
+    store = DeltaStore(max_age=100)
+    assert store.rate('eth0', 'bytes', 100, 0) is None
+    assert store.rate('eth0', 'bytes', 1100, 10) == 100
+    # 时间未前进
+    assert store.rate('eth0', 'bytes', 1200, 10) is None
+
+    # 32 位计数器回绕
+    assert store.delta('eth0', 'bytes', (1 << 32) - 100, 20, bits=32) == ((1 << 32) - 1300, 10)
+    assert store.delta('eth0', 'bytes', 50, 30, bits=32) == (150, 10)
+
+    # 计数器重置(重启, 设备重建), 之后重新计算
+    assert store.delta('eth0', 'bytes', 1 << 40, 40, bits=64) is not None
+    assert store.delta('eth0', 'bytes', 10, 50, bits=64) is None
+    assert store.delta('eth0', 'bytes', 30, 60) == (20, 10)
+
+    # 多字段, 任一字段首次出现时无结果
+    assert store.update('sda', {'r': 1, 'w': 2}, ['r', 'w'], 60) is None
+    assert store.update('sda', {'r': 11, 'w': 2, 'x': 'a'}, ['r', 'w', 'x'], 70) == ({'r': 1, 'w': 0}, 10)
+
+    # 回收长时间未更新的槽位并复用
+    assert len(store) == 3
+    assert store.expire(165) == 1
+    assert store.rate('eth1', 'bytes', 1, 165) is None
+    assert len(store) == 3 and len(store.values) == 3
+
+    # 未指定位数时, 计数器变小均视为重置(64 位计数器重置不按 32 位回绕处理)
+    store = DeltaStore()
+    assert store.delta('eth0', 'bytes', 3500000000, 0) is None
+    assert store.delta('eth0', 'bytes', 1000, 10) is None
+
+
+def test_common_rate():
+    conf = Config()
+    plugin_conf = {'fields': ['bytes_recv'], 'entity': 'nic', 'scale': 8}
+
+    async def run(metric: Metric) -> Metric:
+        return await Rate(conf, 'processor', 'network', metric, plugin_conf).run()
+
+    m1 = Metric('network', {'nic': 'eth0', 'bytes_recv': 1000})
+    m2 = Metric('network', {'nic': 'eth0', 'bytes_recv': 2000})
+    m3 = Metric('network', {'nic': 'eth1', 'bytes_recv': 2000})
+    m1.epoch, m2.epoch, m3.epoch = 100, 110, 110
+    assert asyncio.run(run(m1)).get('bytes_recv_rate') is None
+    assert asyncio.run(run(m2)).get('bytes_recv_rate') == 800
+    assert asyncio.run(run(m3)).get('bytes_recv_rate') is None
@@ -0,0 +1,89 @@
+# -*- coding:utf-8 -*-
+"""
+    test_diskusage.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/26
+"""
+import asyncio
+import threading
+from collections import namedtuple
+
+from ..conf.config import Config
+from ..input.disk import Disk
+from ..libs import diskusage
+from ..libs.diskusage import DiskUsageProbe
+
+Usage = namedtuple('Usage', 'total used free percent')
+
+
+def test_probe_hung_mount(monkeypatch):
+    release = threading.Event()
+
+    def disk_usage(mountpoint):
+        if mountpoint == '/nfs':
+            release.wait(5)
+        return Usage(100, 40, 60, 40.0)
+
+    monkeypatch.setattr(diskusage.psutil, 'disk_usage', disk_usage)
+
+    async def run():
+        probe = DiskUsageProbe()
+        for i in range(3):
+            res = await probe.probe(['/', '/nfs', '/data'], timeout=0.1, failures=2)
+            assert res.keys() == {'/', '/data'}
+            assert res['/']['percent'] == 40.0
+
+        # 第 1 次超时, 第 2 次仍未返回, 隔离
+        assert probe.get_quarantined() == ['/nfs']
+        assert probe.mounts['/nfs'].future is not None
+        release.set()
+
+    asyncio.run(run())
+
+
+def test_probe_more_hung_than_threads(monkeypatch):
+    release = threading.Event()
+    hung = [f'/nfs{i}' for i in range(20)]
+
+    def disk_usage(mountpoint):
+        if mountpoint in hung:
+            release.wait(5)
+        return Usage(100, 40, 60, 40.0)
+
+    monkeypatch.setattr(diskusage.psutil, 'disk_usage', disk_usage)
+
+    async def run():
+        probe = DiskUsageProbe()
+        # 挂起的挂载点多于常见线程池大小, 正常挂载点的探测不排队, 不超时
+        for i in range(3):
+            res = await probe.probe(hung + ['/', '/data'], timeout=0.1, failures=2)
+            assert res.keys() == {'/', '/data'}
+
+        assert sorted(probe.get_quarantined()) == sorted(hung)
+        assert all(probe.mounts[x].failures == 0 for x in ('/', '/data'))
+        release.set()
+
+    asyncio.run(run())
+
+
+def test_disk_io_info():
+    conf = Config()
+    conf.input = {'disk': {}}
+    plugin = Disk(conf, None, None)
+    io = {
+        'read_count': 100, 'write_count': 100, 'read_bytes': 1000, 'write_bytes': 1000,
+        'read_time': 100, 'write_time': 100, 'busy_time': 100,
+    }
+    assert plugin.get_disk_io_info({'sda': io, 'loop0': io}, 100) == []
+
+    io = dict(io, read_count=200, read_bytes=11000, read_time=300, busy_time=5100)
+    metrics = plugin.get_disk_io_info({'sda': io, 'loop0': io}, 110)
+    assert len(metrics) == 1
+    sda = metrics[0]
+    assert sda.get('device') == 'sda'
+    assert round(sda.get('read_iops')) == 10
+    assert round(sda.get('read_bps')) == 1000
+    assert sda.get('read_await') == 2.0
+    assert sda.get('write_await') == 0
+    assert round(sda.get('util')) == 50
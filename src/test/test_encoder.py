@@ -0,0 +1,55 @@
+# -*- coding:utf-8 -*-
+"""
+    test_encoder.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/19
+"""
+import json
+from types import MappingProxyType
+
+from ..libs.encoder import BACKENDS, Encoder
+from ..libs.metric import Metric
+
+
+def test_encode_bulk():
+    metrics = [Metric('test', {'x': i, 'msg': '中文', 'ts': (1, 2)}) for i in range(3)]
+    expect = [m.as_dict for m in metrics]
+    for x in expect:
+        x['ts'] = [1, 2]
+    for backend in BACKENDS:
+        encoder = Encoder(backend)
+        assert encoder.backend == backend
+        assert json.loads(encoder.encode_bulk(metrics)) == expect
+        assert encoder.encode_bulk([]) == b'[]'
+
+        lines = encoder.encode_bulk(metrics, ndjson=True, action={'index': {}}).splitlines()
+        assert len(lines) == 6
+        assert [json.loads(x) for x in lines[::2]] == [{'index': {}}] * 3
+        assert [json.loads(x) for x in lines[1::2]] == expect
+        assert encoder.loads(encoder.dumps(expect[0])) == expect[0]
+
+
+def test_encode_doc():
+    info = MappingProxyType({'node_ip': '127.0.0.1', 'host_name': '测试'})
+    metrics = [
+        Metric('test', {'x': 1, 'msg': '中文'}, info=info),
+        Metric('test', {}, info=info),
+        Metric('test', {'x': 1}),
+        Metric('test', {}),
+        # 指标数据覆盖服务器标识信息和基础数据项
+        Metric('test', {'node_ip': '10.0.0.1', 'x': 1}, info=info),
+        Metric('test', {'time': 'now'}, info=info),
+        Metric('test', {'x': 1}, info={'name': 'info'}),
+    ]
+    hidden = Metric('test', {'x': 1}, info=info)
+    hidden.delete(['host_name', 'time'])
+    metrics.append(hidden)
+
+    for backend in BACKENDS:
+        encoder = Encoder(backend)
+        for metric in metrics:
+            # 拼接的结果与 as_dict 编码一致(包括数据项顺序)
+            doc = encoder.encode_doc(metric)
+            assert doc == encoder.dumpb(metric.as_dict)
+            assert list(json.loads(doc)) == list(metric.as_dict)
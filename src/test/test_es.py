@@ -0,0 +1,90 @@
+# -*- coding:utf-8 -*-
+"""
+    test_es.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/20
+"""
+import asyncio
+import gzip
+import json
+
+from ..conf.config import Config
+from ..libs.metric import Metric
+from ..output import OUTPUT_STATS
+from ..output.es import COMPRESSORS, Es
+
+
+def get_es(**conf) -> Es:
+    config = Config()
+    config.output = {'es': {'url': 'http://127.0.0.1/{es_index}/bulk', 'index_alarm': 'alarm', **conf}}
+    return Es(config, None, None)
+
+
+def test_es_buffer():
+    es = get_es(max_batch_docs=3, max_batch_bytes=0)
+    es.add(Metric('cpu', {'x': 1}))
+    es.add(Metric('cpu', {'x': 2}, tag='alarm'))
+    assert not es.is_full()
+    es.add(Metric('cpu', {'x': 3}))
+    assert es.is_full() and es.buffer_docs == 3
+    assert sorted(es.buffer) == ['http://127.0.0.1/alarm/bulk', 'http://127.0.0.1/monitor_metric/bulk']
+
+    body, headers = es.encode(es.buffer['http://127.0.0.1/monitor_metric/bulk'])
+    assert headers == {'Content-Type': 'application/json'}
+    assert [x['x'] for x in json.loads(body)] == [1, 3]
+
+    es = get_es(max_batch_bytes=10)
+    es.add(Metric('cpu', {'x': 1}))
+    assert es.is_full()
+
+
+def test_es_compress():
+    data = b'[' + b','.join([b'{"name":"cpu","percent":1.5}'] * 100) + b']'
+    assert gzip.decompress(COMPRESSORS['gzip'](data, 6)) == data
+    assert len(COMPRESSORS['deflate'](data, 6)) < len(data) / 10
+
+
+def test_es_cancel_spool(tmp_path):
+    async def run():
+        es = get_es(max_batch_docs=2, max_batch_bytes=0, spool_dir=str(tmp_path))
+        es.in_queue = asyncio.Queue()
+        # 并发请求数已达上限, 提交等待中
+        es.writers = asyncio.Semaphore(0)
+        for i in range(3):
+            es.in_queue.put_nowait(Metric('cpu', {'x': i}))
+
+        task = asyncio.create_task(es.run())
+        await asyncio.sleep(0.1)
+        spooled = OUTPUT_STATS['es.spooled']
+        task.cancel()
+        await asyncio.wait([task])
+
+        # 退出超时被取消时, 缓冲区中的数据写入磁盘缓存
+        assert OUTPUT_STATS['es.spooled'] - spooled == 2 and es.spool.pending == 1
+        assert es.closed and not es.buffer
+        es.start_replay()
+        assert es.replay_task is None
+
+    asyncio.run(run())
+
+
+def test_es_breaker_probe_cancelled(tmp_path):
+    async def run():
+        es = get_es(breaker_failures=1, breaker_timeout=0, spool_dir=str(tmp_path))
+
+        async def send(*args, **kwargs):
+            await asyncio.sleep(10)
+
+        es.send = send
+        es.breaker.record(False)
+        task = asyncio.create_task(es.post('http://127.0.0.1/x/bulk', [b'{}']))
+        await asyncio.sleep(0.01)
+        assert es.breaker.state == 'half_open'
+        task.cancel()
+        await asyncio.wait([task])
+
+        # 探测请求被取消记为失败, 不会一直停留在半开状态
+        assert es.breaker.state == 'open' and es.spool.pending == 1
+
+    asyncio.run(run())
@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+"""
+    test_metric.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/18
+"""
+from types import MappingProxyType
+
+from ..libs.metric import Metric, get_metric_time
+
+
+def test_metric_fields():
+    info = MappingProxyType({'node_ip': '127.0.0.1', 'host_name': 'test'})
+    m = Metric('cpu', {'percent': 1.5, 'host_name': 'over'}, info=info)
+    assert m.info is info
+    assert m.get('percent', 0.0) == 1.5
+    assert m.get('host_name') == 'over'
+    assert m.get('node_ip') == '127.0.0.1'
+    assert m.get('timestamp') == int(m.epoch)
+    assert m.get('time') == get_metric_time(int(m.epoch))
+    assert list(m.as_dict.keys()) == ['name', 'time', 'timestamp', 'node_ip', 'host_name', 'percent']
+    assert 'node_ip' in m and 'x' not in m
+
+    m.delete(['node_ip', 'time', 'percent'])
+    assert 'node_ip' not in m and m.get('time') is None
+    assert list(m.as_dict.keys()) == ['name', 'timestamp', 'host_name']
+    assert info['node_ip'] == '127.0.0.1'
+
+    m.set(node_ip='0.0.0.0')
+    assert m.as_dict['node_ip'] == '0.0.0.0'
+
+    m.set_name('mem')
+    assert m.as_dict['name'] == 'mem'
+    assert m.keys(['name', 'x']) == ['name']
+
+
+def test_metric_clone():
+    m = Metric('demo', {'x': 1}, info={'node_ip': '127.0.0.1'}, tag='alarm')
+    c = m.clone()
+    c.set(x=2)
+    assert c.tag == 'alarm' and c.epoch == m.epoch
+    assert m.get('x') == 1 and c.get('x') == 2
+    assert c.as_dict['node_ip'] == '127.0.0.1'
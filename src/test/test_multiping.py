@@ -0,0 +1,77 @@
+# -*- coding:utf-8 -*-
+"""
+    test_multiping.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/27
+"""
+import asyncio
+import time
+from itertools import count
+from socket import AF_INET
+
+import pytest
+from icmplib import SocketPermissionError
+
+from ..libs.multiping import ERR_RTT, MultiPing, PingRound, PingStats
+
+
+def test_ping_stats():
+    stats = PingStats('127.0.0.1')
+    stats.rtts = [1.0, None, 3.0, 2.0]
+    assert stats.as_dict() == {'loss': 25.0, 'minimum': 1.0, 'maximum': 3.0, 'average': 2.0, 'jitter': 1.5}
+
+    stats.rtts = [None, None]
+    assert stats.as_dict()['loss'] == 100 and stats.as_dict()['average'] == ERR_RTT
+
+
+def test_multiping_pending():
+    class Socket:
+        def send(self, request):
+            pass
+
+    mp = MultiPing()
+    mp.sockets[AF_INET], mp.idents[AF_INET] = Socket(), 1
+    targets = [PingStats(f'10.0.0.{i}') for i in range(2)]
+    for x in targets:
+        x.ip, x.family = x.address, AF_INET
+
+    # 按 (目标, 标识符, 序号) 匹配, 序号回绕时不同目标互不影响
+    mp.seq = count(0xffff)
+    ping_round = PingRound(0.05)
+    for x in targets + targets[:1]:
+        mp.send(ping_round, x)
+    assert set(mp.pending) == {('10.0.0.0', 1, 0xffff), ('10.0.0.1', 1, 0), ('10.0.0.0', 1, 1)}
+    assert ping_round.outstanding == 3
+
+    # 同一目标的序号回绕, 旧探测计为丢包
+    mp.seq = count(0x1ffff)
+    mp.send(ping_round, targets[0])
+    assert ('10.0.0.0', 1, 0xffff) in mp.pending and ping_round.outstanding == 3
+
+    # 超时的探测移除
+    mp.expire(time.perf_counter() + 0.1)
+    assert not mp.pending and ping_round.outstanding == 0
+    assert [x.rtts for x in targets] == [[None, None, None], [None]]
+
+
+def test_multiping():
+    async def run():
+        mp = MultiPing()
+        addresses = ['127.0.0.1', '127.0.0.2', 'nonexist.invalid']
+        try:
+            res = await mp.ping(addresses, count=3, timeout=0.5, interval=0.05)
+        except SocketPermissionError:
+            pytest.skip('ICMP socket is not permitted')
+
+        # 同一协议族共用一个套接字
+        assert list(mp.sockets) == [AF_INET] and not mp.pending and mp.runs == 0
+        assert res[0]['loss'] == res[1]['loss'] == 0.0 and res[0]['maximum'] < ERR_RTT
+        assert res[2]['loss'] == 100
+
+        # 并发 PING 共用套接字, 按序号匹配应答
+        res = await asyncio.gather(*[mp.ping(addresses[:2], 2, 0.5, 0.01) for _ in range(3)])
+        assert all(x['loss'] == 0.0 for y in res for x in y)
+        mp.close()
+
+    asyncio.run(run())
@@ -0,0 +1,72 @@
+# -*- coding:utf-8 -*-
+"""
+    test_net.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/20
+"""
+import asyncio
+import errno
+import socket
+
+from ..libs.net import PortProber, SessionPool, get_base_url, get_host_port, interleave_addrs
+
+
+def test_get_base_url():
+    assert get_base_url('http://demo.com:6600/v1/bulk?x=1') == 'http://demo.com:6600'
+    assert get_base_url('https://Demo.com/api') == 'https://demo.com'
+
+
+def test_session_pool():
+    async def run():
+        pool = SessionPool(limit_per_host=5)
+        a = pool.get('http://demo.com/a')
+        assert pool.get('http://demo.com/b?x=1') is a
+        assert pool.get('https://demo.com/a') is not a
+        assert a.connector.limit_per_host == 5
+
+        # 配置变化时重建会话
+        pool.set_options(limit_per_host=8)
+        assert pool.get('http://demo.com/a') is not a
+        await asyncio.sleep(0)
+        assert a.closed
+
+        await pool.close()
+        assert not pool.sessions
+
+    asyncio.run(run())
+
+
+def test_get_host_port():
+    assert get_host_port('baidu.com:443') == ('baidu.com', 443)
+    assert get_host_port(('baidu.com', '443')) == ('baidu.com', 443)
+    assert get_host_port('[::1]:8080') == ('::1', 8080)
+    assert get_host_port('::1') == ('::1', 80)
+    assert get_host_port('baidu.com') == ('baidu.com', 80)
+
+
+def test_interleave_addrs():
+    addrs = [(10, 'a'), (10, 'b'), (2, 'c'), (10, 'd')]
+    assert interleave_addrs(addrs) == [(10, 'a'), (2, 'c'), (10, 'b'), (10, 'd')]
+
+
+def test_port_prober():
+    async def run():
+        server = await asyncio.start_server(lambda r, w: w.close(), '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        prober = PortProber(2, ttl_dns_cache=60, happy_eyeballs_delay=0.05)
+
+        yes, code, ms = await prober.probe('127.0.0.1', port)
+        assert yes and code == 0 and ms >= 0
+
+        # 并发检测共用一次域名解析, 双栈时任一地址连通即可
+        results = await asyncio.gather(*[prober.probe('localhost', port, family=socket.AF_UNSPEC) for _ in range(5)])
+        assert all(x[0] for x in results)
+        assert list(prober.dns_cache) == [('localhost', port, socket.AF_UNSPEC)]
+
+        server.close()
+        await server.wait_closed()
+        yes, code, _ = await prober.probe('127.0.0.1', port)
+        assert not yes and code == errno.ECONNREFUSED
+
+    asyncio.run(run())
@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+"""
+    test_network.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/25
+"""
+from ..conf.config import Config
+from ..input import network
+from ..input.network import Network
+
+
+def get_plugin(plugin_conf: dict) -> Network:
+    conf = Config()
+    conf.input = {'network': plugin_conf}
+    return Network(conf, None, None)
+
+
+def test_get_nic_list():
+    plugin = get_plugin({'network_card': ['lo'], 'network_card_prefix': ['eth', 'veth']})
+    all_nic = ['lo', 'eth0', 'eth1', 'veth12ab', 'docker0']
+    nic_list = plugin.get_nic_list(all_nic)
+    assert nic_list == ['eth0', 'eth1', 'lo', 'veth12ab']
+    # 网卡集合和配置不变时复用
+    assert plugin.get_nic_list(reversed(all_nic)) is nic_list
+
+    # 配置变化时重建
+    plugin.conf.input['network']['network_card_prefix'] = ['docker']
+    assert plugin.get_nic_list(all_nic) == ['docker0', 'lo']
+
+
+def test_nic_meta_cache(monkeypatch):
+    calls = []
+    addrs = {'eth0': {'mac': '52:54:00:12:34:56', 'ipv4': '10.0.0.1'}}
+    isup = {'eth0': True}
+
+    def get_nic_stats():
+        calls.append('stats')
+        return {'eth0': {'isup': True, 'speed': 1000}, 'eth1': {'isup': True, 'speed': 1000}}
+
+    def get_nic_addrs():
+        calls.append('addrs')
+        return addrs
+
+    monkeypatch.setattr(network, 'get_nic_stats', get_nic_stats)
+    monkeypatch.setattr(network, 'get_nic_addrs', get_nic_addrs)
+    monkeypatch.setattr(network, 'get_nic_isup', lambda nic_list: isup)
+    plugin = get_plugin({})
+    meta = plugin.get_nic_meta(['eth0'], ['eth0'])
+    assert meta == {'eth0': {'isup': True, 'speed': 1000, 'mac': '52:54:00:12:34:56', 'ipv4': '10.0.0.1'}}
+    assert plugin.get_nic_meta(['eth0'], ['eth0']) and calls == ['stats', 'addrs']
+
+    # 运行状态每次获取, 地址缓存
+    addrs = {'eth0': {'mac': '52:54:00:12:34:56'}}
+    isup = {'eth0': False}
+    meta = plugin.get_nic_meta(['eth0'], ['eth0'])
+    assert meta['eth0'] == {'isup': False, 'speed': 1000, 'mac': '52:54:00:12:34:56', 'ipv4': '10.0.0.1'}
+    assert len(calls) == 2
+
+    # 网卡增减, 待采集网卡无元数据, 超过刷新周期时重新获取
+    plugin.get_nic_meta(['eth0', 'eth1'], ['eth0'])
+    assert len(calls) == 4 and 'ipv4' not in plugin.get_nic_meta(['eth0', 'eth1'], ['eth0'])['eth0']
+    plugin.nic_meta.pop('eth1')
+    plugin.get_nic_meta(['eth0', 'eth1'], ['eth1'])
+    assert len(calls) == 6
+    plugin.conf.input['network']['meta_refresh'] = 0
+    plugin.get_nic_meta(['eth0', 'eth1'], ['eth0'])
+    assert len(calls) == 8
+
+    # 地址单独的刷新周期
+    plugin.conf.input['network'].update(meta_refresh=300, addr_refresh=0)
+    plugin.get_nic_meta(['eth0', 'eth1'], ['eth0'])
+    assert calls[8:] == ['addrs']
+
+
+def test_get_nic_meta():
+    stats = network.get_nic_stats()
+    addrs = network.get_nic_addrs()
+    assert any('mac' in x or 'ipv4' in x or 'ipv6' in x for x in addrs.values())
+    # 逐个读取的运行状态与 psutil 一致
+    isup = network.get_nic_isup(list(stats) + ['no-such-nic'])
+    assert 'no-such-nic' not in isup
+    assert all(isup[nic] == x['isup'] for nic, x in stats.items() if nic in isup)
@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+"""
+    test_pipeline.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/16
+"""
+import asyncio
+
+from ..aggs.cpu import Cpu as AggsCpu
+from ..aggs.default import Default as AggsDefault
+from ..conf.config import Config
+from ..input import InputPlugin
+from ..libs.metric import Metric, MetricBatch
+from ..libs.queue import MetricQueue
+from ..output import OUTPUT_STATS, get_output_stats
+from ..output.console import Console
+from ..processor.default import Default as ProcessorDefault
+
+
+def get_conf() -> Config:
+    conf = Config()
+    conf.processor = {'default': {}}
+    conf.aggs = {'default': {}, 'cpu': {}}
+    return conf
+
+
+def test_is_passthrough():
+    conf = get_conf()
+    assert ProcessorDefault(conf, None, None).is_passthrough()
+    assert AggsDefault(conf, None, None).is_passthrough()
+    assert AggsCpu(conf, None, None).is_passthrough()
+
+    conf.processor['default'] = {'use_plugin_discard': {'all': ['x']}}
+    conf.aggs['cpu'] = {'alarm': {'percent': 90}}
+    assert not ProcessorDefault(conf, None, None).is_passthrough()
+    assert not AggsCpu(conf, None, None).is_passthrough()
+
+    conf.aggs['default'] = {'after': {'use_plugin_discard': {'all': ['x']}}}
+    assert not AggsDefault(conf, None, None).is_passthrough()
+
+
+def test_stop_signal():
+    async def run():
+        conf = get_conf()
+        q_in, q_mid, q_out = MetricQueue(), MetricQueue(), MetricQueue()
+        processor = ProcessorDefault(conf, q_in, q_mid)
+        aggs = AggsDefault(conf, q_mid, q_out)
+        aggs.last_stage = True
+        tasks = [asyncio.create_task(processor.run()), asyncio.create_task(aggs.run())]
+
+        q_in.put_nowait(MetricBatch([Metric('test', {'x': 1}), Metric('test', {'x': 2})]))
+        q_in.put_nowait(Metric('test', tag='__STOP_SIGNAL__'))
+        await asyncio.wait_for(asyncio.gather(*tasks), 1)
+
+        # 已有数据处理完毕, 停止信号不传递到最后一个插件之后
+        assert q_out.qsize() == 1
+        assert [m.get('x') for m in q_out.get_nowait()] == [1, 2]
+
+    asyncio.run(run())
+
+
+def test_shutdown_signal():
+    async def run():
+        conf = get_conf()
+        conf.aggs['cpu'] = {'alarm': {'percent': 90}}
+        conf.output = {'console': {}}
+        q_in, q_mid, q_out = MetricQueue(), MetricQueue(), MetricQueue()
+        aggs = AggsCpu(conf, q_in, q_mid)
+        output = Console(conf, q_mid, None)
+        output.shared = True
+        tasks = [asyncio.create_task(aggs.run()), asyncio.create_task(output.run())]
+        delivered = OUTPUT_STATS['console.delivered']
+
+        # 关闭信号不经过报警处理, 共享输出插件忽略关闭信号, 收到停止信号后退出
+        q_in.put_nowait(Metric('cpu', {'percent': 1.0, 'process_top': []}))
+        q_in.put_nowait(Metric('cpu', tag='__CLOSE_SIGNAL__'))
+        await asyncio.wait_for(tasks[0], 1)
+        assert not tasks[1].done()
+        q_mid.put_nowait(Metric('cpu', tag='__STOP_SIGNAL__'))
+        await asyncio.wait_for(tasks[1], 1)
+        assert OUTPUT_STATS['console.delivered'] - delivered == 1
+        # 按输出插件分别统计
+        assert get_output_stats()['console']['delivered'] == OUTPUT_STATS['console.delivered']
+        assert 'delivered' not in OUTPUT_STATS
+
+    asyncio.run(run())
+
+
+def test_pending_gather_tasks():
+    class SlowInput(InputPlugin):
+        name = 'slow'
+
+        async def run_gather(self) -> None:
+            await asyncio.sleep(0.1)
+
+    async def run():
+        conf = get_conf()
+        conf.plugins_open = {'slow'}
+        plugin = SlowInput(conf, None, MetricQueue())
+        closed = asyncio.Event()
+        plugin.tick(closed)
+        await asyncio.sleep(0)
+        first = plugin.get_pending_tasks()
+
+        # 上一次采集仍持有锁, 新的采集直接结束, 关闭时仍等待上一次采集
+        plugin.tick(closed)
+        await asyncio.sleep(0.01)
+        assert plugin.get_pending_tasks() == first and not first[0].done()
+        await asyncio.wait(first)
+        assert not plugin.get_pending_tasks()
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+"""
+    test_procfs.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/25
+"""
+import os
+
+import psutil
+import pytest
+
+from ..libs import procfs
+from ..libs.procfs import ProcFS
+from ..libs.psutil import to_dict
+
+MEMINFO = b'''MemTotal:        8000000 kB
+MemFree:         1000000 kB
+MemAvailable:    6000000 kB
+Buffers:          200000 kB
+Cached:          3000000 kB
+Shmem:             10000 kB
+Active:          2000000 kB
+Inactive:        1500000 kB
+SReclaimable:     100000 kB
+Slab:             150000 kB
+'''
+
+STAT = b'''cpu  100 0 100 700 100 0 0 0 0 0
+cpu0 50 0 50 350 50 0 0 0 0 0
+cpu1 50 0 50 350 50 0 0 0 0 0
+intr 1000 1 2 3
+ctxt 2000
+softirq 3000 1 2
+'''
+
+NET_DEV = b'''Inter-|   Receive                                                |  Transmit
+ face |bytes    packets errs drop fifo frame compressed multicast|bytes    packets errs drop fifo colls carrier compressed
+  eth0: 1000 10 1 2 0 0 0 0 2000 20 3 4 0 0 0 0
+'''
+
+
+@pytest.fixture
+def fake_proc(tmp_path):
+    (tmp_path / 'net').mkdir()
+    (tmp_path / 'meminfo').write_bytes(MEMINFO)
+    (tmp_path / 'stat').write_bytes(STAT)
+    (tmp_path / 'net' / 'dev').write_bytes(NET_DEV)
+    proc = ProcFS(str(tmp_path))
+    proc.enabled = True
+    yield proc
+    proc.close()
+
+
+def test_parse(fake_proc, tmp_path):
+    mem = fake_proc.read_meminfo()
+    assert mem['total'] == 8000000 * 1024
+    assert mem['cached'] == 3100000 * 1024
+    assert mem['percent'] == 25.0
+
+    cpu = fake_proc.read_cpu()
+    assert cpu['logical_count'] == 2
+    assert cpu['percent'] == 20.0
+    assert cpu['times']['idle'] == round(700 / procfs.CLOCK_TICKS, 2)
+    assert cpu['stats'] == {'ctx_switches': 2000, 'interrupts': 1000, 'soft_interrupts': 3000, 'syscalls': 0}
+
+    # 距上次读取的使用率(复用文件描述符)
+    (tmp_path / 'stat').write_bytes(STAT.replace(b'cpu  100 0 100 700', b'cpu  200 0 100 800'))
+    cpu = fake_proc.read_cpu()
+    assert cpu['percent'] == 50.0
+    assert cpu['times_percent']['user'] == 50.0
+
+    assert fake_proc.read_net_dev() == {'eth0': {
+        'bytes_sent': 2000, 'bytes_recv': 1000, 'packets_sent': 20, 'packets_recv': 10,
+        'errin': 1, 'errout': 3, 'dropin': 2, 'dropout': 4,
+    }}
+
+
+def test_fallback(fake_proc, tmp_path):
+    (tmp_path / 'meminfo').write_bytes(b'MemTotal: 1 kB\n')
+    assert fake_proc.read_meminfo() is None
+    assert 'meminfo' in fake_proc.disabled
+    assert fake_proc.read_net_dev() is not None
+
+    fake_proc.set_enabled(False)
+    assert fake_proc.read_net_dev() is None
+
+
+@pytest.mark.skipif(not procfs.LINUX or not os.path.isdir('/proc'), reason='Linux only')
+def test_same_fields_as_psutil():
+    proc = ProcFS()
+    assert proc.read_meminfo().keys() == to_dict(psutil.virtual_memory()).keys()
+    assert proc.read_net_dev().keys() == psutil.net_io_counters(pernic=True).keys()
+    cpu = proc.read_cpu()
+    assert cpu['times'].keys() == to_dict(psutil.cpu_times()).keys()
+    assert cpu['logical_count'] == psutil.cpu_count()
+    proc.close()
@@ -0,0 +1,50 @@
+# -*- coding:utf-8 -*-
+"""
+    test_psutil.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/25
+"""
+import os
+
+import psutil
+
+from ..libs.psutil import PROCESS_FIELDS, ProcessTable
+
+
+def test_process_table():
+    table = ProcessTable(PROCESS_FIELDS)
+    pinfo_list = table.scan()
+    me = [x for x in pinfo_list if x['pid'] == os.getpid()]
+    assert len(me) == 1
+    assert list(me[0].keys()) == PROCESS_FIELDS + ['create_at']
+
+    # 进程对象在多次采集间复用
+    proc = table.procs[os.getpid()][0]
+    sum(range(10 ** 6))
+    pinfo_list = table.scan()
+    assert table.procs[os.getpid()][0] is proc
+    assert pinfo_list[0] is not me[0]
+
+
+def test_process_table_pid_reuse(monkeypatch):
+    table = ProcessTable(PROCESS_FIELDS)
+    table.scan()
+    proc, static = table.procs[os.getpid()]
+    assert static['_start'] is not None or not psutil.LINUX
+
+    # 启动时间未变时复用进程对象, Linux 不再由 is_running() 创建新的对象比较
+    if psutil.LINUX:
+        monkeypatch.setattr(proc, 'is_running', None)
+    table.scan()
+    assert table.procs[os.getpid()][0] is proc
+    monkeypatch.undo()
+
+    # 进程号已被复用: 启动时间与缓存的不同, 重新创建进程对象, 不再使用旧进程的不变字段
+    name = static['name']
+    table.procs[os.getpid()] = (proc, {'_name': 'old', 'name': 'old', 'exe': '', 'create_time': 0, '_start': -1})
+    if not psutil.LINUX:
+        monkeypatch.setattr(proc, 'is_running', lambda: False)
+    me = [x for x in table.scan() if x['pid'] == os.getpid()]
+    assert len(me) == 1 and me[0]['name'] == name and me[0]['create_time'] > 0
+    assert table.procs[os.getpid()][0] is not proc
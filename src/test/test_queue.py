@@ -0,0 +1,93 @@
+# -*- coding:utf-8 -*-
+"""
+    test_queue.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/15
+"""
+import asyncio
+
+from ..libs.metric import Metric, MetricBatch
+from ..libs.queue import MetricQueue, get_queue_stats
+
+
+def metric(x: int, tag: str = 'metric') -> Metric:
+    return Metric('test', {'x': x}, tag=tag)
+
+
+def drain(q: MetricQueue) -> list:
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+        q.task_done()
+    return items
+
+
+def test_drop_oldest():
+    async def run():
+        q = MetricQueue(2, 'drop_oldest', name='test.drop_oldest')
+        for i in range(4):
+            q.put_nowait(metric(i))
+        assert q.dropped == 2
+        assert [m.get('x') for m in drain(q)] == [2, 3]
+
+    asyncio.run(run())
+
+
+def test_drop_newest():
+    async def run():
+        q = MetricQueue(2, 'drop_newest', name='test.drop_newest')
+        for i in range(4):
+            await q.put(metric(i))
+        assert q.dropped == 2
+        assert [m.get('x') for m in drain(q)] == [0, 1]
+
+    asyncio.run(run())
+
+
+def test_keep_alarm():
+    async def run():
+        q = MetricQueue(2, 'keep_alarm', name='test.keep_alarm')
+        q.put_nowait(metric(0))
+        q.put_nowait(metric(1, 'alarm'))
+        q.put_nowait(metric(2))
+        q.put_nowait(metric(3, 'alarm'))
+        q.put_nowait(metric(4, 'alarm'))
+        assert q.dropped == 3
+        assert [m.get('x') for m in drain(q)] == [3, 4]
+        assert q._unfinished_tasks == 0
+
+    asyncio.run(run())
+
+
+def test_keep_alarm_batch():
+    async def run():
+        q = MetricQueue(1, 'keep_alarm', name='test.keep_alarm_batch')
+        q.put_nowait(MetricBatch([metric(0), metric(1)]))
+        q.put_nowait(MetricBatch([metric(2), metric(3, 'alarm'), metric(4)]))
+        assert q.dropped == 4
+        items = drain(q)
+        assert len(items) == 1 and isinstance(items[0], MetricBatch)
+        assert [m.get('x') for m in items[0]] == [3]
+
+    asyncio.run(run())
+
+
+def test_block_and_close_signal():
+    async def run():
+        q = MetricQueue(1, 'block', name='test.block')
+        await q.put(metric(0))
+        putter = asyncio.create_task(q.put(metric(1)))
+        await asyncio.sleep(0)
+        assert not putter.done()
+        q.get_nowait()
+        q.task_done()
+        await asyncio.wait_for(putter, 1)
+
+        # 关闭信号总是入队
+        q.put_nowait(metric(2, '__CLOSE_SIGNAL__'))
+        items = drain(q)
+        assert items[-1].is_closed
+        assert get_queue_stats()['test.block'] == 1
+
+    asyncio.run(run())
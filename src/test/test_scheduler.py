@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+"""
+    test_scheduler.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/23
+"""
+import asyncio
+import time
+
+from ..libs.scheduler import Job, Scheduler, get_offset
+
+
+def test_job_next_due():
+    job = Job('test', lambda: None, 60, True, 5.0)
+    job.due = 1000.0
+    assert job.next_due(1000.5, 1000.5) == 1025.0
+    # 错过 2 个周期
+    assert job.next_due(1150.0, 1150.0) == 1205.0 and job.missed == 2
+    # 单调时间与系统时间不同, 按系统时间对齐
+    job.due = 10.0
+    assert job.next_due(10.0, 1000.5) == 34.5
+
+    job = Job('test', lambda: None, lambda: 10, False, 0.0)
+    job.due = 1000.0
+    assert job.next_due(1001.0) == 1010.0
+    assert job.next_due(1035.0) == 1040.0 and job.missed == 3
+
+
+def test_get_offset():
+    assert get_offset('input.cpu', 0) == 0.0
+    assert 0 <= get_offset('input.cpu', 10) < 10
+    assert get_offset('input.cpu', 10) == get_offset('input.cpu', 10)
+
+
+def test_scheduler():
+    async def run():
+        scheduler = Scheduler()
+        ticks = []
+        a = scheduler.add('a', lambda: ticks.append('a'), 0.05, align=False)
+        scheduler.add('b', lambda: ticks.append('b') or len(ticks) < 4, 0.02, align=False, immediate=False)
+        await asyncio.sleep(0.13)
+        a.cancel()
+        n = len(ticks)
+        await asyncio.sleep(0.06)
+        assert ticks[0] == 'a' and 'b' in ticks
+        assert len(ticks) == n
+        assert scheduler.timer is None and not scheduler.get_stats()
+
+    start = time.time()
+    asyncio.run(run())
+    assert time.time() - start < 1
+
+
+def test_scheduler_clock_step(monkeypatch):
+    async def run():
+        scheduler = Scheduler()
+        ticks = []
+        scheduler.add('a', lambda: ticks.append(1), 0.02)
+        # 系统时间回拨 1 小时, 不影响任务执行
+        now = time.time()
+        monkeypatch.setattr(time, 'time', lambda: now - 3600)
+        await asyncio.sleep(0.1)
+        assert len(ticks) >= 3
+
+    asyncio.run(run())
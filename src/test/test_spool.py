@@ -0,0 +1,52 @@
+# -*- coding:utf-8 -*-
+"""
+    test_spool.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/21
+"""
+import os
+
+from ..libs.spool import Spool
+
+
+def test_spool_replay(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 16)
+    for i in range(5):
+        assert spool.append(f'data{i}'.encode()) == i + 1
+    assert spool.pending == 5
+
+    seq, data = spool.peek()
+    assert (seq, data) == (1, b'data0')
+    assert spool.peek() == (1, b'data0')
+    spool.ack(seq)
+    spool.ack(spool.peek()[0])
+    spool.close()
+
+    # 重启后从游标继续, 截断不完整的记录
+    with open(spool.segments[-1][1], 'ab') as f:
+        f.write(b'PAS1\x00')
+    spool = Spool(str(tmp_path))
+    assert spool.pending == 3
+    assert spool.append(b'data5') == 6
+    items = []
+    while True:
+        record = spool.peek()
+        if record is None:
+            break
+        items.append(record[1])
+        spool.ack(record[0])
+    assert items == [b'data2', b'data3', b'data4', b'data5']
+    assert spool.pending == 0
+    assert len(spool.segments) == 1
+
+
+def test_spool_trim(tmp_path):
+    spool = Spool(str(tmp_path), max_bytes=1 << 20, segment_bytes=1 << 16)
+    data = os.urandom(1 << 15)
+    for _ in range(64):
+        spool.append(data)
+    assert spool.size <= 1 << 20
+    assert spool.pending < 64
+    seq, _ = spool.peek()
+    assert seq == spool.acked + 1 == spool.segments[0][0]
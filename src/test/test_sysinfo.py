@@ -0,0 +1,44 @@
+# -*- coding:utf-8 -*-
+"""
+    test_sysinfo.py
+    ~~~~~~~~
+
+    :author: Fufu, 2022/8/24
+"""
+import asyncio
+
+from ..libs import sysinfo
+from ..libs.psutil import select_process_info
+from ..libs.sysinfo import SystemSnapshot
+
+
+def test_snapshot_shared(monkeypatch):
+    calls = []
+
+    def collect_demo():
+        calls.append(1)
+        return {'x': len(calls)}
+
+    monkeypatch.setitem(sysinfo.COLLECTORS, 'demo', collect_demo)
+
+    async def run():
+        snapshot = SystemSnapshot()
+        res = await asyncio.gather(*(snapshot.get('demo', 'mem') for _ in range(3)))
+        assert len(calls) == 1
+        assert all(x['demo'] == {'x': 1} and x['mem']['total'] > 0 for x in res)
+        assert (await snapshot.get('demo'))['demo'] == {'x': 1}
+        assert (await snapshot.get('demo', max_age=0))['demo'] == {'x': 2}
+
+    asyncio.run(run())
+
+
+def test_select_process_info():
+    pinfo_list = [
+        {'pid': 1, 'name': 'a', 'cpu_percent': 1.0, 'memory_percent': 3.0},
+        {'pid': 2, 'name': 'b', 'cpu_percent': 5.0, 'memory_percent': 1.0},
+        {'pid': 3, 'name': 'a', 'cpu_percent': 5.0, 'memory_percent': 2.0},
+    ]
+    res = select_process_info(pinfo_list, orderby=['cpu_percent', 'memory_percent'], limit=2, fields=['pid'])
+    assert res == [{'pid': 3}, {'pid': 2}]
+    res = select_process_info(pinfo_list, ['a'], orderby='memory_percent', reverse=False)
+    assert [x['pid'] for x in res] == [3, 1]